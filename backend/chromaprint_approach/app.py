@@ -1,11 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File
 from pathlib import Path
 import shutil
 from fingerprint import extract_fingerprint
 from recognize import recognize
+from catalog import get_catalog
 from db import songs_collection
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # load the catalog before the first request instead of during it
+    get_catalog()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 UPLOAD_QUERY_DIR = Path("queries")
 UPLOAD_QUERY_DIR.mkdir(exist_ok=True)
@@ -21,7 +30,10 @@ def recognize_audio(file: UploadFile = File(...)):
 
         shutil.copyfileobj(file.file, buffer)
 
-    song, score, status = recognize(str(file_path))
+    # pick up songs stored by store_fingerprints.py since the last check
+    get_catalog().refresh_if_stale()
+    song, score = recognize(str(file_path))
+    status = "matched" if song is not None else "no_match"
 
     return {
         "match": song,
@@ -64,6 +76,8 @@ def upload_new_song(file: UploadFile = File(...)):
             "fingerprint": fingerprint
         }
         songs_col.insert_one(doc)
+        # the new song is matchable right away, without reloading the catalog
+        get_catalog().add(song_name, fingerprint)
         return {"song": song_name, "status": "uploaded!"}
     else:
         return {"status": "invalid file type!"}
@@ -0,0 +1,88 @@
+import time
+import numpy as np
+from similarity import cosine_similarity
+from matcher import pack_catalog, match_catalog
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# fpcalc gives ~8 sub-fingerprints per second
+N_SONGS = 20
+SONG_FRAMES = 8 * 240
+QUERY_FRAMES = 8 * 10
+TRUE_SONG = 7
+TRUE_OFFSET = 900
+BIT_FLIP_RATE = 0.15        # a noisy recording of the true song
+N_SONGS_LARGE = 2000        # batched matcher only, the reference would take hours
+REPEATS = 3
+
+
+def reference_sliding_window_match(song_fp, query_fp, step=1):
+    # the original per-offset cosine loop from matcher.py
+    q_len = len(query_fp)
+    s_len = len(song_fp)
+
+    if q_len > s_len:
+        return 0.0
+
+    best_score = 0.0
+    for i in range(0, s_len - q_len + 1, step):
+        score = cosine_similarity(song_fp[i:i + q_len], query_fp)
+        if score > best_score:
+            best_score = score
+    return best_score
+
+
+def synthetic_catalog(rng, n_songs):
+    songs = [rng.integers(0, 2**32, SONG_FRAMES, dtype=np.uint64).astype(np.uint32)
+             for _ in range(n_songs)]
+
+    query = songs[TRUE_SONG][TRUE_OFFSET:TRUE_OFFSET + QUERY_FRAMES].copy()
+    flips = rng.random((QUERY_FRAMES, 32)) < BIT_FLIP_RATE
+    query ^= (flips * (1 << np.arange(32, dtype=np.uint64))).sum(axis=1).astype(np.uint32)
+
+    # Mongo holds them as (signed) python ints
+    return [s.astype(np.int32).tolist() for s in songs], query.astype(np.int32).tolist()
+
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    songs, query = synthetic_catalog(rng, N_SONGS)
+    print(f"{N_SONGS} songs x {SONG_FRAMES} frames, query {QUERY_FRAMES} frames\n")
+
+    ref_time, ref_scores = best_of(
+        lambda: [reference_sliding_window_match(s, query) for s in songs], repeats=1
+    )
+    ref_best = int(np.argmax(ref_scores))
+    print(f"reference (cosine loop) : {ref_time * 1000:10.1f} ms  best song {ref_best}")
+
+    pack_time, (frames, starts) = best_of(lambda: pack_catalog(songs))
+    new_time, (scores, offsets) = best_of(lambda: match_catalog(frames, starts, query))
+    new_best = int(np.argmax(scores))
+    print(
+        f"batched (bit hamming)   : {new_time * 1000:10.1f} ms  best song {new_best} "
+        f"at frame {offsets[new_best]}, score {scores[new_best]:.3f} "
+        f"(pack {pack_time * 1000:.1f} ms)"
+    )
+    print(f"speedup                 : {ref_time / new_time:10.1f}x")
+
+    ranked = np.sort(scores)[::-1]
+    print(f"runner-up score         : {ranked[1]:.3f}  (chance is ~0.5)")
+
+    songs, query = synthetic_catalog(rng, N_SONGS_LARGE)
+    frames, starts = pack_catalog(songs)
+    large_time, (scores, offsets) = best_of(lambda: match_catalog(frames, starts, query))
+    print(
+        f"\n{N_SONGS_LARGE} songs batched     : {large_time * 1000:10.1f} ms  "
+        f"best song {int(np.argmax(scores))} at frame {offsets[np.argmax(scores)]}"
+    )
@@ -0,0 +1,142 @@
+"""
+The song catalog kept in memory for recognize():
+
+- frames: every song's sub-fingerprints back to back, one contiguous
+  uint32 array (the layout matcher.match_catalog works on)
+- starts: song i is frames[starts[i]:starts[i + 1]]
+- names: song_name per song
+
+It is loaded from Mongo once, then only grows: /upload_song calls add()
+for the song it just stored, and /recognize calls refresh_if_stale(),
+which picks up songs inserted by other processes (store_fingerprints.py)
+at most every REFRESH_SEC seconds.
+
+Only refresh() moves the high-water mark: the creation time of the newest
+_id it has seen. ObjectIds from different writers (and clocks) are not
+strictly in insert order, so each refresh re-reads the last
+REFRESH_OVERLAP_SEC before the mark and skips names already loaded.
+"""
+
+import datetime
+import threading
+import time
+import numpy as np
+from bson import ObjectId
+from matcher import to_uint32
+from db import songs_collection
+
+REFRESH_SEC = 10   # how stale the catalog may get w.r.t. other writers
+REFRESH_OVERLAP_SEC = 300   # _id reordering / clock skew tolerated between writers
+
+
+class Catalog:
+
+    def __init__(self):
+        self.names = []
+        self._known = set()
+        self._frames = np.empty(0, dtype=np.uint32)   # capacity, grows x2
+        self._n_frames = 0
+        self._starts = [0]
+        self._high_water = None   # generation time of the newest _id refresh() saw
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()   # one refresh at a time
+
+    @classmethod
+    def from_collection(cls, collection=None):
+        catalog = cls()
+        catalog.refresh(collection)
+        return catalog
+
+    def __len__(self):
+        return len(self.names)
+
+    def snapshot(self):
+        """
+        Returns (frames, starts, names) for matching. Later add() calls
+        only write past the returned frames, so the snapshot stays valid.
+        """
+        with self._lock:
+            return (
+                self._frames[:self._n_frames],
+                np.array(self._starts, dtype=np.int64),
+                list(self.names),
+            )
+
+    def add(self, song_name, fingerprint):
+        """
+        Append a song. Returns False if a song of that name is already in.
+        """
+        fp = to_uint32(fingerprint)
+        with self._lock:
+            if song_name in self._known:
+                # a refresh and /upload_song can both see a new song
+                return False
+            end = self._n_frames + len(fp)
+            if end > len(self._frames):
+                grown = np.empty(max(end, 2 * len(self._frames)), dtype=np.uint32)
+                grown[:self._n_frames] = self._frames[:self._n_frames]
+                self._frames = grown
+            self._frames[self._n_frames:end] = fp
+            self._n_frames = end
+            self._starts.append(end)
+            self.names.append(song_name)
+            self._known.add(song_name)
+        return True
+
+    def refresh(self, collection=None):
+        """
+        Load songs stored since the last refresh (with REFRESH_OVERLAP_SEC
+        of overlap). Returns the number of songs added.
+        """
+        collection = collection if collection is not None else songs_collection()
+
+        with self._refresh_lock:
+            query = {}
+            if self._high_water is not None:
+                since = self._high_water - datetime.timedelta(seconds=REFRESH_OVERLAP_SEC)
+                query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+
+            # names first, fingerprints only for the songs not loaded yet
+            new_ids = []
+            for doc in collection.find(query, {"song_name": 1}):
+                created = doc["_id"].generation_time
+                if self._high_water is None or created > self._high_water:
+                    self._high_water = created
+                if doc["song_name"] not in self._known:
+                    new_ids.append(doc["_id"])
+
+            added = 0
+            if new_ids:
+                cursor = collection.find({"_id": {"$in": new_ids}}, {"song_name": 1, "fingerprint": 1})
+                for doc in cursor.sort("_id", 1):
+                    added += self.add(doc["song_name"], doc["fingerprint"])
+            self._last_refresh = time.monotonic()
+        return added
+
+    def refresh_if_stale(self, max_age_sec=REFRESH_SEC):
+        """
+        refresh() unless the last one was less than max_age_sec ago.
+        Returns the number of songs added.
+        """
+        if time.monotonic() - self._last_refresh < max_age_sec:
+            return 0
+        return self.refresh()
+
+    def memory_mb(self):
+        return round(self._frames.nbytes / 1e6, 2)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    The process-wide catalog, loaded from Mongo on first use.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog.from_collection()
+        return _catalog
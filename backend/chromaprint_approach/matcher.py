@@ -1,24 +1,119 @@
-from similarity import cosine_similarity
+"""
+Chromaprint sub-fingerprints are 32-bit words where every bit is one
+feature, so two frames are compared by how many bits they share
+(1 - bit error rate), not by treating the words as numbers.
 
-def sliding_window_match(song_fp, query_fp, step=1):
+A query is compared against every offset of the whole catalog at once:
+the catalog is one uint32 array with all songs back to back, and for each
+query frame j the XOR popcount with the catalog shifted by j is added to a
+running Hamming distance per offset. That is len(query) vectorized passes
+over the catalog instead of a Python loop per song and offset.
+"""
+
+import numpy as np
+
+BITS = 32
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+    def popcount(x):
+        return _POPCOUNT16[x & 0xFFFF] + _POPCOUNT16[x >> 16]
+
+
+def to_uint32(fp):
     """
-    Slides query fingerprint over song fingerprint
-    Returns the best cosine similarity score
+    fpcalc -raw prints signed or unsigned words depending on the version,
+    both map to the same bits here.
     """
-    q_len = len(query_fp)
-    s_len = len(song_fp)
+    return np.asarray(fp, dtype=np.int64).astype(np.uint32)
 
-    if q_len > s_len:
-        return 0.0
 
-    best_score = 0.0
+def pack_catalog(fingerprints):
+    """
+    Returns (frames, starts): every fingerprint concatenated into one uint32
+    array, song i being frames[starts[i]:starts[i + 1]]
+    """
+    lengths = [len(fp) for fp in fingerprints]
+    starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+
+    if not fingerprints:
+        return np.empty(0, dtype=np.uint32), starts
+    return np.concatenate([to_uint32(fp) for fp in fingerprints]), starts
+
 
-    for i in range(0, s_len - q_len + 1, step):
-        window = song_fp[i:i + q_len]
-        score = cosine_similarity(window, query_fp)
+def hamming_all_offsets(frames, query):
+    """
+    Returns the Hamming distance between the query and frames[i:i + len(query)]
+    for every offset i
+    """
+    q_len = len(query)
+    n = len(frames) - q_len + 1
+    if n <= 0 or q_len == 0:
+        return np.empty(0, dtype=np.int32)
 
-        if score > best_score:
-            best_score = score
+    dist = np.zeros(n, dtype=np.int32)
+    for j, q in enumerate(query):
+        dist += popcount(frames[j:j + n] ^ q)
+    return dist
 
-    return best_score
 
+def match_catalog(frames, starts, query_fp):
+    """
+    Best alignment of the query in every song, in one batched pass.
+
+    Returns (scores, offsets): per song the best fraction of matching bits
+    and the frame offset it was found at. Songs shorter than the query
+    score 0.0 with offset -1.
+    """
+    query = to_uint32(query_fp)
+    q_len = len(query)
+    n_songs = len(starts) - 1
+
+    scores = np.zeros(n_songs)
+    offsets = np.full(n_songs, -1, dtype=np.int64)
+    if q_len == 0 or n_songs == 0:
+        return scores, offsets
+
+    dist = hamming_all_offsets(frames, query)
+
+    # an offset is valid if the whole window lies inside one song
+    lengths = np.diff(starts)
+    fits = lengths >= q_len
+    n_valid = np.where(fits, lengths - q_len + 1, 0)
+    song_of = np.repeat(np.arange(n_songs), n_valid)
+    # position of each valid offset: its song's start plus its index in the song
+    first = np.cumsum(n_valid) - n_valid
+    pos = starts[:-1][song_of] + (np.arange(len(song_of)) - first[song_of])
+    if len(pos) == 0:
+        return scores, offsets
+
+    valid_dist = dist[pos]
+    seg = first[fits]
+    seg_min = np.minimum.reduceat(valid_dist, seg)
+
+    # first offset reaching the minimum, per song
+    hits = np.flatnonzero(valid_dist == np.repeat(seg_min, n_valid[fits]))
+    head = hits[np.r_[True, song_of[hits][1:] != song_of[hits][:-1]]]
+
+    scores[fits] = 1.0 - seg_min / (BITS * q_len)
+    offsets[fits] = pos[head] - starts[:-1][fits]
+    return scores, offsets
+
+
+def sliding_window_match(song_fp, query_fp, step=1):
+    """
+    Slides query fingerprint over song fingerprint
+    Returns the best bit similarity score (fraction of matching bits)
+    """
+    song = to_uint32(song_fp)
+    query = to_uint32(query_fp)
+
+    if len(query) > len(song) or len(query) == 0:
+        return 0.0
+
+    dist = hamming_all_offsets(song, query)[::step]
+    return float(1.0 - dist.min() / (BITS * len(query)))
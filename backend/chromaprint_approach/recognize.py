@@ -1,9 +1,10 @@
 from fingerprint import extract_fingerprint
-from matcher import sliding_window_match
-from db import load_all_songs_and_fp
+import numpy as np
+from matcher import match_catalog
+from catalog import get_catalog
 # client = MongoClient("mongodb://localhost:27017")
 
-def recognize(query_audio):
+def recognize(query_audio, catalog=None):
     
     _, query_fp = extract_fingerprint(query_audio)
 
@@ -21,23 +22,20 @@ def recognize(query_audio):
         score = sliding_window_match(song_fp, query_fp)
     """
     
-    #returns the list of dicts containing {name,fp}
-    songs = load_all_songs_and_fp()
-
-    for song in songs: 
-        name = song["song_name"]
-        fingerprint = song["fingerprint"]
-
-
-        score = sliding_window_match(fingerprint, query_fp)
-        # print(f"{name}: {score:.3f}") 
-
-        if score > best_score:
-            second_score = best_score   #second best score is stored
-            best_score = score
-            best_song = name
-        elif score > second_score:      
-            second_score = score
+    # catalog preloaded once per process (see catalog.Catalog)
+    catalog = catalog if catalog is not None else get_catalog()
+    frames, starts, names = catalog.snapshot()
+
+    # all songs scored in one batched pass (see matcher.match_catalog)
+    scores, _ = match_catalog(frames, starts, query_fp)
+
+    # stable, so ties go to the earlier song as before
+    order = np.argsort(-scores, kind="stable")
+    if len(order) and scores[order[0]] > 0:
+        best_song = names[order[0]]
+        best_score = float(scores[order[0]])
+    if len(order) > 1:
+        second_score = float(scores[order[1]])   #second best score is stored
 
     # --- decision logic ---
 
@@ -1,5 +1,5 @@
-from pymongo import MongoClient
 from fingerprint import extract_fingerprint
+from db import songs_collection
 from pathlib import Path
 
 """
@@ -11,10 +11,8 @@ like,
 -fingerprint
 """
 
-# MongoDB connection
-client = MongoClient("mongodb://localhost:27017")
-db = client["music_recognition"]
-songs_col = db["songs"]
+# MongoDB connection (shared client, see db.py)
+songs_col = songs_collection()
 
 SONG_DIR = "known_songs"
 
@@ -1,14 +1,105 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.params import Form
-import tempfile, os, subprocess
-
-from match_from_db import identify_song
-from db import songs_col
-from index_to_db import index_song
-from spotify_search import search_spotify, parse_spotify_results
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+import asyncio, json, logging, os, subprocess, time
+
+# before the local imports, so messages logged at import time (db.py) show
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
-app = FastAPI()
+from match_from_db import (
+    match_hashes, fetch_batch_postings, match_batch, StreamingMatcher, CANDIDATE_K,
+)
+from db import songs_col, fingerprints_col, hash_stats_col, spotify_cache_col
+from index_to_db import store_fingerprints, index_settings
+from inverted_index import InvertedIndex
+from sharding import ShardedStore
+from result_cache import ResultCache, minhash_signature, bytes_digest
+from hash_stats import StopHashTable
+from pipeline import IdentifyPipeline, QueueFull
+from decoding import decode_bytes_async, StreamDecoder
+from streaming import StreamingFingerprinter
+from spotify_search import parse_spotify_results
+from metadata import SpotifyCache, SongCache
+import metrics
+from metrics import RequestTimer
+from profiling import profile_for
+
+logger = logging.getLogger("app")
+
+# in-memory fingerprint index, enabled with INMEMORY_INDEX=1, a
+# memory-mapped index file with INDEX_FILE=<dir>, or the hash-range shards
+# with FINGERPRINT_SHARDS=<n> (see sharding.py).
+# None means every /identify goes to the single fingerprints collection.
+fingerprint_index = None
+
+# where /upload writes fingerprints: the collection, or the ShardedStore
+# which writes to the collection and to the song's shards
+fingerprint_store = fingerprints_col
+
+# stop-hashes skipped at query time, enabled with STOP_HASH_MAX_DF=<songs>.
+stop_hashes = None
+
+# process/thread pools and concurrency limits for the request pipeline
+pipeline = None
+
+# /identify result cache, RESULT_CACHE_SIZE=0 disables it
+result_cache = None
+
+# songs documents for the /identify response, Spotify searches for /upload
+song_cache = SongCache(songs_col, max_entries=int(os.getenv("SONG_CACHE_SIZE", "5000")))
+spotify_cache = SpotifyCache(spotify_cache_col)
+
+# songs kept for offset voting after the hit-count stage, 0 = all songs
+candidate_k = int(os.getenv("CANDIDATE_K", str(CANDIDATE_K or 0))) or None
+
+# /identify/batch limits: clips per request, ffmpeg processes at once
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_DECODE_CONCURRENCY = int(os.getenv("BATCH_DECODE_CONCURRENCY", "4"))
+
+# /identify/stream gives its final answer after this much audio at most
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "20"))
+
+# POST /debug/profile is only served with PROFILING=1
+PROFILING = os.getenv("PROFILING", "0") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global fingerprint_index, fingerprint_store, stop_hashes, pipeline, result_cache
+    # queries must use the front-end and peak budget the index was built with
+    settings = index_settings(fingerprints_col, default_frontend=os.getenv("FINGERPRINT_FRONTEND", "stft"))
+    pipeline = IdentifyPipeline.from_env(**settings)
+    logger.info("Fingerprint settings: %s (%s)", settings, fingerprints_col.name)
+    if int(os.getenv("RESULT_CACHE_SIZE", "1000")) > 0:
+        result_cache = ResultCache(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1000")),
+            ttl_sec=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+        )
+    n_shards = int(os.getenv("FINGERPRINT_SHARDS", "1"))
+    if n_shards > 1:
+        fingerprint_index = fingerprint_store = ShardedStore.from_db(
+            fingerprints_col, n_shards, in_memory=os.getenv("INMEMORY_INDEX", "0") == "1"
+        )
+        logger.info("Fingerprint shards: %d", len(fingerprint_index))
+    elif os.getenv("INDEX_FILE"):
+        fingerprint_index = InvertedIndex.open(os.getenv("INDEX_FILE"))
+        logger.info("Index file mapped: %s", fingerprint_index.memory_report())
+    elif os.getenv("INMEMORY_INDEX", "0") == "1":
+        fingerprint_index = InvertedIndex.from_collection(fingerprints_col)
+        logger.info("In-memory index loaded: %s", fingerprint_index.memory_report())
+    if os.getenv("STOP_HASH_MAX_DF"):
+        stop_hashes = StopHashTable(hash_stats_col, int(os.getenv("STOP_HASH_MAX_DF"))).load()
+        logger.info("Stop-hashes loaded: %d", len(stop_hashes))
+    yield
+    pipeline.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -24,68 +115,327 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/stats")
+def stats():
+    return {
+        "pipeline": pipeline.stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "song_cache": song_cache.stats(),
+        "spotify_cache": spotify_cache.stats(),
+    }
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text format: stage/request histograms plus pipeline and cache gauges."""
+    pipeline_stats = pipeline.stats()
+    cache_stats = result_cache.stats() if result_cache is not None else {}
+    gauges = {
+        "pipeline_in_flight": pipeline_stats["in_flight"],
+        "pipeline_queued": pipeline_stats["queued"],
+        "pipeline_completed": pipeline_stats["completed"],
+        "pipeline_rejected": pipeline_stats["rejected"],
+        "result_cache_entries": cache_stats.get("entries"),
+        "result_cache_exact_hits": cache_stats.get("exact_hits"),
+        "result_cache_near_hits": cache_stats.get("near_hits"),
+        "result_cache_misses": cache_stats.get("misses"),
+        "song_cache_hits": song_cache.hits,
+        "song_cache_misses": song_cache.misses,
+    }
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    """
+    Sample every thread's stack for `seconds` (max 60) while the service
+    keeps serving, and return folded stacks for flamegraph.pl/speedscope.
+    Only available with PROFILING=1.
+    """
+
+    if not PROFILING:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not seconds > 0:
+        raise HTTPException(status_code=400, detail="seconds must be positive")
+    sampler = await asyncio.to_thread(profile_for, min(seconds, 60.0))
+    return PlainTextResponse(sampler.folded())
+
+
 @app.post("/identify")
-async def identify(file: UploadFile = File(...)):
+async def identify(response: Response, file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
     MAX_FILE_SIZE = 13 * 1024 * 1024  # 13 MB hard limit
 
+    timer = RequestTimer("identify")
+
     # read file once
-    contents = await file.read()
+    with timer.stage("upload_read"):
+        contents = await file.read()
     if len(contents) > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="Audio file too large")
 
-    tmp_path = None
-    wav_path = None
+    suffix = os.path.splitext(file.filename)[1] or ".bin"
+
+    # the exact same clip again: skip decoding and fingerprinting too
+    digest = bytes_digest(contents)
+    if result_cache is not None:
+        cached = result_cache.get_exact(digest)
+        if cached is not None:
+            timer.finish("cache_hit")
+            return cached
+        generation = result_cache.generation
 
     try:
-        # save to /tmp explicitly (important on Render)
-        suffix = os.path.splitext(file.filename)[1] or ".bin"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir="/tmp") as tmp:
-            tmp_path = tmp.name
-            tmp.write(contents)
-
-        # convert to small WAV (downsampled)
-        wav_path = tmp_path + ".wav"
-        subprocess.run(
-            [
-                "ffmpeg", "-y",
-                "-i", tmp_path,
-                "-ac", "1",        # mono
-                "-ar", "22050",    # downsample
-                wav_path
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            check=True
+        async with pipeline.slot():
+            start = time.perf_counter()
+
+            # decode straight from memory to mono float32 at 22050 Hz
+            with timer.stage("ffmpeg"):
+                samples, sr = await decode_bytes_async(contents, suffix=suffix)
+
+            # fingerprint in the process pool, lookup + voting in the thread pool
+            hashes, t_anchors = await pipeline.fingerprint(samples, sr, timer)
+            fingerprinted = time.perf_counter()
+
+            # a near-identical query answered recently
+            if result_cache is not None:
+                signature = minhash_signature(hashes)
+                cached = result_cache.get_similar(signature)
+                if cached is not None:
+                    timer.finish("cache_hit")
+                    return cached
+
+            song_id, votes, status = await pipeline.run_blocking(
+                match_hashes, hashes, t_anchors,
+                index=fingerprint_index, stop_hashes=stop_hashes, candidate_k=candidate_k,
+                timer=timer,
+            )
+
+            # lookup song metadata
+            song = None
+            if song_id is not None:
+                with timer.stage("metadata"):
+                    song = await pipeline.run_blocking(song_cache.get, song_id)
+            matched = time.perf_counter()
+
+    except QueueFull:
+        timer.finish("busy")
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly")
+    except subprocess.CalledProcessError:
+        timer.finish("decode_error")
+        raise
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    timer.finish("matched" if song else "no_match")
+
+    if song:
+        response = dict(song)
+    else:
+        response = {
+            "status": "No Match",
+            "reason": status
+        }
+
+    if result_cache is not None:
+        # misses are only reused for the exact same bytes, see result_cache
+        result_cache.put(
+            digest, signature if song else None, response,
+            fingerprinted - start, matched - fingerprinted, generation,
         )
 
-        # fingerprint & identify
-        song_id, votes, status = identify_song(wav_path)
+    return response
 
-    finally:
-        # defensive cleanup
-        for p in (tmp_path, wav_path):
-            if p and os.path.exists(p):
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
-
-    # lookup song metadata
-    song = songs_col.find_one(
-        {"song_id": str(song_id)},
-        {"_id": 0, "song_id": 0}
-    )
 
-    if song:
-        return dict(song)
+@app.post("/identify/batch")
+async def identify_batch(files: list[UploadFile] = File(...)):
+    """
+    Identify many clips in one request.
 
-    return {
-        "status": "No Match",
-        "reason": status
-    }
+    Clips are decoded and fingerprinted in parallel, their hashes are
+    looked up together in one deduplicated query, and each clip is then
+    voted on separately. Results stream back as NDJSON, one line per clip
+    in upload order: {"index", "filename", "status", ...song metadata}.
+    """
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} files per batch")
+
+    MAX_FILE_SIZE = 13 * 1024 * 1024  # per clip, same as /identify
+
+    timer = RequestTimer("identify_batch")
+
+    clips = []
+    for f in files:
+        with timer.stage("upload_read"):
+            contents = await f.read()
+        if len(contents) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail=f"{f.filename}: audio file too large")
+        clips.append((f.filename, contents))
+
+    decode_slots = asyncio.Semaphore(BATCH_DECODE_CONCURRENCY)
+
+    async def fingerprint_clip(filename, contents):
+        suffix = os.path.splitext(filename or "")[1] or ".bin"
+        try:
+            async with decode_slots:
+                with timer.stage("ffmpeg"):
+                    samples, sr = await decode_bytes_async(contents, suffix=suffix)
+            return await pipeline.fingerprint(samples, sr, timer)
+        except Exception as e:
+            # only this clip is lost (decoder or fingerprint worker), the
+            # rest of the batch goes on
+            logger.warning("Could not decode %s: %r", filename, e)
+            return None
+
+    try:
+        async with pipeline.slot():
+            fingerprints = await asyncio.gather(
+                *(fingerprint_clip(name, contents) for name, contents in clips)
+            )
+            decoded = [i for i, fp in enumerate(fingerprints) if fp is not None]
+
+            # one lookup for the whole batch
+            with timer.stage("db_fetch"):
+                queries, postings = await pipeline.run_blocking(
+                    fetch_batch_postings, [fingerprints[i] for i in decoded],
+                    index=fingerprint_index, stop_hashes=stop_hashes,
+                )
+            timer.count("postings", len(postings[0]))
+
+    except QueueFull:
+        timer.finish("busy")
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly")
+
+    async def results():
+        votes_iter = match_batch(queries, postings, candidate_k=candidate_k)
+        decoded_set = set(decoded)
+
+        for i, (filename, _) in enumerate(clips):
+            line = {"index": i, "filename": filename}
+
+            if i not in decoded_set:
+                line.update({"status": "No Match", "reason": "Could not decode audio"})
+            else:
+                # the batch's slot was released before streaming; voting and
+                # metadata of each clip count against the concurrency limit again
+                async with pipeline.slot(reject=False):
+                    with timer.stage("voting"):
+                        song_id, votes, status = await pipeline.run_blocking(next, votes_iter)
+                    with timer.stage("metadata"):
+                        song = await pipeline.run_blocking(song_cache.get, song_id) if song_id else None
+                if song:
+                    line.update({"status": "MATCHED!", "votes": votes, **song})
+                else:
+                    line.update({"status": "No Match", "reason": status, "votes": votes})
+
+            yield json.dumps(line) + "\n"
+
+        timer.count("clips", len(clips))
+        timer.finish("ok")
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+def _stream_step(fingerprinter, matcher, samples, final=False):
+    # one chunk of the stream: new landmarks -> lookup -> running decision
+    result = matcher.add(*fingerprinter.push(samples))
+    if final:
+        result = matcher.add(*fingerprinter.finish())
+    return result
+
+
+@app.websocket("/identify/stream")
+async def identify_stream(ws: WebSocket):
+    """
+    Streaming identify over a WebSocket.
+
+    The client sends the recording as binary messages while it records
+    (e.g. MediaRecorder chunks, the first one carrying the container
+    header) and a text message "end" when it stops. After every chunk the
+    server replies {"status": "listening", "seconds", "votes"}; as soon as
+    the votes clear the min-vote and ratio criteria it sends the song
+    metadata and closes. Otherwise the final answer comes after "end" or
+    STREAM_MAX_SECONDS of audio, in the same shape as /identify.
+    """
+
+    await ws.accept()
+
+    timer = RequestTimer("identify_stream")
+    try:
+        fingerprinter = StreamingFingerprinter(
+            frontend=pipeline.frontend, peaks_per_sec=pipeline.peaks_per_sec
+        )
+    except ValueError as e:
+        # cqt indexes are offline only
+        await ws.close(code=1003, reason=str(e))
+        return
+    decoder = await StreamDecoder(sr=fingerprinter.sr).start()
+    matcher = StreamingMatcher(index=fingerprint_index, stop_hashes=stop_hashes)
+    song_id, status = None, "LOW CONFIDENCE"
+
+    try:
+        while fingerprinter.seconds < STREAM_MAX_SECONDS:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") == "end":
+                break
+            if not message.get("bytes"):
+                continue
+
+            await decoder.feed(message["bytes"])
+            async with pipeline.slot():
+                with timer.stage("fingerprint_match"):
+                    song_id, votes, status = await pipeline.run_blocking(
+                        _stream_step, fingerprinter, matcher, decoder.read()
+                    )
+            if song_id is not None:
+                break
+
+            await ws.send_json({
+                "status": "listening",
+                "seconds": round(fingerprinter.seconds, 2),
+                "votes": votes,
+            })
+
+        if song_id is None:
+            # flush what ffmpeg and the fingerprinter still hold
+            tail = await decoder.close()
+            async with pipeline.slot():
+                with timer.stage("fingerprint_match"):
+                    song_id, votes, status = await pipeline.run_blocking(
+                        _stream_step, fingerprinter, matcher, tail, final=True
+                    )
+
+        song = None
+        if song_id is not None:
+            song = await pipeline.run_blocking(song_cache.get, song_id)
+
+        timer.count("seconds", round(fingerprinter.seconds, 2))
+        timer.finish("matched" if song else "no_match")
+        await ws.send_json(dict(song) if song else {"status": "No Match", "reason": status})
+        await ws.close()
+
+    except QueueFull:
+        timer.finish("busy")
+        await ws.send_json({"status": "No Match", "reason": "Server busy, try again shortly"})
+        await ws.close(code=1013)
+
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg exited on input it cannot decode, e.g. a corrupt first chunk
+        timer.finish("decode_error")
+        await ws.send_json({"status": "No Match", "reason": "Could not decode audio"})
+        await ws.close(code=1003)
+
+    except WebSocketDisconnect:
+        pass
+
+    finally:
+        decoder.kill()
 
 
 @app.post("/upload")
@@ -112,7 +462,7 @@ async def upload_song(
 
     # build query safely
     query = song_title if not artist_name else f"{song_title} {artist_name}"
-    data = search_spotify(query)
+    data = await pipeline.run_blocking(spotify_cache.search, query)
     song_metadata = parse_spotify_results(data)
 
     if not song_metadata:
@@ -127,42 +477,43 @@ async def upload_song(
     artists = song_metadata[0]['artists']
 
     # duplicate check
-    existing_song = songs_col.find_one({"song_id": song_id})
+    existing_song = await pipeline.run_blocking(songs_col.find_one, {"song_id": song_id})
     if existing_song:
         raise HTTPException(
             status_code=409,
             detail="Song already exists in database"
         )
 
+    timer = RequestTimer("upload")
+
     # saving uploaded file
-    contents = await file.read()
+    with timer.stage("upload_read"):
+        contents = await file.read()
     MAX_FILE_SIZE = 13 * 1024 * 1024  # 13 MB
     if len(contents) > MAX_FILE_SIZE:
         raise HTTPException(413, "File too large")
 
-    tmp_path = None
-    wav_path = None
+    suffix = os.path.splitext(file.filename)[1] or ".bin"
 
     try:
-        suffix = os.path.splitext(file.filename)[1] or ".bin"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir="/tmp") as tmp:
-            tmp_path = tmp.name
-            tmp.write(contents)
-
-        # to .wav
-        wav_path = tmp_path + ".wav"
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", tmp_path, "-ac", "1", "-ar", "22050", wav_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            check=True
-        )
+        async with pipeline.slot():
+            # decode in memory, fingerprint in the process pool
+            with timer.stage("ffmpeg"):
+                samples, sr = await decode_bytes_async(contents, suffix=suffix)
+            hashes, t_anchors = await pipeline.fingerprint(samples, sr, timer)
 
         # storing fingerprint
-        index_song(wav_path, song_id)
+        with timer.stage("db_write"):
+            hashes, t_anchors = await pipeline.run_blocking(
+                store_fingerprints, song_id, hashes, t_anchors, collection=fingerprint_store
+            )
+        if fingerprint_index is not None:
+            await pipeline.run_blocking(fingerprint_index.add_song, song_id, hashes, t_anchors)
+        if stop_hashes is not None:
+            await pipeline.run_blocking(stop_hashes.add_song, hashes)
 
         # Store metadata
-        songs_col.insert_one({
+        song_doc = {
             "song_id": song_id,
             "title": song_name,
             "artist": artists,
@@ -170,16 +521,20 @@ async def upload_song(
             "cover_art": cover_art,
             "album_url": album_url,
             "album_name": album_name
-        })
+        }
+        await pipeline.run_blocking(songs_col.insert_one, song_doc)
+        song_cache.put(song_id, song_doc)
 
-    finally:
-        # cleanup
-        for p in (tmp_path, wav_path):
-            if p and os.path.exists(p):
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
+    except QueueFull:
+        timer.finish("busy")
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly")
+
+    # cached answers may now be wrong
+    if result_cache is not None:
+        result_cache.invalidate()
+
+    timer.count("landmarks", len(hashes))
+    timer.finish("indexed")
 
     # response
     return {
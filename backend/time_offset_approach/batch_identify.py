@@ -0,0 +1,141 @@
+"""
+Identify a folder (or list) of clips without going through the HTTP API.
+
+Clips are fingerprinted across a process pool and matched in batches:
+every batch makes one deduplicated lookup for all of its clips' hashes,
+then each clip is voted on separately. Results are printed as NDJSON, one
+line per clip, as soon as each batch is done:
+
+    python batch_identify.py clips/ > results.ndjson
+    python batch_identify.py --list clips.txt --batch-size 200 --workers 8
+
+The index is chosen like the service does: FINGERPRINT_SHARDS=<n> for the
+hash-range shards (with INMEMORY_INDEX=1 to hold them in memory),
+INDEX_FILE=<dir> or INMEMORY_INDEX=1 to look up from memory, Mongo
+otherwise; STOP_HASH_MAX_DF=<songs> skips stop-hashes. Clips are
+fingerprinted with the front-end and peak budget the fingerprints
+collection was built with (see index_to_db.index_settings).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from db import songs_col, fingerprints_col, hash_stats_col
+from fingerprint import fingerprint_file, DEFAULT_FRONTEND
+from hash_stats import StopHashTable
+from index_to_db import index_settings
+from inverted_index import InvertedIndex
+from match_from_db import fetch_batch_postings, match_batch, CANDIDATE_K
+from metadata import SongCache
+from sharding import ShardedStore
+from bulk_index import AUDIO_EXTENSIONS
+
+BATCH_SIZE = 100
+
+
+def clips_from_dir(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+
+def clips_from_list(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _fingerprint_job(path, frontend=DEFAULT_FRONTEND, peaks_per_sec=None):
+    # runs in a worker process
+    try:
+        return fingerprint_file(path, frontend, peaks_per_sec)
+    except Exception:
+        return None
+
+
+def load_index():
+    # same choice as app.lifespan
+    n_shards = int(os.getenv("FINGERPRINT_SHARDS", "1"))
+    if n_shards > 1:
+        return ShardedStore.from_db(
+            fingerprints_col, n_shards, in_memory=os.getenv("INMEMORY_INDEX", "0") == "1"
+        )
+    if os.getenv("INDEX_FILE"):
+        return InvertedIndex.open(os.getenv("INDEX_FILE"))
+    if os.getenv("INMEMORY_INDEX", "0") == "1":
+        return InvertedIndex.from_collection(fingerprints_col)
+    return None
+
+
+def load_stop_hashes():
+    if os.getenv("STOP_HASH_MAX_DF"):
+        return StopHashTable(hash_stats_col, int(os.getenv("STOP_HASH_MAX_DF"))).load()
+    return None
+
+
+def batch_identify(
+    paths, batch_size=BATCH_SIZE, workers=None, index=None, candidate_k=CANDIDATE_K,
+    frontend=DEFAULT_FRONTEND,
+    peaks_per_sec=None,
+    stop_hashes=None,
+):
+    """
+    Yields:
+        dict: one result per path, in input order
+    """
+
+    song_cache = SongCache(songs_col)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(paths), batch_size):
+            batch = paths[start:start + batch_size]
+            fingerprints = list(pool.map(
+                _fingerprint_job, batch, [frontend] * len(batch), [peaks_per_sec] * len(batch)
+            ))
+
+            decoded = [fp for fp in fingerprints if fp is not None]
+            queries, postings = fetch_batch_postings(decoded, index, stop_hashes)
+            votes_iter = match_batch(queries, postings, candidate_k=candidate_k)
+
+            for path, fp in zip(batch, fingerprints):
+                if fp is None:
+                    yield {"path": path, "status": "No Match", "reason": "Could not decode audio"}
+                    continue
+
+                song_id, votes, status = next(votes_iter)
+                song = song_cache.get(song_id) if song_id else None
+                if song:
+                    yield {"path": path, "status": "MATCHED!", "votes": votes, "song_id": song_id, **song}
+                else:
+                    yield {"path": path, "status": "No Match", "reason": status, "votes": votes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", nargs="?", help="directory to walk for clips")
+    parser.add_argument("--list", help="text file with one clip path per line")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--candidate-k", type=int, default=CANDIDATE_K)
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.list):
+        parser.error("give either a directory or --list")
+
+    paths = clips_from_list(args.list) if args.list else list(clips_from_dir(args.directory))
+
+    start = time.perf_counter()
+    n = 0
+    for result in batch_identify(
+        paths, args.batch_size, args.workers, load_index(), args.candidate_k or None,
+        stop_hashes=load_stop_hashes(), **index_settings(),
+    ):
+        print(json.dumps(result), flush=True)
+        n += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"{n} clips in {elapsed:.1f}s ({n / elapsed:.2f} clips/s)", file=sys.stderr)
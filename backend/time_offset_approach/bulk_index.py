@@ -0,0 +1,380 @@
+"""
+Bulk-index a catalog of audio files into the fingerprints collection.
+
+Files are fingerprinted across a process pool, and the main process writes
+the landmarks in bounded, unordered insert_many batches:
+
+    python bulk_index.py songs/                     # song_id = file name stem
+    python bulk_index.py --manifest catalog.jsonl   # one JSON object per line
+    python bulk_index.py songs/ --workers 8 --batch-size 20000
+
+Manifest lines need "path" and "song_id". Any other keys ("title",
+"artist", ...) are upserted into the songs collection as metadata. Every
+indexed song gets a songs document, with the file name stem as its title
+unless one is given, so /identify can report it.
+
+Completed song_ids are appended to a checkpoint file (--checkpoint,
+default .bulk_index.done), so an interrupted run can simply be restarted.
+Songs that were only partially written before a crash are deleted and
+indexed again (by song_id, which gets an index for that).
+
+Two entries with the same song_id are refused before anything is written:
+in directory mode that means two files with the same name stem in
+different folders, which would otherwise overwrite each other.
+
+With --index-file DIR the whole fingerprints collection is written out as
+a memory-mapped index (see InvertedIndex.save) once the run finishes.
+
+With --frontend mel|cqt the catalog is fingerprinted from a band-limited
+spectrogram instead of the full STFT (see fingerprint.FRONTENDS). The
+front-end is recorded for the fingerprints collection (FINGERPRINTS_COLLECTION),
+and indexing into a collection built with another front-end is refused.
+
+With --peaks-per-sec N peak picking keeps the loudest N peaks per second
+of audio instead of everything above -40 dB, so a loud, dense master
+stores about as many landmarks per minute as a quiet acoustic track. The
+budget is recorded with the front-end; the summary reports postings per
+song so the spread is visible either way.
+
+With --peak-cache DIR each file's peaks are kept in a peak_cache.PeakCache,
+so re-indexing after changing landmark or hash settings skips decoding
+and the STFT for files seen before.
+
+The stop-hash table is not updated here; run `python hash_stats.py
+--rebuild` after a large import.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from db import songs_col, fingerprints_col
+from fingerprint import fingerprint_file, FRONTENDS, DEFAULT_FRONTEND
+from hash_stats import cap_repeats, MAX_POSTINGS_PER_HASH
+from index_to_db import fingerprint_docs, record_index_settings
+from inverted_index import InvertedIndex
+from peak_cache import PeakCache, fingerprint_file_cached
+
+AUDIO_EXTENSIONS = {".mp3", ".m4a", ".wav", ".flac", ".ogg", ".aac", ".webm"}
+BATCH_SIZE = 10_000
+MAX_RETRIES = 5
+DUPLICATE_KEY = 11000
+
+
+def catalog_from_dir(root):
+    """
+    Yields:
+        dict: {"path", "song_id"} for every audio file under root
+    """
+
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in AUDIO_EXTENSIONS:
+                yield {"path": os.path.join(dirpath, name), "song_id": stem}
+
+
+def catalog_from_manifest(path):
+    """
+    Yields:
+        dict: one manifest entry per non-empty line
+    """
+
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _fingerprint_job(
+    entry, max_postings_per_hash, peak_cache_dir=None, frontend=DEFAULT_FRONTEND, peaks_per_sec=None,
+):
+    # runs in a worker process: no Mongo access here
+    cache_stats = None
+    if peak_cache_dir is None:
+        hashes, t_anchors = fingerprint_file(entry["path"], frontend, peaks_per_sec)
+    else:
+        # the parent process does the eviction
+        cache = PeakCache(peak_cache_dir, max_bytes=None)
+        hashes, t_anchors = fingerprint_file_cached(
+            entry["path"], cache, frontend=frontend, peaks_per_sec=peaks_per_sec
+        )
+        cache_stats = cache.stats()
+    keep = cap_repeats(hashes, max_postings_per_hash)
+    return entry, hashes[keep], t_anchors[keep], cache_stats
+
+
+def insert_with_retry(collection, docs, retries=MAX_RETRIES):
+    """
+    insert_many(ordered=False) with retry on transient errors.
+
+    pymongo assigns each document its _id before sending, so re-sending the
+    same list after a dropped connection only produces duplicate-key
+    errors for the rows that already made it, which are ignored.
+
+    Raises:
+        BulkWriteError: on any write error other than a duplicate key
+        AutoReconnect: if the connection is still failing after `retries`
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            collection.insert_many(docs, ordered=False)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            return
+        except AutoReconnect:
+            if attempt == retries:
+                raise
+            wait_sec = 2 ** attempt
+            print(f"Mongo unavailable, retrying batch in {wait_sec}s", flush=True)
+            time.sleep(wait_sec)
+
+
+class BatchWriter:
+    """
+    Buffers fingerprint documents and writes them in fixed-size batches.
+
+    A song counts as done once its last document has been written; done
+    song_ids are appended to the checkpoint file.
+    """
+
+    def __init__(self, collection, checkpoint_path, batch_size=BATCH_SIZE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.checkpoint = open(checkpoint_path, "a")
+
+        self.buffer = []
+        self.written = 0              # docs written so far
+        self.queued = 0               # docs handed to add()
+        self._song_ends = deque()     # (queued count after the song, song_id)
+
+    def add(self, song_id, docs):
+        self.buffer.extend(docs)
+        self.queued += len(docs)
+        self._song_ends.append((self.queued, song_id))
+
+        while len(self.buffer) >= self.batch_size:
+            self._write(self.buffer[:self.batch_size])
+            del self.buffer[:self.batch_size]
+
+    def flush(self):
+        if self.buffer:
+            self._write(self.buffer)
+            self.buffer = []
+        self._mark_done()
+
+    def _write(self, docs):
+        insert_with_retry(self.collection, docs)
+        self.written += len(docs)
+        self._mark_done()
+
+    def _mark_done(self):
+        while self._song_ends and self._song_ends[0][0] <= self.written:
+            _, song_id = self._song_ends.popleft()
+            self.checkpoint.write(song_id + "\n")
+        self.checkpoint.flush()
+
+    def close(self):
+        self.flush()
+        self.checkpoint.close()
+
+
+def bulk_index(
+    entries,
+    checkpoint_path,
+    workers=None,
+    batch_size=BATCH_SIZE,
+    max_postings_per_hash=MAX_POSTINGS_PER_HASH,
+    peak_cache=None,
+    frontend=DEFAULT_FRONTEND,
+    peaks_per_sec=None,
+):
+    """
+    Fingerprint and store every catalog entry not in the checkpoint.
+
+    Parameters:
+        peak_cache (PeakCache | None): reuse cached peaks, see peak_cache
+        frontend (str): spectrogram front-end, see fingerprint.FRONTENDS
+        peaks_per_sec (float | None): peak budget, None for the fixed
+            -40 dB threshold
+
+    Raises:
+        ValueError: if two entries share a song_id, or if the fingerprints
+            collection was built with another front-end or peak budget
+
+    Returns:
+        dict: songs, landmarks, failed, elapsed_sec, the spread of
+            landmarks per song, plus the peak_cache report (hits, misses
+            and writes summed over the workers) when a cache is given
+    """
+
+    paths = {}
+    for entry in entries:
+        paths.setdefault(entry["song_id"], []).append(entry["path"])
+    clashes = {song_id: p for song_id, p in paths.items() if len(p) > 1}
+    if clashes:
+        raise ValueError(
+            f"{len(clashes)} song_ids are used by more than one file, e.g. "
+            + "; ".join(f"{song_id}: {', '.join(p)}" for song_id, p in list(clashes.items())[:5])
+            + " (rename the files or give song_ids in a --manifest)"
+        )
+
+    record_index_settings(frontend, peaks_per_sec, fingerprints_col)
+    # the per-song cleanup below would scan the whole collection without it
+    fingerprints_col.create_index("song_id")
+
+    done = load_checkpoint(checkpoint_path)
+    todo = [e for e in entries if e["song_id"] not in done]
+    print(f"{len(done)} songs already indexed, {len(todo)} to go", flush=True)
+
+    writer = BatchWriter(fingerprints_col, checkpoint_path, batch_size)
+    songs = landmarks = failed = 0
+    cache_counts = {"hits": 0, "misses": 0, "writes": 0}
+    per_song = []
+    peak_cache_dir = peak_cache.root if peak_cache is not None else None
+    start = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - start
+        print(
+            f"{songs} songs, {landmarks} landmarks in {elapsed:.1f}s "
+            f"({songs / elapsed:.2f} songs/s, {landmarks / elapsed:.0f} landmarks/s)",
+            flush=True,
+        )
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}            # future -> entry, so failures can name the file
+        queue = iter(todo)
+
+        while True:
+            # keep a bounded number of songs in flight
+            for entry in queue:
+                future = pool.submit(
+                    _fingerprint_job, entry, max_postings_per_hash, peak_cache_dir,
+                    frontend, peaks_per_sec,
+                )
+                pending[future] = entry
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry = pending.pop(future)
+                try:
+                    entry, hashes, t_anchors, cache_stats = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(
+                        f"failed to fingerprint {entry['path']} (song_id {entry['song_id']}): {e}",
+                        flush=True,
+                    )
+                    continue
+
+                if cache_stats is not None:
+                    # each worker's PeakCache only saw this one file
+                    for key in cache_counts:
+                        cache_counts[key] += cache_stats[key]
+
+                song_id = entry["song_id"]
+
+                # remnants of a run that crashed mid-song
+                fingerprints_col.delete_many({"song_id": song_id})
+
+                metadata = {k: v for k, v in entry.items() if k != "path"}
+                defaults = {}
+                if "title" not in metadata:
+                    # without a songs document /identify reports "No Match"
+                    defaults["title"] = os.path.splitext(os.path.basename(entry["path"]))[0]
+                update = {"$set": metadata}
+                if defaults:
+                    update["$setOnInsert"] = defaults
+                songs_col.update_one({"song_id": song_id}, update, upsert=True)
+
+                writer.add(song_id, fingerprint_docs(song_id, hashes, t_anchors))
+                songs += 1
+                landmarks += len(hashes)
+                per_song.append(len(hashes))
+                if songs % 10 == 0:
+                    report()
+
+    writer.close()
+    report()
+
+    result = {
+        "songs": songs,
+        "landmarks": landmarks,
+        "failed": failed,
+        "elapsed_sec": round(time.perf_counter() - start, 2),
+    }
+    if per_song:
+        result["landmarks_per_song"] = {
+            "p50": int(np.percentile(per_song, 50)),
+            "p95": int(np.percentile(per_song, 95)),
+            "max": max(per_song),
+        }
+    if peak_cache is not None:
+        peak_cache.hits += cache_counts["hits"]
+        peak_cache.misses += cache_counts["misses"]
+        peak_cache.writes += cache_counts["writes"]
+        peak_cache.evict()
+        result["peak_cache"] = peak_cache.report()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", nargs="?", help="directory to walk for audio files")
+    parser.add_argument("--manifest", help="JSONL file with path and song_id per line")
+    parser.add_argument("--checkpoint", default=".bulk_index.done")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-postings-per-hash", type=int, default=MAX_POSTINGS_PER_HASH)
+    parser.add_argument("--index-file", metavar="DIR", help="write a memory-mapped index afterwards")
+    parser.add_argument("--frontend", choices=sorted(FRONTENDS), default=DEFAULT_FRONTEND)
+    parser.add_argument("--peaks-per-sec", type=float, help="peak budget per second of audio")
+    parser.add_argument("--peak-cache", metavar="DIR", help="cache spectral peaks in DIR")
+    parser.add_argument("--peak-cache-mb", type=float, default=1024, help="peak cache size limit")
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+
+    entries = (
+        catalog_from_manifest(args.manifest) if args.manifest
+        else catalog_from_dir(args.directory)
+    )
+
+    peak_cache = (
+        PeakCache(args.peak_cache, int(args.peak_cache_mb * 1e6)) if args.peak_cache else None
+    )
+
+    print(bulk_index(
+        list(entries), args.checkpoint, args.workers,
+        args.batch_size, args.max_postings_per_hash, peak_cache, args.frontend, args.peaks_per_sec,
+    ))
+
+    if args.index_file:
+        InvertedIndex.from_collection(fingerprints_col).save(args.index_file)
+        print(f"index file written to {args.index_file}")
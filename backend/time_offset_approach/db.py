@@ -1,3 +1,4 @@
+import logging
 import os
 from pathlib import Path
 from pymongo.mongo_client import MongoClient
@@ -14,20 +15,31 @@ uri = os.getenv("MONGO_URI")
 if not uri:
     raise RuntimeError("MONGO_URI is not set")
 
+logger = logging.getLogger(__name__)
+
 # Create MongoDB client
 client = MongoClient(uri, server_api=ServerApi("1"))
 
 # Optional: ping only for local debug
 try:
     client.admin.command("ping")
-    print("MongoDB connected")
+    logger.info("MongoDB connected")
 except Exception as e:
-    print("MongoDB connection failed:", e)
+    logger.error("MongoDB connection failed: %s", e)
 
 db = client.audio_matcher
 
 songs_col = db.songs
-fingerprints_col = db.fingerprints
+# one collection per index; FINGERPRINTS_COLLECTION picks e.g. a mel-front-end index
+fingerprints_col = db[os.getenv("FINGERPRINTS_COLLECTION", "fingerprints")]
+# document frequencies are per index too: "hash_stats" for the default
+# collection, "<collection>_hash_stats" for any other
+hash_stats_col = db[
+    "hash_stats" if fingerprints_col.name == "fingerprints" else f"{fingerprints_col.name}_hash_stats"
+]
+spotify_cache_col = db.spotify_cache
+# per fingerprints collection settings, see index_to_db.index_settings
+index_meta_col = db.index_meta
 
 
 
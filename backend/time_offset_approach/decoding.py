@@ -0,0 +1,230 @@
+"""
+Decode uploaded audio straight into a NumPy array.
+
+The upload bytes are piped into ffmpeg's stdin and ffmpeg writes raw mono
+float32 PCM at the target rate to stdout, so nothing touches the disk and
+the samples are resampled exactly once (by ffmpeg).
+
+Containers that need a seekable input (mp4/m4a with the moov atom at the
+end, as written by most phones) cannot be demuxed from a pipe. For those
+ffmpeg fails and the bytes are retried through a temporary file; the output
+still comes back over the pipe.
+"""
+
+import asyncio
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+from spectogram import SAMPLE_RATE
+
+
+def _ffmpeg_cmd(src, sr):
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", src,
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1",          # mono
+        "-ar", str(sr),      # resample once, here
+        "pipe:1",
+    ]
+
+
+def _to_samples(pcm):
+    # copy so the array is writable and owns its memory
+    return np.frombuffer(pcm, dtype=np.float32).copy()
+
+
+def _write_temp(data, suffix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir="/tmp") as tmp:
+        tmp.write(data)
+        return tmp.name
+
+
+def decode_bytes(data, sr=SAMPLE_RATE, suffix=".bin"):
+    """
+    Encoded audio bytes -> mono float32 samples at `sr`.
+
+    Parameters:
+        data (bytes): the uploaded file contents
+        sr (int): target sample rate
+        suffix (str): file extension, only used for the temp-file fallback
+
+    Returns:
+        tuple: (samples, sr)
+
+    Raises:
+        subprocess.CalledProcessError: if ffmpeg cannot decode the input
+    """
+
+    proc = subprocess.run(
+        _ffmpeg_cmd("pipe:0", sr), input=data,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    if proc.returncode == 0:
+        return _to_samples(proc.stdout), sr
+
+    # non-streamable container, let ffmpeg seek in a real file
+    tmp_path = _write_temp(data, suffix)
+    try:
+        proc = subprocess.run(
+            _ffmpeg_cmd(tmp_path, sr),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        )
+    finally:
+        os.remove(tmp_path)
+
+    return _to_samples(proc.stdout), sr
+
+
+def decode_file_chunks(path, sr=SAMPLE_RATE, chunk_sec=30.0):
+    """
+    Decode a (possibly hours long) file piece by piece, so the whole
+    recording never has to be in memory at once.
+
+    Yields:
+        np.ndarray (float32): chunk_sec of samples at a time, the last
+            chunk shorter
+
+    Raises:
+        subprocess.CalledProcessError: if ffmpeg cannot decode the file
+    """
+
+    cmd = _ffmpeg_cmd(path, sr)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    chunk_bytes = int(chunk_sec * sr) * 4
+    try:
+        while True:
+            pcm = proc.stdout.read(chunk_bytes)
+            if not pcm:
+                break
+            yield _to_samples(pcm[:len(pcm) // 4 * 4])
+    finally:
+        # stopping early closes the pipe, and ffmpeg exits on the next write
+        proc.stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+async def _run_ffmpeg(cmd, data=None):
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        out, _ = await proc.communicate(data)
+    except BrokenPipeError:
+        # ffmpeg gave up and closed stdin before reading everything
+        out = b""
+        await proc.wait()
+    return proc.returncode, out
+
+
+async def decode_bytes_async(data, sr=SAMPLE_RATE, suffix=".bin"):
+    """
+    Same as decode_bytes, without blocking the event loop.
+
+    Raises:
+        subprocess.CalledProcessError: if ffmpeg cannot decode the input
+    """
+
+    returncode, pcm = await _run_ffmpeg(_ffmpeg_cmd("pipe:0", sr), data)
+    if returncode == 0:
+        return _to_samples(pcm), sr
+
+    tmp_path = _write_temp(data, suffix)
+    try:
+        cmd = _ffmpeg_cmd(tmp_path, sr)
+        returncode, pcm = await _run_ffmpeg(cmd)
+    finally:
+        os.remove(tmp_path)
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+    return _to_samples(pcm), sr
+
+
+
+class StreamDecoder:
+    """
+    One long-running ffmpeg process for audio that arrives in pieces
+    (e.g. MediaRecorder chunks over a WebSocket).
+
+    feed() writes encoded bytes to ffmpeg's stdin; read() returns whatever
+    PCM ffmpeg has produced so far. Only the first piece needs to carry the
+    container header. Once ffmpeg has given up on the input, feed() raises
+    BrokenPipeError or ConnectionResetError.
+    """
+
+    def __init__(self, sr=SAMPLE_RATE):
+        self.sr = sr
+        self.proc = None
+        self._pcm = bytearray()
+        self._reader = None
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *_ffmpeg_cmd("pipe:0", self.sr),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read_loop())
+        return self
+
+    async def _read_loop(self):
+        while True:
+            data = await self.proc.stdout.read(1 << 16)
+            if not data:
+                break
+            self._pcm.extend(data)
+
+    async def feed(self, data):
+        self.proc.stdin.write(data)
+        await self.proc.stdin.drain()
+
+    def read(self):
+        """
+        Returns:
+            np.ndarray (float32): samples decoded since the last read()
+        """
+
+        # a read can stop mid-sample, keep the partial bytes for next time
+        n = len(self._pcm) // 4 * 4
+        samples = _to_samples(bytes(self._pcm[:n]))
+        del self._pcm[:n]
+        return samples
+
+    async def close(self):
+        """
+        Signal end of input and wait for ffmpeg to flush.
+
+        Returns:
+            np.ndarray (float32): the remaining samples
+        """
+
+        self.proc.stdin.close()
+        await self._reader
+        await self.proc.wait()
+        return self.read()
+
+    def kill(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+if __name__ == "__main__":
+    import sys
+
+    with open(sys.argv[1], "rb") as f:
+        samples, sr = decode_bytes(f.read(), suffix=os.path.splitext(sys.argv[1])[1])
+    print(f"{len(samples)} samples, {len(samples) / sr:.1f}s at {sr} Hz")
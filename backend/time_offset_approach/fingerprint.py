@@ -0,0 +1,229 @@
+"""
+Layered fingerprinting API:
+
+    samples -> spectrogram -> peaks -> landmarks -> hashes
+
+Every stage takes and returns arrays, so callers can decode once (or pass
+samples from decoding.decode_bytes), keep intermediate results and re-run
+only the later stages with different settings:
+
+    y, sr = load_audio(path)
+    S_db = spectrogram(y, sr)
+    times, freqs = peaks(S_db, sr)
+    lm = landmarks(times, freqs)
+    hashes, t_anchors = hashes_from_landmarks(lm)
+
+The spectrogram stage has several front-ends (see FRONTENDS): the full
+linear STFT, or a band-limited mel or constant-Q spectrogram with far
+fewer bins. Peaks from every front-end come out in seconds and Hz, so
+landmarks and hashes are unchanged, but hashes from different front-ends
+do not match each other: an index and its queries must use the same one
+(index_to_db.index_settings records it per fingerprint collection).
+
+With peaks_per_sec set, peak picking keeps the loudest peaks of every
+DENSITY_WINDOW_SEC of audio up to that budget (see density_kwargs), so
+the postings per song, and the postings a query fetches, grow with the
+song's length rather than with how loud or dense its master is.
+
+Kept free of any database import so it can run in worker processes.
+"""
+
+import time
+
+import numpy as np
+import librosa
+
+from spectogram import (
+    SAMPLE_RATE, load_audio, compute_spectogram, compute_mel_spectogram, compute_cqt_spectogram,
+)
+from peak_picking import peak_bins_from_spectogram, peaks_from_bins
+from landmark_generation import landmarks_from_peaks
+from hashing import hash_landmarks
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# spectrogram settings and default peak neighbourhood per front-end; the
+# neighbourhood shrinks with the bin count so it spans a similar band
+FRONTENDS = {
+    # 1025 linear bins, 0 Hz - Nyquist
+    "stft": {"spectrogram": {}, "neighborhood_size": 15},
+    # 96 mel bands, 300 Hz - 5 kHz
+    "mel": {"spectrogram": {"n_bins": 96, "fmin": 300.0, "fmax": 5000.0}, "neighborhood_size": 9},
+    # 48 semitone bins, 300 Hz - 4.8 kHz
+    "cqt": {"spectrogram": {"n_bins": 48, "bins_per_octave": 12, "fmin": 300.0}, "neighborhood_size": 5},
+}
+DEFAULT_FRONTEND = "stft"
+
+# target-density mode: budget window, and the loudness floor that replaces
+# the -40 dB threshold so quiet passages can still fill their budget
+DENSITY_WINDOW_SEC = 1.0
+DENSITY_THRESHOLD_DB = -60
+
+
+def check_frontend(frontend):
+    """
+    Raises:
+        ValueError: if frontend is not one of FRONTENDS
+    """
+
+    if frontend not in FRONTENDS:
+        raise ValueError(f"unknown frontend {frontend!r}, expected one of {sorted(FRONTENDS)}")
+    return frontend
+
+
+def band_frequencies(frontend, sr, n_fft=N_FFT):
+    """
+    Centre frequency in Hz of every spectrogram row of a front-end.
+    """
+
+    settings = FRONTENDS[check_frontend(frontend)]["spectrogram"]
+    if frontend == "mel":
+        # melspectrogram's bands are centred on the inner points of n_bins + 2
+        edges = librosa.mel_frequencies(settings["n_bins"] + 2, fmin=settings["fmin"], fmax=settings["fmax"])
+        return edges[1:-1]
+    if frontend == "cqt":
+        return librosa.cqt_frequencies(
+            settings["n_bins"], fmin=settings["fmin"], bins_per_octave=settings["bins_per_octave"],
+        )
+    return librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+
+
+def density_kwargs(peaks_per_sec, sr, hop_length=HOP_LENGTH):
+    """
+    Peak-picking settings for a budget of peaks_per_sec, see
+    peak_picking.peak_bins_from_spectogram. None gives {} (fixed threshold).
+    """
+
+    if peaks_per_sec is None:
+        return {}
+    return {
+        "max_peaks_per_window": max(1, int(round(peaks_per_sec * DENSITY_WINDOW_SEC))),
+        "window_frames": max(1, int(round(DENSITY_WINDOW_SEC * sr / hop_length))),
+        "threshold_db": DENSITY_THRESHOLD_DB,
+    }
+
+
+def spectrogram(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, frontend=DEFAULT_FRONTEND):
+    """
+    Mono samples -> dB magnitude spectrogram (band x time).
+    """
+
+    settings = FRONTENDS[check_frontend(frontend)]["spectrogram"]
+    if frontend == "mel":
+        S_db, _ = compute_mel_spectogram(y, sr, n_fft=n_fft, hop_length=hop_length, **settings)
+    elif frontend == "cqt":
+        S_db, _ = compute_cqt_spectogram(y, sr, hop_length=hop_length, **settings)
+    else:
+        S_db, _ = compute_spectogram(y, sr, n_fft=n_fft, hop_length=hop_length)
+    return S_db
+
+
+def peak_bins(S_db, frontend=DEFAULT_FRONTEND, **peak_kwargs):
+    """
+    Spectrogram -> peak (band, frame) indices, with the front-end's
+    neighbourhood unless peak_kwargs set one.
+    """
+
+    peak_kwargs.setdefault("neighborhood_size", FRONTENDS[check_frontend(frontend)]["neighborhood_size"])
+    return peak_bins_from_spectogram(S_db, **peak_kwargs)
+
+
+def bins_to_peaks(freq_idxs, time_idxs, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, frontend=DEFAULT_FRONTEND):
+    """
+    Peak indices -> (times, freqs) in seconds and Hz.
+    """
+
+    if frontend == "stft":
+        return peaks_from_bins(freq_idxs, time_idxs, sr, n_fft, hop_length)
+
+    times = librosa.frames_to_time(time_idxs, sr=sr, hop_length=hop_length)
+    freqs = band_frequencies(frontend, sr, n_fft)[np.asarray(freq_idxs, dtype=np.int64)]
+    return times, freqs
+
+
+def peaks(
+    S_db, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, frontend=DEFAULT_FRONTEND, peaks_per_sec=None,
+    **peak_kwargs,
+):
+    """
+    Spectrogram -> peak (times, freqs) arrays.
+
+    peak_kwargs go to peak_picking.peak_bins_from_spectogram
+    (neighborhood_size, threshold_db, max_peaks_per_frame,
+    max_peaks_per_band) and override what peaks_per_sec sets. `frontend`
+    must be the one S_db was computed with.
+    """
+
+    peak_kwargs = {**density_kwargs(peaks_per_sec, sr, hop_length), **peak_kwargs}
+    freq_idxs, time_idxs = peak_bins(S_db, frontend, **peak_kwargs)
+    return bins_to_peaks(freq_idxs, time_idxs, sr, n_fft, hop_length, frontend)
+
+
+def landmarks(times, freqs, fanout=5, max_dt=2.0):
+    """
+    Peak arrays -> landmark array, see landmark_generation.LANDMARK_DTYPE.
+    """
+
+    return landmarks_from_peaks(times, freqs, fanout, max_dt)
+
+
+def hashes_from_landmarks(lm):
+    """
+    Landmark array -> (hashes, t_anchors) parallel arrays.
+    """
+
+    return hash_landmarks(lm), lm["t_anchor"]
+
+
+def fingerprint_samples(y, sr, frontend=DEFAULT_FRONTEND, peaks_per_sec=None):
+    """
+    Decoded mono samples -> packed hashes with their anchor times.
+
+    Returns:
+        tuple: (hashes, t_anchors) parallel arrays
+    """
+
+    S_db = spectrogram(y, sr, frontend=frontend)
+    return hashes_from_landmarks(landmarks(*peaks(S_db, sr, frontend=frontend, peaks_per_sec=peaks_per_sec)))
+
+
+def fingerprint_samples_timed(y, sr, frontend=DEFAULT_FRONTEND, peaks_per_sec=None):
+    """
+    fingerprint_samples, also timing each stage (for request metrics).
+
+    Returns:
+        tuple: (hashes, t_anchors, timings) where timings maps stft,
+            peaks, landmarks, hashing to seconds
+    """
+
+    timings = {}
+    start = time.perf_counter()
+    S_db = spectrogram(y, sr, frontend=frontend)
+    timings["stft"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    times, freqs = peaks(S_db, sr, frontend=frontend, peaks_per_sec=peaks_per_sec)
+    timings["peaks"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lm = landmarks(times, freqs)
+    timings["landmarks"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hashes, t_anchors = hashes_from_landmarks(lm)
+    timings["hashing"] = time.perf_counter() - start
+
+    return hashes, t_anchors, timings
+
+
+def fingerprint_file(audio_path, frontend=DEFAULT_FRONTEND, peaks_per_sec=None):
+    """
+    Audio file -> packed hashes with their anchor times.
+
+    Returns:
+        tuple: (hashes, t_anchors) parallel arrays
+    """
+
+    y, sr = load_audio(audio_path, sr=SAMPLE_RATE)
+    return fingerprint_samples(y, sr, frontend, peaks_per_sec)
@@ -0,0 +1,133 @@
+"""
+Hash document-frequency table and stop-hash filtering.
+
+The hash_stats collection holds one document per hash, {_id: hash, df: n},
+where df is the number of songs containing that hash. Hashes with df above
+a configurable limit (low-frequency drones, silence artifacts) match a large
+share of the catalog without telling songs apart; they are "stop-hashes" and
+are dropped from queries before the lookup.
+
+Build the table once from the fingerprints collection:
+
+    python hash_stats.py --rebuild
+
+after that /upload keeps it up to date incrementally.
+"""
+
+import numpy as np
+from pymongo import UpdateOne
+
+# per-song cap on postings of one hash, applied when a song is indexed
+MAX_POSTINGS_PER_HASH = 50
+
+
+def cap_repeats(hashes, limit=MAX_POSTINGS_PER_HASH):
+    """
+    Keep at most `limit` occurrences of each hash, earliest first.
+
+    Parameters:
+        hashes (array): hash per landmark, in time order
+
+    Returns:
+        np.ndarray (bool): mask of landmarks to keep
+    """
+
+    hashes = np.asarray(hashes)
+    if limit is None or len(hashes) == 0:
+        return np.ones(len(hashes), dtype=bool)
+
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[order[rank < limit]] = True
+    return keep
+
+
+def rebuild_hash_stats(fingerprints, stats):
+    """
+    Recompute the whole df table from the fingerprints collection.
+
+    Runs server-side: group to distinct (hash, song_id), count songs per
+    hash and $merge the result into the stats collection.
+    """
+
+    stats.delete_many({})
+    fingerprints.aggregate([
+        {"$group": {"_id": {"hash": "$hash", "song_id": "$song_id"}}},
+        {"$group": {"_id": "$_id.hash", "df": {"$sum": 1}}},
+        {"$merge": {"into": stats.name, "whenMatched": "replace"}},
+    ], allowDiskUse=True)
+
+
+class StopHashTable:
+    """
+    In-memory set of stop-hashes, backed by the hash_stats collection.
+
+    Only hashes over max_df are held in memory, as a sorted array.
+    """
+
+    def __init__(self, stats, max_df):
+        self.stats = stats
+        self.max_df = max_df
+        self.hashes = np.empty(0, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def load(self):
+        cursor = self.stats.find({"df": {"$gt": self.max_df}}, {"_id": 1})
+        self.hashes = np.unique(np.array([d["_id"] for d in cursor], dtype=np.uint32))
+        return self
+
+    def add_song(self, hashes):
+        """
+        Count a newly indexed song and pick up hashes that crossed max_df.
+
+        Parameters:
+            hashes (array): the song's hashes (duplicates are fine)
+        """
+
+        song_hashes = np.unique(np.asarray(hashes, dtype=np.uint32)).tolist()
+        if not song_hashes:
+            return
+
+        self.stats.bulk_write(
+            [UpdateOne({"_id": h}, {"$inc": {"df": 1}}, upsert=True) for h in song_hashes],
+            ordered=False,
+        )
+
+        crossed = self.stats.find(
+            {"_id": {"$in": song_hashes}, "df": {"$gt": self.max_df}}, {"_id": 1}
+        )
+        new = np.array([d["_id"] for d in crossed], dtype=np.uint32)
+        if len(new):
+            self.hashes = np.union1d(self.hashes, new)
+
+    def keep_mask(self, hashes):
+        """
+        Returns:
+            np.ndarray (bool): False where the hash is a stop-hash
+        """
+
+        return ~np.isin(hashes, self.hashes)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import fingerprints_col, hash_stats_col
+
+    parser = argparse.ArgumentParser(description="hash document-frequency table")
+    parser.add_argument("--rebuild", action="store_true", help="recompute from fingerprints")
+    parser.add_argument("--max-df", type=int, default=None, help="report stop-hashes over this df")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_hash_stats(fingerprints_col, hash_stats_col)
+
+    print(f"{hash_stats_col.count_documents({})} distinct hashes")
+    if args.max_df is not None:
+        table = StopHashTable(hash_stats_col, args.max_df).load()
+        print(f"{len(table)} stop-hashes with df > {args.max_df}")
@@ -1,5 +1,25 @@
+import numpy as np
+
+# Packed hash layout (unsigned 32-bit):
+#
+#   bits 31..20  f1_bin   (12 bits, 0..4095)
+#   bits 19..8   f2_bin   (12 bits, 0..4095)
+#   bits  7..0   dt_bin   ( 8 bits, 0..255)
+#
+# With the defaults (freq_bin=10 Hz, time_bin=0.1 s) that covers anchors and
+# targets up to 40.9 kHz and time deltas up to 25.5 s, well past the 11 kHz
+# Nyquist of 22050 Hz audio and max_dt=2.0. Mongo stores the value as a
+# plain integer, so the hash index holds 8-byte keys instead of strings.
+F_BITS = 12
+DT_BITS = 8
+F2_SHIFT = DT_BITS
+F1_SHIFT = DT_BITS + F_BITS
+F_MASK = (1 << F_BITS) - 1
+DT_MASK = (1 << DT_BITS) - 1
+
+
 def hash_landmark(f1, f2, dt, freq_bin=10, time_bin=0.1):
-    
+
     """
     Convert a landmark into a hash key.
 
@@ -20,3 +40,69 @@ def hash_landmark(f1, f2, dt, freq_bin=10, time_bin=0.1):
 
     return (f1_bin, f2_bin, dt_bin)
 
+
+def pack_hash(f1_bin, f2_bin, dt_bin):
+    """
+    Pack (f1_bin, f2_bin, dt_bin) into one integer, see layout above.
+
+    Raises:
+        ValueError: if a component does not fit its bit field
+    """
+
+    if not (0 <= f1_bin <= F_MASK and 0 <= f2_bin <= F_MASK and 0 <= dt_bin <= DT_MASK):
+        raise ValueError(f"hash components out of range: {(f1_bin, f2_bin, dt_bin)}")
+
+    return (f1_bin << F1_SHIFT) | (f2_bin << F2_SHIFT) | dt_bin
+
+
+def unpack_hash(h):
+    """
+    Inverse of pack_hash.
+
+    Returns:
+        tuple: (f1_bin, f2_bin, dt_bin)
+    """
+
+    return ((h >> F1_SHIFT) & F_MASK, (h >> F2_SHIFT) & F_MASK, h & DT_MASK)
+
+
+def parse_hash_string(h_str):
+    """
+    Convert a legacy "f1_f2_dt" hash string into the packed integer form.
+    """
+
+    f1_bin, f2_bin, dt_bin = (int(part) for part in h_str.split("_"))
+    return pack_hash(f1_bin, f2_bin, dt_bin)
+
+
+def hash_landmarks(landmarks, freq_bin=10, time_bin=0.1):
+    """
+    Vectorized hash_landmark + pack_hash over an array of landmarks.
+
+    Parameters:
+        landmarks (np.ndarray): structured array with f1, f2, dt fields
+            (see landmark_generation.LANDMARK_DTYPE)
+        freq_bin (int): frequency bin size (Hz)
+        time_bin (float): time bin size (seconds)
+
+    Returns:
+        np.ndarray (uint32): packed hash per landmark
+
+    Raises:
+        ValueError: if any component does not fit its bit field
+    """
+
+    # floor_divide on floats follows Python's // exactly
+    f1_bin = np.floor_divide(landmarks["f1"], freq_bin).astype(np.int64)
+    f2_bin = np.floor_divide(landmarks["f2"], freq_bin).astype(np.int64)
+    dt_bin = np.floor_divide(landmarks["dt"], time_bin).astype(np.int64)
+
+    if len(landmarks) and (
+        f1_bin.min() < 0 or f1_bin.max() > F_MASK
+        or f2_bin.min() < 0 or f2_bin.max() > F_MASK
+        or dt_bin.min() < 0 or dt_bin.max() > DT_MASK
+    ):
+        raise ValueError("hash components out of range for the packed layout")
+
+    packed = (f1_bin << F1_SHIFT) | (f2_bin << F2_SHIFT) | dt_bin
+    return packed.astype(np.uint32)
@@ -1,24 +1,103 @@
 import os
-from db import songs_col, fingerprints_col
-from landmark_generation import generate_landmarks
-from hashing import hash_landmark
+from db import songs_col, fingerprints_col, index_meta_col
+from fingerprint import fingerprint_file, check_frontend, DEFAULT_FRONTEND
+from hash_stats import cap_repeats, MAX_POSTINGS_PER_HASH
 
 # SONGS_DIR = "../chromaprint approach/known_songs"
 
-def index_song(song_path, song_id):
-    landmarks = generate_landmarks(song_path)
+def fingerprint_docs(song_id, hashes, t_anchors):
+    """
+    One fingerprints-collection document per landmark.
+    """
+    # tolist() gives plain ints/floats, which is what BSON can encode
+    return [
+        {"hash": h, "song_id": song_id, "t_anchor": t_anchor}
+        for h, t_anchor in zip(hashes.tolist(), t_anchors.tolist())
+    ]
+
+
+def index_settings(collection=fingerprints_col, default_frontend=DEFAULT_FRONTEND):
+    """
+    The fingerprint settings a fingerprints collection was built with, and
+    that queries against it must use:
+
+        frontend: spectrogram front-end, see fingerprint.FRONTENDS
+        peaks_per_sec: peak budget, None for the fixed -40 dB threshold
+
+    Collections from before settings were recorded are STFT ones without
+    a budget.
+    """
+    doc = index_meta_col.find_one({"_id": collection.name}) or {}
+    return {
+        "frontend": doc.get("frontend", default_frontend),
+        "peaks_per_sec": doc.get("peaks_per_sec"),
+    }
+
+
+def index_frontend(collection=fingerprints_col, default=DEFAULT_FRONTEND):
+    return index_settings(collection, default)["frontend"]
+
+
+def record_index_settings(frontend, peaks_per_sec=None, collection=fingerprints_col):
+    """
+    Record the settings of a fingerprints collection before writing to it.
 
-    docs = []
-    for f1, f2, dt, t_anchor in landmarks:
-        h = hash_landmark(f1, f2, dt)
-        docs.append({
-            "hash": f"{h[0]}_{h[1]}_{h[2]}",
-            "song_id": song_id,
-            "t_anchor": t_anchor
-        })
+    Raises:
+        ValueError: if the collection already holds fingerprints made with
+            different settings; other front-ends never match, and mixed
+            peak budgets would defeat the bounded index size
+    """
+    check_frontend(frontend)
+    settings = {"frontend": frontend, "peaks_per_sec": peaks_per_sec}
+
+    current = index_meta_col.find_one({"_id": collection.name})
+    if current is None and collection.estimated_document_count() > 0:
+        current = {"frontend": DEFAULT_FRONTEND}
+    if current is not None:
+        current = {k: current.get(k) for k in settings}
+        if current != settings:
+            raise ValueError(
+                f"{collection.name} holds fingerprints made with {current}, not {settings}; "
+                "use another FINGERPRINTS_COLLECTION"
+            )
+    index_meta_col.update_one({"_id": collection.name}, {"$set": settings}, upsert=True)
 
+
+def store_fingerprints(
+    song_id,
+    hashes,
+    t_anchors,
+    max_postings_per_hash=MAX_POSTINGS_PER_HASH,
+    collection=fingerprints_col,
+):
+    """
+    Store an already fingerprinted song in the fingerprints collection
+    (or in a sharding.ShardedStore passed as `collection`).
+
+    A hash repeated more than max_postings_per_hash times within the song
+    (sustained drones) only keeps its first occurrences. None disables the cap.
+
+    Returns:
+        tuple: (hashes, t_anchors) arrays that were stored, so callers can
+            update in-memory indexes without re-reading Mongo
+    """
+    keep = cap_repeats(hashes, max_postings_per_hash)
+    hashes, t_anchors = hashes[keep], t_anchors[keep]
+
+    docs = fingerprint_docs(song_id, hashes, t_anchors)
     if docs:
-        fingerprints_col.insert_many(docs)
+        collection.insert_many(docs)
+
+    return hashes, t_anchors
+
+
+def index_song(song_path, song_id, max_postings_per_hash=MAX_POSTINGS_PER_HASH):
+    """
+    Fingerprint a song file with the fingerprints collection's settings
+    and store it, see store_fingerprints.
+    """
+    hashes, t_anchors = fingerprint_file(song_path, **index_settings())
+    return store_fingerprints(song_id, hashes, t_anchors, max_postings_per_hash)
 
 
 if __name__ == "__main__":
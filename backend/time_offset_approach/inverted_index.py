@@ -0,0 +1,365 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from hashing import parse_hash_string
+
+# one posting per stored landmark, packed to 12 bytes (no alignment padding)
+POSTING_DTYPE = np.dtype([("song_idx", np.uint32), ("t_anchor", np.float64)])
+
+# merge pending uploads into the main arrays once they grow this large
+COMPACT_THRESHOLD = 500_000
+
+
+def _build_csr(hashes, postings):
+    """
+    Sort postings by hash and build the (keys, offsets) lookup table.
+
+    Returns:
+        tuple: (keys, offsets, postings) where postings for keys[i] are
+            postings[offsets[i]:offsets[i + 1]]
+    """
+
+    order = np.argsort(hashes, kind="stable")
+    keys, counts = np.unique(hashes[order], return_counts=True)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return keys.astype(np.uint32), offsets, postings[order]
+
+
+def gather_ranges(starts, ends):
+    """
+    Concatenate the index ranges [starts[i], ends[i]) without a Python loop.
+
+    Returns:
+        tuple: (indices, owner) where owner[j] is the range indices[j] came from
+    """
+
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    range_start = np.cumsum(lengths) - lengths
+    indices = np.arange(total) - range_start[owner] + starts[owner]
+    return indices, owner
+
+
+class InvertedIndex:
+    """
+    In-process hash -> postings index, with Mongo as cold storage.
+
+    Postings live in one sorted array (CSR layout: sorted unique keys plus an
+    offsets table), so a lookup is a searchsorted over the query hashes
+    followed by contiguous slices. Songs added after startup go to a small
+    pending buffer and are merged in once it passes COMPACT_THRESHOLD.
+    """
+
+    def __init__(self):
+        self.song_ids = []          # song_idx -> song_id
+        self._song_idx = {}         # song_id -> song_idx
+
+        self._keys = np.empty(0, dtype=np.uint32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.empty(0, dtype=POSTING_DTYPE)
+
+        self._pending_hashes = np.empty(0, dtype=np.uint32)
+        self._pending_postings = np.empty(0, dtype=POSTING_DTYPE)
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._postings) + len(self._pending_postings)
+
+    def _intern(self, song_id):
+        idx = self._song_idx.get(song_id)
+        if idx is None:
+            idx = len(self.song_ids)
+            self._song_idx[song_id] = idx
+            self.song_ids.append(song_id)
+        return idx
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=100_000):
+        """
+        Load every fingerprint document into memory.
+
+        Parameters:
+            collection: the fingerprints collection
+            batch_size (int): documents converted per numpy batch
+
+        Returns:
+            InvertedIndex
+        """
+
+        index = cls()
+        hash_parts, posting_parts = [], []
+        hashes, song_idx, t_anchor = [], [], []
+
+        def flush():
+            if not hashes:
+                return
+            hash_parts.append(np.array(hashes, dtype=np.uint32))
+            part = np.empty(len(hashes), dtype=POSTING_DTYPE)
+            part["song_idx"] = song_idx
+            part["t_anchor"] = t_anchor
+            posting_parts.append(part)
+            hashes.clear()
+            song_idx.clear()
+            t_anchor.clear()
+
+        cursor = collection.find(
+            {}, {"hash": 1, "song_id": 1, "t_anchor": 1, "_id": 0}
+        ).batch_size(batch_size)
+
+        for doc in cursor:
+            h = doc["hash"]
+            if isinstance(h, str):
+                # collection not migrated yet (see migrate_hashes.py)
+                h = parse_hash_string(h)
+            hashes.append(h)
+            song_idx.append(index._intern(doc["song_id"]))
+            t_anchor.append(doc["t_anchor"])
+
+            if len(hashes) >= batch_size:
+                flush()
+        flush()
+
+        if hash_parts:
+            index._keys, index._offsets, index._postings = _build_csr(
+                np.concatenate(hash_parts), np.concatenate(posting_parts)
+            )
+
+        return index
+
+    @classmethod
+    def from_arrays(cls, hashes, song_idx, t_anchors, song_ids):
+        """
+        Build an index from parallel posting arrays.
+
+        Parameters:
+            hashes (array): packed hash per posting
+            song_idx (array): index into song_ids per posting
+            t_anchors (array): anchor time per posting (seconds)
+            song_ids (list): song_idx -> song_id
+
+        Returns:
+            InvertedIndex
+        """
+
+        index = cls()
+        for song_id in song_ids:
+            index._intern(song_id)
+
+        postings = np.empty(len(hashes), dtype=POSTING_DTYPE)
+        postings["song_idx"] = song_idx
+        postings["t_anchor"] = t_anchors
+        index._keys, index._offsets, index._postings = _build_csr(
+            np.asarray(hashes, dtype=np.uint32), postings
+        )
+        return index
+
+    def add_song(self, song_id, hashes, t_anchors):
+        """
+        Add one song's landmarks (called after /upload writes them to Mongo).
+
+        Parameters:
+            song_id (str): song id as stored in Mongo
+            hashes (array): packed hashes, see hashing.hash_landmarks
+            t_anchors (array): anchor times in seconds, parallel to hashes
+        """
+
+        postings = np.empty(len(hashes), dtype=POSTING_DTYPE)
+        postings["t_anchor"] = t_anchors
+
+        with self._lock:
+            postings["song_idx"] = self._intern(song_id)
+            self._pending_hashes = np.concatenate(
+                (self._pending_hashes, np.asarray(hashes, dtype=np.uint32))
+            )
+            self._pending_postings = np.concatenate((self._pending_postings, postings))
+
+            if len(self._pending_postings) >= COMPACT_THRESHOLD:
+                self._compact()
+
+    def _compact(self):
+        # rebuild from the expanded main arrays + pending; caller holds the lock
+        main_hashes = np.repeat(self._keys, np.diff(self._offsets))
+        self._keys, self._offsets, self._postings = _build_csr(
+            np.concatenate((main_hashes, self._pending_hashes)),
+            np.concatenate((self._postings, self._pending_postings)),
+        )
+        self._pending_hashes = np.empty(0, dtype=np.uint32)
+        self._pending_postings = np.empty(0, dtype=POSTING_DTYPE)
+
+    def lookup(self, query_hashes):
+        """
+        Fetch every posting whose hash is in query_hashes.
+
+        Parameters:
+            query_hashes (array-like): packed hashes (duplicates are fine)
+
+        Returns:
+            tuple of arrays: (hash, song_idx, t_anchor), one row per posting.
+                Map song_idx back with index.song_ids.
+        """
+
+        query = np.unique(np.asarray(query_hashes, dtype=np.uint32))
+
+        # swap-in is atomic per attribute, but read a consistent set
+        with self._lock:
+            keys, offsets, postings = self._keys, self._offsets, self._postings
+            pending_hashes, pending_postings = self._pending_hashes, self._pending_postings
+
+        pos = np.searchsorted(keys, query)
+        found = pos < len(keys)
+        found[found] = keys[pos[found]] == query[found]
+        pos = pos[found]
+
+        rows, owner = gather_ranges(offsets[pos], offsets[pos + 1])
+        hashes = query[found][owner]
+        matched = postings[rows]
+
+        if len(pending_hashes):
+            in_query = np.isin(pending_hashes, query)
+            hashes = np.concatenate((hashes, pending_hashes[in_query]))
+            matched = np.concatenate((matched, pending_postings[in_query]))
+
+        return hashes, matched["song_idx"], matched["t_anchor"]
+
+    def save(self, path):
+        """
+        Write the index as a directory of .npy files plus song_ids.json.
+
+        keys.npy (sorted uint32 hashes), offsets.npy (int64) and
+        postings.npy (POSTING_DTYPE) are the CSR arrays as-is, so open()
+        can memory-map them.
+
+        `path` is a symlink to a complete sibling directory
+        (<path>.<random>). A new version is written in full next to it and
+        the link is swapped with os.replace, so `path` always names a
+        whole index. Processes that mapped the previous version keep their
+        mapping after its directory is removed. A plain directory left at
+        `path` by an older save() is moved aside first, the one time that
+        `path` briefly does not exist.
+        """
+
+        with self._lock:
+            keys, offsets, postings = self._keys, self._offsets, self._postings
+            if len(self._pending_postings):
+                keys, offsets, postings = _build_csr(
+                    np.concatenate((np.repeat(keys, np.diff(offsets)), self._pending_hashes)),
+                    np.concatenate((postings, self._pending_postings)),
+                )
+            song_ids = list(self.song_ids)
+
+        path = os.path.abspath(path.rstrip("/"))
+        parent, name = os.path.split(path)
+        os.makedirs(parent, exist_ok=True)
+
+        version = tempfile.mkdtemp(prefix=name + ".", dir=parent)
+        os.chmod(version, 0o755)   # mkdtemp is owner-only, other readers need it too
+        np.save(os.path.join(version, "keys.npy"), keys)
+        np.save(os.path.join(version, "offsets.npy"), offsets)
+        np.save(os.path.join(version, "postings.npy"), postings)
+        with open(os.path.join(version, "song_ids.json"), "w") as f:
+            json.dump(song_ids, f)
+
+        old = None
+        if os.path.islink(path):
+            old = os.path.join(parent, os.readlink(path))
+        elif os.path.isdir(path):
+            old = tempfile.mkdtemp(prefix=name + ".", dir=parent)
+            os.replace(path, old)
+
+        link = version + ".link"
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, path)
+
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map an index written by save().
+
+        Nothing is read up front: lookups binary-search the mapped keys and
+        read only the offset and posting pages they touch, and every worker
+        process mapping the same files shares them through the page cache.
+        Songs added later with add_song stay in memory. The link is
+        resolved once, so a concurrent save() cannot mix two versions.
+
+        Returns:
+            InvertedIndex
+        """
+
+        path = os.path.realpath(path)
+        index = cls()
+        index._keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+        index._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        index._postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "song_ids.json")) as f:
+            for song_id in json.load(f):
+                index._intern(song_id)
+        return index
+
+    def fetch_postings(self, query_hashes):
+        """
+        lookup() plus the song_ids table, in match_from_db.fetch_postings form.
+        """
+
+        hashes, song_idx, t_anchor = self.lookup(query_hashes)
+        return hashes, song_idx, t_anchor, self.song_ids
+
+    def memory_report(self):
+        """
+        Bytes held by the index arrays.
+
+        Arrays memory-mapped by open() are reported as mapped_bytes, not
+        heap_bytes: they live in the shared page cache and only the pages
+        lookups touch are resident, so they are not this process's RSS.
+
+        Returns:
+            dict: landmark/key/song counts, total, heap and mapped bytes
+                and MB per million landmarks
+        """
+
+        arrays = (self._keys, self._offsets, self._postings, self._pending_hashes, self._pending_postings)
+        nbytes = sum(a.nbytes for a in arrays)
+        mapped = sum(a.nbytes for a in arrays if isinstance(a, np.memmap))
+        landmarks = len(self)
+
+        return {
+            "landmarks": landmarks,
+            "unique_hashes": len(self._keys),
+            "songs": len(self.song_ids),
+            "bytes": nbytes,
+            "heap_bytes": nbytes - mapped,
+            "mapped_bytes": mapped,
+            "mb_per_million_landmarks": (
+                round(nbytes / landmarks * 1e6 / 2**20, 2) if landmarks else 0.0
+            ),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from db import fingerprints_col
+
+    parser = argparse.ArgumentParser(description="in-memory fingerprint index")
+    parser.add_argument("--save", metavar="DIR", help="write a memory-mappable index file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = InvertedIndex.from_collection(fingerprints_col)
+    print(f"loaded in {time.perf_counter() - start:.1f}s")
+    print(index.memory_report())
+
+    if args.save:
+        index.save(args.save)
+        print(f"saved to {args.save}")
@@ -1,47 +1,95 @@
+import logging
+import numpy as np
 from peak_picking import find_peaks
 
-def generate_landmarks(audio_path, fanout=5, max_dt=2.0):
-    # print("Landmark generation started", flush=True)
+logger = logging.getLogger(__name__)
 
-    peaks = find_peaks(audio_path)
+# one row per landmark: anchor freq, target freq, time delta, anchor time
+LANDMARK_DTYPE = np.dtype([
+    ("f1", np.float64),
+    ("f2", np.float64),
+    ("dt", np.float64),
+    ("t_anchor", np.float64),
+])
 
-    print(f"Peaks found: {len(peaks)}", flush=True)
 
+def landmarks_from_peaks(times, freqs, fanout=5, max_dt=2.0):
     """
-    Generate landmark pairs from peaks.
+    Pair peaks into landmarks without a Python loop.
+
+    Same semantics as the original nested loop: peaks are ordered by
+    time (stable, so equal times keep their input order), and every
+    anchor is paired with the first `fanout` peaks that are strictly
+    later and at most `max_dt` seconds away.
 
     Parameters:
-        peaks (list): [(time_sec, freq_hz), ...]
+        times (array): peak times in seconds
+        freqs (array): peak frequencies in Hz, parallel to `times`
         fanout (int): number of target peaks per anchor
         max_dt (float): maximum time difference in seconds
 
     Returns:
-        landmarks (list): [(f1, f2, delta_t), ...]
+        np.ndarray: structured array with LANDMARK_DTYPE,
+            ordered by anchor and then by target
     """
 
-    # Sort peaks by time
-    peaks = sorted(peaks, key=lambda x: x[0])
+    times = np.asarray(times, dtype=np.float64)
+    freqs = np.asarray(freqs, dtype=np.float64)
+
+    n = len(times)
+    if n == 0 or fanout <= 0:
+        return np.empty(0, dtype=LANDMARK_DTYPE)
+
+    order = np.argsort(times, kind="stable")
+    t = times[order]
+    f = freqs[order]
 
-    landmarks = []
+    # first peak that is strictly later than each anchor (dt <= 0 is skipped)
+    first = np.searchsorted(t, t, side="right")
 
-    for i, (t1, f1) in enumerate(peaks):
-        targets = 0
+    # candidate targets: (n, fanout) block of indices after `first`
+    cand = first[:, None] + np.arange(fanout)
+    valid = cand < n
+    np.minimum(cand, n - 1, out=cand)
 
-        for j in range(i + 1, len(peaks)):
-            t2, f2 = peaks[j]
-            dt = t2 - t1
+    # t is sorted, so the dt mask is a prefix of each row (same as `break`)
+    dt = t[cand] - t[:, None]
+    valid &= dt <= max_dt
 
-            if dt <= 0:
-                continue
-            if dt > max_dt:
-                break
+    # anchors repeat once per accepted target
+    targets_per_anchor = valid.sum(axis=1)
+
+    landmarks = np.empty(int(targets_per_anchor.sum()), dtype=LANDMARK_DTYPE)
+    landmarks["f1"] = np.repeat(f, targets_per_anchor)
+    landmarks["f2"] = f[cand[valid]]
+    landmarks["dt"] = dt[valid]
+    landmarks["t_anchor"] = np.repeat(t, targets_per_anchor)
+
+    return landmarks
+
+
+def generate_landmarks(audio_path, fanout=5, max_dt=2.0):
+    """
+    Generate landmark pairs for an audio file.
+
+    Parameters:
+        audio_path (str): path to the audio file
+        fanout (int): number of target peaks per anchor
+        max_dt (float): maximum time difference in seconds
+
+    Returns:
+        np.ndarray: structured array of (f1, f2, dt, t_anchor) rows,
+            see LANDMARK_DTYPE. Rows unpack like the old tuples.
+    """
+    # print("Landmark generation started", flush=True)
+
+    peaks = find_peaks(audio_path)
 
-            landmarks.append((f1, f2, dt, t1))
-            targets += 1
+    logger.debug("peaks found: %d", len(peaks))
 
-            if targets >= fanout:
-                break
+    peaks = np.asarray(peaks, dtype=np.float64).reshape(-1, 2)
+    landmarks = landmarks_from_peaks(peaks[:, 0], peaks[:, 1], fanout, max_dt)
 
-    print("landmarks are generated!")
+    logger.debug("landmarks generated: %d", len(landmarks))
 
     return landmarks
@@ -1,78 +1,283 @@
-from collections import defaultdict
-from db import fingerprints_col
-from landmark_generation import generate_landmarks
-from hashing import hash_landmark
+import numpy as np
+from fingerprint import fingerprint_file, fingerprint_samples, DEFAULT_FRONTEND
+from voting import (
+    vote_offsets, offset_histogram, shortlist, pick_best,
+    vote_on_postings, decide, OFFSET_ROUND, CANDIDATE_K,
+)
+from metrics import timed
 
-MAX_DB_MATCHES_PER_HASH = 50
 MIN_VOTES_TO_KEEP = 10
-OFFSET_ROUND = 2
 
-def identify_song(query_audio, min_vote_threshold=100, ratio_threshold=2.5):
-    query_landmarks = generate_landmarks(query_audio)
+def fetch_from_collection(collection, hashes):
+    """
+    One $in query on a fingerprints collection.
 
-    # 1. Group & deduplicate query hashes
-    query_hash_map = defaultdict(set)
-    for f1, f2, dt, t_query in query_landmarks:
-        h = hash_landmark(f1, f2, dt)
-        h_str = f"{h[0]}_{h[1]}_{h[2]}"
-        query_hash_map[h_str].add(round(t_query, OFFSET_ROUND))
+    Returns:
+        tuple: (hashes, song_idx, t_anchor, song_ids), see fetch_postings
+    """
 
-    votes = defaultdict(lambda: defaultdict(int))
+    # db lookup (only one queryy to  get all the hashes).
+    cursor = collection.find(
+        { "hash": { "$in": np.asarray(hashes).tolist() } },
+        { "hash": 1, "song_id": 1, "t_anchor": 1, "_id": 0 }
+    )
 
-    # 2. Batch DB lookup per hash
-    # for h_str, t_queries in query_hash_map.items():
-    #     matches = fingerprints_col.find(
-    #         { "hash": h_str },
-    #         { "song_id": 1, "t_anchor": 1, "_id": 0 }
-    #     ).limit(MAX_DB_MATCHES_PER_HASH)
+    song_ids, seen = [], {}
+    matched, song_idx, t_db = [], [], []
+    for m in cursor:
+        idx = seen.get(m["song_id"])
+        if idx is None:
+            idx = seen[m["song_id"]] = len(song_ids)
+            song_ids.append(m["song_id"])
+        matched.append(m["hash"])
+        song_idx.append(idx)
+        t_db.append(m["t_anchor"])
 
-    #     for m in matches:
-    #         song_id = m["song_id"]
-    #         t_db = m["t_anchor"]
+    return (
+        np.array(matched, dtype=np.uint32),
+        np.array(song_idx, dtype=np.int64),
+        np.array(t_db, dtype=np.float64),
+        song_ids,
+    )
 
-    #         for t_query in t_queries:
-    #             offset = round(t_query - t_db, OFFSET_ROUND)
-    #             votes[song_id][offset] += 1
 
-    all_hashes = list(query_hash_map.keys())
+def fetch_postings(hashes, index=None):
+    """
+    Fetch every stored landmark whose hash is in hashes.
 
-    # db lookup (only one queryy to  get all the hashes).
-    cursor = fingerprints_col.find(
-        { "hash": { "$in": all_hashes } },
-        { "hash": 1, "song_id": 1, "t_anchor": 1, "_id": 0 }
-    )
+    Served from `index` when one is given (an inverted_index.InvertedIndex
+    or a sharding.ShardedStore), otherwise from a single $in query on the
+    fingerprints collection.
 
-    for m in cursor:
-        h_str = m["hash"]
-        song_id = m["song_id"]
-        t_db = m["t_anchor"]
+    Returns:
+        tuple: (hashes, song_idx, t_anchor, song_ids) where the first three
+            are parallel arrays and song_ids maps song_idx -> song_id
+    """
+
+    if index is not None:
+        return index.fetch_postings(hashes)
+
+    # imported here so in-memory callers (benchmarks, scans) need no Mongo
+    from db import fingerprints_col
+    return fetch_from_collection(fingerprints_col, hashes)
+
+
+def match_hashes(
+    query_hashes,
+    query_times,
+    min_vote_threshold=100,
+    ratio_threshold=2.5,
+    index=None,
+    stop_hashes=None,
+    candidate_k=CANDIDATE_K,
+    with_offset=False,
+    timer=None,
+):
+    """
+    Look up and vote on an already fingerprinted query.
+
+    With a metrics.RequestTimer, the lookup and voting are timed as the
+    db_fetch and voting stages and the posting count is recorded.
+
+    Returns:
+        tuple: (song_id or None, best_votes, status), plus best_offset
+            when with_offset is set (see vote_on_postings)
+    """
+
+    # 0. Drop stop-hashes (see hash_stats.StopHashTable) before the lookup
+    if stop_hashes is not None:
+        keep = stop_hashes.keep_mask(query_hashes)
+        query_hashes, query_times = query_hashes[keep], query_times[keep]
+
+    # 1. Batch DB lookup, one query for all distinct hashes
+    with timed(timer, "db_fetch"):
+        postings = fetch_postings(np.unique(query_hashes), index)
+    if timer is not None:
+        timer.count("postings", len(postings[0]))
+
+    with timed(timer, "voting"):
+        return vote_on_postings(
+            query_hashes, query_times, postings,
+            min_vote_threshold, ratio_threshold, candidate_k, with_offset,
+        )
+
+
+def fetch_batch_postings(queries, index=None, stop_hashes=None):
+    """
+    One lookup for the distinct hashes of many fingerprinted clips.
+
+    Parameters:
+        queries (list): (hashes, t_anchors) per clip
+
+    Returns:
+        tuple: (queries, postings) with stop-hashes dropped from the
+            queries, postings in fetch_postings form
+    """
 
-        for t_query in query_hash_map[h_str]:
-            offset = round(t_query - t_db, OFFSET_ROUND)
-            votes[song_id][offset] += 1
+    if stop_hashes is not None:
+        queries = [(h[m], t[m]) for h, t in queries for m in [stop_hashes.keep_mask(h)]]
 
+    hashes = [h for h, _ in queries]
+    all_hashes = np.unique(np.concatenate(hashes)) if hashes else np.empty(0, dtype=np.uint32)
+    return queries, fetch_postings(all_hashes, index)
 
-    # decide best song
-    best_id, best_votes, best_offset = None, 0, None
 
-    second_best_votes = 0
-    for song_id, offset_map in votes.items():
-        local_best_offset = max(offset_map, key=offset_map.get)
-        local_best_votes = offset_map[local_best_offset]
+def match_batch(
+    queries,
+    postings,
+    min_vote_threshold=100,
+    ratio_threshold=2.5,
+    candidate_k=CANDIDATE_K,
+):
+    """
+    Vote each clip of a batch on its share of the batch lookup (see
+    fetch_batch_postings).
 
-        if local_best_votes > best_votes:
-            best_id = song_id
-            second_best_votes = best_votes
-            best_votes = local_best_votes
-            # best_offset = local_best_offset
+    Yields:
+        tuple: (song_id or None, best_votes, status) per clip, in order
+    """
 
-    
-    if second_best_votes > 0 and best_votes/second_best_votes < ratio_threshold:
-        return None, best_votes, "Song Not in DB"
+    db_hashes, db_song_idx, db_times, song_ids = postings
 
-    if best_votes < min_vote_threshold:
-        return None , best_votes, "LOW CONFIDENCE"
-    return best_id, best_votes, "MATCHED!"
+    for query_hashes, query_times in queries:
+        mine = np.isin(db_hashes, query_hashes)
+        yield vote_on_postings(
+            query_hashes, query_times,
+            (db_hashes[mine], db_song_idx[mine], db_times[mine], song_ids),
+            min_vote_threshold, ratio_threshold, candidate_k,
+        )
+
+
+class StreamingMatcher:
+    """
+    Offset-histogram voting that accumulates over batches of query hashes.
+
+    Feed it the hashes of each newly finalized stretch of audio (see
+    streaming.StreamingFingerprinter); every batch is looked up once and its
+    (song, offset) votes are added to the running histogram. Each query
+    anchor time lands in exactly one batch, so the totals match what
+    match_hashes would count on the whole query with candidate_k=None.
+
+    There is no candidate shortlist here: a shortlist taken per batch
+    would keep different songs than one taken on the whole query, and
+    the batches are small enough that voting on every song is cheap.
+    """
+
+    def __init__(self, min_vote_threshold=100, ratio_threshold=2.5, index=None, stop_hashes=None):
+        self.min_vote_threshold = min_vote_threshold
+        self.ratio_threshold = ratio_threshold
+        self.index = index
+        self.stop_hashes = stop_hashes
+
+        self.song_ids = []          # global song idx -> song_id
+        self._song_idx = {}
+        self._keys = np.empty(0, dtype=np.int64)     # (song << 32) | offset bin
+        self._counts = np.empty(0, dtype=np.int64)
+
+    def add(self, query_hashes, query_times):
+        """
+        Look up one batch and add its votes.
+
+        Returns:
+            tuple: (song_id or None, best_votes, status), the decision on
+                everything seen so far
+        """
+
+        if self.stop_hashes is not None:
+            keep = self.stop_hashes.keep_mask(query_hashes)
+            query_hashes, query_times = query_hashes[keep], query_times[keep]
+
+        if len(query_hashes):
+            db_hashes, db_song_idx, db_times, song_ids = fetch_postings(
+                np.unique(query_hashes), self.index
+            )
+            songs, offset_bins, counts = offset_histogram(
+                query_hashes, query_times,
+                db_hashes, db_song_idx, db_times,
+                ndigits=OFFSET_ROUND,
+            )
+            if len(songs):
+                # batch-local song idx -> global idx
+                local = np.array([self._intern(song_ids[i]) for i in range(len(song_ids))])
+                keys = (local[songs] << 32) | (offset_bins & 0xFFFFFFFF)
+                self._keys, inverse = np.unique(
+                    np.concatenate((self._keys, keys)), return_inverse=True
+                )
+                self._counts = np.bincount(
+                    inverse, weights=np.concatenate((self._counts, counts)),
+                    minlength=len(self._keys),
+                ).astype(np.int64)
+
+        return self.result()
+
+    def _intern(self, song_id):
+        idx = self._song_idx.get(song_id)
+        if idx is None:
+            idx = self._song_idx[song_id] = len(self.song_ids)
+            self.song_ids.append(song_id)
+        return idx
+
+    def result(self):
+        """
+        Returns:
+            tuple: (song_id or None, best_votes, status)
+        """
+
+        votes = np.zeros(len(self.song_ids), dtype=np.int64)
+        np.maximum.at(votes, self._keys >> 32, self._counts)
+
+        best, best_votes, second_best_votes = pick_best(votes)
+        best_id = self.song_ids[best] if best is not None else None
+        return decide(
+            best_id, best_votes, second_best_votes,
+            self.min_vote_threshold, self.ratio_threshold,
+        )
+
+
+def identify_samples(
+    y,
+    sr,
+    min_vote_threshold=100,
+    ratio_threshold=2.5,
+    index=None,
+    stop_hashes=None,
+    candidate_k=CANDIDATE_K,
+    with_offset=False,
+    frontend=DEFAULT_FRONTEND,
+    peaks_per_sec=None,
+):
+    """
+    Identify already decoded mono samples (see fingerprint.load_audio).
+    frontend and peaks_per_sec must be the ones the index was built with.
+    """
+
+    query_hashes, query_times = fingerprint_samples(y, sr, frontend, peaks_per_sec)
+    return match_hashes(
+        query_hashes, query_times,
+        min_vote_threshold, ratio_threshold,
+        index=index, stop_hashes=stop_hashes, candidate_k=candidate_k,
+        with_offset=with_offset,
+    )
+
+
+def identify_song(
+    query_audio,
+    min_vote_threshold=100,
+    ratio_threshold=2.5,
+    index=None,
+    stop_hashes=None,
+    candidate_k=CANDIDATE_K,
+    with_offset=False,
+    frontend=DEFAULT_FRONTEND,
+    peaks_per_sec=None,
+):
+    query_hashes, query_times = fingerprint_file(query_audio, frontend, peaks_per_sec)
+    return match_hashes(
+        query_hashes, query_times,
+        min_vote_threshold, ratio_threshold,
+        index=index, stop_hashes=stop_hashes, candidate_k=candidate_k,
+        with_offset=with_offset,
+    )
 
 
 if __name__ == "__main__":
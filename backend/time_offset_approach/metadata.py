@@ -0,0 +1,112 @@
+"""
+Song metadata lookups with caching.
+
+- SpotifyCache: search query -> raw Spotify search response, persisted in
+  the spotify_cache collection so re-uploads and restarts don't spend API
+  quota. Only successful responses are stored.
+- SongCache: in-process LRU of songs documents for the /identify response,
+  so popular songs don't hit Mongo on every match.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from spotify_search import search_spotify
+
+# a cached search is reused for this long
+SPOTIFY_CACHE_MAX_AGE = 30 * 24 * 3600
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class SpotifyCache:
+    """Persistent query -> search response cache in front of search_spotify."""
+
+    def __init__(self, collection, max_age_sec=SPOTIFY_CACHE_MAX_AGE, search=search_spotify):
+        self.collection = collection
+        self.max_age_sec = max_age_sec
+        self._search = search
+
+        self.hits = 0
+        self.misses = 0
+
+    def search(self, query):
+        """
+        Returns:
+            dict | None: the search response, None if the API call failed
+        """
+
+        key = normalize_query(query)
+        doc = self.collection.find_one({"_id": key})
+        if doc is not None and time.time() - doc["fetched_at"] < self.max_age_sec:
+            self.hits += 1
+            return doc["data"]
+
+        self.misses += 1
+        data = self._search(query)
+        if data is not None:
+            self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "data": data, "fetched_at": time.time()},
+                upsert=True,
+            )
+        return data
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class SongCache:
+    """
+    LRU of songs documents by song_id.
+
+    Only found documents are cached, so metadata written by another process
+    (bulk_index.py) shows up on the next lookup.
+    """
+
+    def __init__(self, collection, max_entries=5000):
+        self.collection = collection
+        self.max_entries = max_entries
+
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, song_id):
+        """
+        Returns:
+            dict | None: the songs document without _id/song_id
+        """
+
+        key = str(song_id)
+        with self._lock:
+            if key in self._docs:
+                self._docs.move_to_end(key)
+                self.hits += 1
+                return self._docs[key]
+            self.misses += 1
+
+        doc = self.collection.find_one({"song_id": key}, {"_id": 0, "song_id": 0})
+        if doc is not None:
+            self._store(key, doc)
+        return doc
+
+    def put(self, song_id, doc):
+        """Cache a document that was just written (see /upload)."""
+        doc = {k: v for k, v in doc.items() if k not in ("_id", "song_id")}
+        self._store(str(song_id), doc)
+
+    def _store(self, key, doc):
+        with self._lock:
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self._docs), "hits": self.hits, "misses": self.misses}
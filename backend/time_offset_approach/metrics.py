@@ -0,0 +1,171 @@
+"""
+Request metrics for the service: per-stage timings and Prometheus-style
+histograms, exposed as text on /metrics.
+
+Every request gets a RequestTimer. Code on the request path wraps each
+stage in `with timer.stage("ffmpeg"):` (or `timed(timer, ...)` where the
+timer is optional), and finish() then
+
+- observes each stage in identify_stage_seconds{endpoint, stage} and the
+  whole request in identify_request_seconds{endpoint, status}
+- logs one line with every stage on the "metrics.requests" logger, at
+  INFO, so LOG_LEVEL=WARNING turns it off (the line is not even built)
+
+Implemented here instead of with prometheus_client: the text format is
+small and the service needs only counters, gauges and histograms.
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+request_log = logging.getLogger("metrics.requests")
+
+# seconds, from a cache hit to a slow ffmpeg decode
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+POSTING_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+        self._series = {}       # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                labels = _labels(self.labelnames + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {series[-2]}")
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "identify_stage_seconds", "Time spent per request stage",
+    labelnames=("endpoint", "stage"),
+)
+REQUEST_SECONDS = Histogram(
+    "identify_request_seconds", "Total request time",
+    labelnames=("endpoint", "status"),
+)
+POSTINGS = Histogram(
+    "identify_postings", "Postings returned by the fingerprint lookup",
+    labelnames=("endpoint",), buckets=POSTING_BUCKETS,
+)
+HISTOGRAMS = [STAGE_SECONDS, REQUEST_SECONDS, POSTINGS]
+
+
+def render(gauges=None):
+    """
+    Prometheus text exposition of every histogram plus `gauges`, a dict
+    of metric name -> number sampled at scrape time (queue depth, cache
+    hits, ...). None values are skipped.
+    """
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, value in (gauges or {}).items():
+        if value is None:
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """
+    Stage timings of one request.
+
+    stage() may be used from worker threads; each stage name is summed if
+    it runs more than once (e.g. ffmpeg for every clip of a batch).
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.counts = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_all(self, timings):
+        # stage -> seconds measured elsewhere, e.g. in a worker process
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    def count(self, name, value):
+        self.counts[name] = value
+        if name == "postings":
+            POSTINGS.observe(value, endpoint=self.endpoint)
+
+    def server_timing(self):
+        """Value for a Server-Timing header, shown in browser dev tools."""
+        return ", ".join(f"{name};dur={sec * 1000:.1f}" for name, sec in self.stages.items())
+
+    def finish(self, status):
+        total = time.perf_counter() - self._start
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, endpoint=self.endpoint, stage=name)
+        REQUEST_SECONDS.observe(total, endpoint=self.endpoint, status=status)
+
+        if request_log.isEnabledFor(logging.INFO):
+            request_log.info(json.dumps({
+                "endpoint": self.endpoint,
+                "status": status,
+                "total_ms": round(total * 1000, 2),
+                "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+                **self.counts,
+            }))
+        return total
+
+
+def timed(timer, name):
+    """timer.stage(name), or a no-op when timer is None."""
+    return timer.stage(name) if timer is not None else nullcontext()
@@ -0,0 +1,76 @@
+"""
+One-off migration of the fingerprints collection from "f1_f2_dt" string
+hashes to the packed integer layout in hashing.py.
+
+Run it once, before deploying the code that writes/queries integer hashes:
+
+    python migrate_hashes.py            # rewrite in place
+    python migrate_hashes.py --dry-run  # only count what would change
+
+It only touches documents whose hash is still a string, so it is safe to
+re-run after an interruption. The hash index is rebuilt at the end so it
+picks up the smaller integer keys.
+"""
+
+import argparse
+from pymongo import UpdateOne
+from db import fingerprints_col
+from hashing import parse_hash_string
+
+BATCH_SIZE = 5000
+
+
+def migrate(collection, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Rewrite string hashes to packed integers.
+
+    Returns:
+        int: number of documents converted (or that would be, on dry run)
+    """
+
+    legacy = {"hash": {"$type": "string"}}
+
+    if dry_run:
+        return collection.count_documents(legacy)
+
+    converted = 0
+    ops = []
+
+    for doc in collection.find(legacy, {"hash": 1}):
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"hash": parse_hash_string(doc["hash"])}}
+        ))
+
+        if len(ops) >= batch_size:
+            converted += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+            print(f"converted {converted} documents", flush=True)
+
+    if ops:
+        converted += collection.bulk_write(ops, ordered=False).modified_count
+
+    return converted
+
+
+def rebuild_hash_index(collection):
+    for name, spec in collection.index_information().items():
+        if spec["key"] == [("hash", 1)]:
+            collection.drop_index(name)
+    collection.create_index("hash")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    count = migrate(fingerprints_col, args.batch_size, args.dry_run)
+
+    if args.dry_run:
+        print(f"{count} documents still use string hashes")
+    else:
+        print(f"converted {count} documents, rebuilding hash index...")
+        rebuild_hash_index(fingerprints_col)
+        print("done")
@@ -0,0 +1,280 @@
+"""
+Content-addressed on-disk cache of spectral peaks.
+
+Decoding and the STFT are most of the cost of fingerprinting a catalog,
+and neither depends on the landmark/hash settings (fanout, max_dt,
+freq_bin, time_bin). Caching each track's peaks means retuning those
+settings re-runs only landmarks_from_peaks and hash_landmarks:
+
+    cache = PeakCache(".peak_cache", max_bytes=2 * 1024**3)
+    hashes, t_anchors = fingerprint_file_cached(path, cache, fanout=8)
+
+Entries are keyed by the SHA-256 of the audio file's bytes plus every
+parameter that changes the peaks (sample rate, spectrogram front-end, STFT
+and peak-picking settings), so renaming a file still hits and changing a
+setting misses.
+Each entry is one compressed .npz with the peaks' frame and frequency bin
+indices (uint32/uint16), a few KB per track.
+
+The cache is bounded by total size: put() evicts the least recently used
+entries (by file mtime, refreshed on every hit) once max_bytes is
+exceeded. Several processes can share a directory; writes are atomic
+renames and a file evicted by another process is just a miss.
+
+    python peak_cache.py .peak_cache                 # size and entry count
+    python peak_cache.py .peak_cache --max-mb 500    # evict down to 500 MB
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from fingerprint import (
+    N_FFT, HOP_LENGTH, FRONTENDS, DEFAULT_FRONTEND, landmarks, spectrogram, peak_bins, bins_to_peaks,
+    density_kwargs,
+)
+from hashing import hash_landmarks
+from spectogram import SAMPLE_RATE, load_audio
+
+# bump when peak picking changes in a way the parameters don't capture
+CACHE_VERSION = 1
+MAX_BYTES = 1024**3
+
+
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def peak_params(
+    sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, frontend=DEFAULT_FRONTEND, peaks_per_sec=None,
+    **peak_kwargs,
+):
+    """
+    Every setting that affects the peaks, with peak_picking's defaults
+    filled in so equal settings always give equal keys.
+    """
+
+    params = {
+        "neighborhood_size": FRONTENDS[frontend]["neighborhood_size"],
+        "threshold_db": -40,
+        "max_peaks_per_frame": None,
+        "max_peaks_per_band": None,
+        "max_peaks_per_window": None,
+        "window_frames": None,
+    }
+    params.update(density_kwargs(peaks_per_sec, sr, hop_length))
+    params.update(peak_kwargs)
+    params.update(
+        sr=sr, n_fft=n_fft, hop_length=hop_length, version=CACHE_VERSION,
+        frontend=frontend, spectrogram=FRONTENDS[frontend]["spectrogram"],
+    )
+    return params
+
+
+def cache_key(audio_digest, params):
+    blob = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha256(audio_digest.encode() + blob).hexdigest()
+
+
+class PeakCache:
+    """
+    Directory of <key[:2]>/<key>.npz peak files with LRU eviction.
+
+    Counters (see stats()) are per process.
+    """
+
+    def __init__(self, root, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._size = None       # bytes on disk, computed on first put()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".npz")
+
+    def get(self, key):
+        """
+        Returns:
+            tuple | None: (freq_idxs, time_idxs), None on a miss
+        """
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                bins = data["freq_idx"].astype(np.int64), data["time_idx"].astype(np.int64)
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            # missing, evicted meanwhile, or a truncated file
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return bins
+
+    def put(self, key, freq_idxs, time_idxs):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write then rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(
+                f,
+                freq_idx=np.asarray(freq_idxs, dtype=np.uint16),
+                time_idx=np.asarray(time_idxs, dtype=np.uint32),
+            )
+        os.replace(tmp_path, path)
+        self.writes += 1
+
+        if self.max_bytes is None:
+            # unbounded here, e.g. a worker whose parent runs evict()
+            return
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """
+        Returns:
+            list: (mtime, path, size) for every entry
+        """
+
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def evict(self, max_bytes=None):
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+
+        Returns:
+            int: entries deleted
+        """
+
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+
+        deleted = 0
+        for _, path, size in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self._size = total
+        self.evictions += deleted
+        return deleted
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+    def report(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_mb": round(sum(size for _, _, size in entries) / 1e6, 2),
+            "max_mb": round(self.max_bytes / 1e6, 2) if self.max_bytes is not None else None,
+            **self.stats(),
+        }
+
+
+def cached_peaks(
+    audio_path, cache, sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, frontend=DEFAULT_FRONTEND,
+    peaks_per_sec=None, **peak_kwargs,
+):
+    """
+    Peaks of an audio file, decoded and computed only on a cache miss.
+
+    Returns:
+        tuple: (times, freqs) as from fingerprint.peaks
+    """
+
+    params = peak_params(sr, n_fft, hop_length, frontend, peaks_per_sec, **peak_kwargs)
+    key = cache_key(file_digest(audio_path), params)
+
+    bins = cache.get(key)
+    if bins is None:
+        y, sr = load_audio(audio_path, sr=sr)
+        S_db = spectrogram(y, sr, n_fft, hop_length, frontend)
+        bins = peak_bins(S_db, frontend, **{
+            k: params[k] for k in
+            (
+                "neighborhood_size", "threshold_db", "max_peaks_per_frame", "max_peaks_per_band",
+                "max_peaks_per_window", "window_frames",
+            )
+        })
+        cache.put(key, *bins)
+
+    return bins_to_peaks(*bins, sr, n_fft, hop_length, frontend)
+
+
+def fingerprint_file_cached(
+    audio_path,
+    cache,
+    fanout=5,
+    max_dt=2.0,
+    freq_bin=10,
+    time_bin=0.1,
+    **peak_kwargs,
+):
+    """
+    fingerprint.fingerprint_file through the peak cache, with the landmark
+    and hash settings as parameters.
+
+    Returns:
+        tuple: (hashes, t_anchors) parallel arrays
+    """
+
+    times, freqs = cached_peaks(audio_path, cache, **peak_kwargs)
+    lm = landmarks(times, freqs, fanout, max_dt)
+    return hash_landmarks(lm, freq_bin, time_bin), lm["t_anchor"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report on or shrink a peak cache directory.")
+    parser.add_argument("root")
+    parser.add_argument("--max-mb", type=float, help="evict least recently used entries down to this size")
+    args = parser.parse_args()
+
+    cache = PeakCache(args.root)
+    if args.max_mb is not None:
+        print(f"evicted {cache.evict(int(args.max_mb * 1e6))} entries")
+    print(cache.report())
@@ -3,12 +3,180 @@ import librosa
 from spectogram import plot_spectogram
 
 
+def _window_max(x, size):
+    """
+    Sliding maximum over the last axis.
+
+    Returns W with W[..., i] = max(x[..., i : i + size]), i.e. only the
+    fully covered windows (length L - size + 1). Built by doubling, so it
+    costs O(log size) full-array passes instead of O(size).
+    """
+    result = x
+    width = 1
+    while width * 2 <= size:
+        result = np.maximum(result[..., :-width], result[..., width:])
+        width *= 2
+
+    if width < size:
+        # two overlapping power-of-two windows cover the remainder
+        shift = size - width
+        result = np.maximum(result[..., :-shift], result[..., shift:])
+
+    return result
+
+
+def _half_window_max(x, pad):
+    """
+    Max over the `pad` neighbours on each side along the last axis,
+    excluding the element itself (out-of-range neighbours are -inf).
+
+    Returns:
+        (left, right): left[i] = max(x[i-pad:i]), right[i] = max(x[i+1:i+pad+1])
+    """
+    n = x.shape[-1]
+    width = [(0, 0)] * (x.ndim - 1) + [(pad, pad)]
+    padded = np.pad(x, width, mode="constant", constant_values=-np.inf)
+
+    fwd = _window_max(padded, pad)
+    return fwd[..., :n], fwd[..., pad + 1 : pad + 1 + n]
+
+
+def _strict_local_max(S, neighborhood_size):
+    """
+    Mask of points strictly greater than every other point in their
+    neighborhood_size x neighborhood_size window.
+
+    The window minus its centre splits into the rows above/below (full
+    width) and the centre row left/right of the point, so the neighbour
+    max is separable: a pass along time, then a pass along frequency.
+    """
+    pad = neighborhood_size // 2
+    if pad == 0:
+        return np.ones_like(S, dtype=bool)
+
+    # time pass
+    left, right = _half_window_max(S, pad)
+    row_neighbors = np.maximum(left, right)
+    row_max = np.maximum(row_neighbors, S)
+
+    # frequency pass over the full-width row maxima
+    up, down = _half_window_max(row_max.T, pad)
+    col_neighbors = np.maximum(up, down).T
+
+    return S > np.maximum(row_neighbors, col_neighbors)
+
+
+def _cap_per_group(groups, values, limit):
+    """
+    Keep the `limit` largest values within each group.
+
+    Returns:
+        np.ndarray (bool): mask over the inputs, ties kept in input order
+    """
+    order = np.lexsort((-values, groups))
+    sorted_groups = groups[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    group_len = np.diff(np.r_[starts, len(order)])
+    rank = np.arange(len(order)) - np.repeat(starts, group_len)
+
+    keep = np.zeros(len(order), dtype=bool)
+    keep[order[rank < limit]] = True
+    return keep
+
+
+def peak_bins_from_spectogram(
+    S_db,
+    neighborhood_size=15,
+    threshold_db=-40,
+    max_peaks_per_frame=None,
+    max_peaks_per_band=None,
+    max_peaks_per_window=None,
+    window_frames=None,
+):
+    """
+    Same peaks as peaks_from_spectogram, as (freq bin, frame) indices.
+
+    Integer indices are what peak_cache stores: smaller than the float
+    times/freqs and turned back into them exactly by peaks_from_bins.
+
+    max_peaks_per_window keeps the loudest peaks in each run of
+    window_frames frames (windows start at frame 0), which bounds the
+    peaks per second whatever the mix's loudness or density.
+
+    Returns:
+        tuple: (freq_idxs, time_idxs) arrays, ordered by frequency bin and
+            then by frame
+    """
+    # A point is a peak if it is greater than all its neighbors
+    local_max = _strict_local_max(S_db, neighborhood_size)
+
+    # Apply loudness threshold
+    peaks_mask = local_max & (S_db > threshold_db)
+
+    freq_idxs, time_idxs = np.where(peaks_mask)
+
+    # Optional density caps, loudest peaks win
+    if max_peaks_per_frame is not None or max_peaks_per_band is not None or max_peaks_per_window is not None:
+        values = S_db[freq_idxs, time_idxs]
+        keep = np.ones(len(values), dtype=bool)
+        if max_peaks_per_frame is not None:
+            keep &= _cap_per_group(time_idxs, values, max_peaks_per_frame)
+        if max_peaks_per_band is not None:
+            keep &= _cap_per_group(freq_idxs, values, max_peaks_per_band)
+        if max_peaks_per_window is not None:
+            keep &= _cap_per_group(time_idxs // window_frames, values, max_peaks_per_window)
+        freq_idxs, time_idxs = freq_idxs[keep], time_idxs[keep]
+
+    return freq_idxs, time_idxs
+
+
+def peaks_from_bins(freq_idxs, time_idxs, sr, n_fft=2048, hop_length=512):
+    """
+    Convert peak indices to (times, freqs) in seconds and Hz.
+    """
+    times = librosa.frames_to_time(time_idxs, sr=sr, hop_length=hop_length)
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)[freq_idxs]
+
+    return times, freqs
+
+
+def peaks_from_spectogram(
+    S_db,
+    sr,
+    n_fft=2048,
+    hop_length=512,
+    neighborhood_size=15,
+    threshold_db=-40,
+    max_peaks_per_frame=None,
+    max_peaks_per_band=None,
+):
+    """
+    Detect spectral peaks in an already computed dB spectrogram.
+
+    See find_peaks for the parameters. n_fft and hop_length must match
+    the ones the spectrogram was computed with.
+
+    Returns:
+        tuple: (times, freqs) arrays in seconds and Hz, ordered by
+            frequency bin and then by frame
+    """
+    freq_idxs, time_idxs = peak_bins_from_spectogram(
+        S_db, neighborhood_size, threshold_db, max_peaks_per_frame, max_peaks_per_band,
+    )
+
+    # Convert indices to time & frequency
+    return peaks_from_bins(freq_idxs, time_idxs, sr, n_fft, hop_length)
+
+
 def find_peaks(
     audio_path,
     n_fft=2048,
     hop_length=512,
     neighborhood_size=15,
     threshold_db=-40,
+    max_peaks_per_frame=None,
+    max_peaks_per_band=None,
 ):
     """
     Detect spectral peaks from a spectrogram.
@@ -19,6 +187,10 @@ def find_peaks(
         hop_length (int): Hop length for STFT.
         neighborhood_size (int): Size of the neighborhood for local maxima detection.
         threshold_db (float): Minimum dB threshold for peaks.
+        max_peaks_per_frame (int | None): Keep at most this many of the
+            loudest peaks in each time frame. None disables the cap.
+        max_peaks_per_band (int | None): Keep at most this many of the
+            loudest peaks in each frequency bin. None disables the cap.
 
     Returns:
         peaks (list of tuples): [(time_sec, freq_hz), ...]
@@ -26,30 +198,10 @@ def find_peaks(
     # Compute spectrogram in dB scale
     S_db, sr = plot_spectogram(audio_path)
 
-    # Neighborhood padding
-    pad = neighborhood_size // 2
-    padded = np.pad(S_db, pad_width=pad, mode="constant", constant_values=-np.inf)
-
-    # Initialize local maxima mask
-    local_max = np.ones_like(S_db, dtype=bool)
-
-    # A point is a peak if it is greater than all its neighbors
-    for i in range(-pad, pad + 1):
-        for j in range(-pad, pad + 1):
-            if i == 0 and j == 0:
-                continue
-            local_max &= S_db > padded[
-                pad + i : pad + i + S_db.shape[0],
-                pad + j : pad + j + S_db.shape[1],
-            ]
-
-    # Apply loudness threshold
-    peaks_mask = local_max & (S_db > threshold_db)
-
-    # Convert indices to time & frequency
-    freq_idxs, time_idxs = np.where(peaks_mask)
-    times = librosa.frames_to_time(time_idxs, sr=sr, hop_length=hop_length)
-    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)[freq_idxs]
+    times, freqs = peaks_from_spectogram(
+        S_db, sr, n_fft, hop_length, neighborhood_size, threshold_db,
+        max_peaks_per_frame, max_peaks_per_band,
+    )
 
     # Combine into (time, freq) pairs
     peaks = list(zip(times, freqs))
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from fingerprint import fingerprint_samples, fingerprint_samples_timed, check_frontend, DEFAULT_FRONTEND
+
+
+class QueueFull(Exception):
+    """Raised when a request arrives while the wait queue is already full."""
+
+
+class IdentifyPipeline:
+    """
+    Runs the blocking parts of /identify and /upload off the event loop.
+
+    - at most `max_concurrency` requests are processed at once; up to
+      `max_queue` more wait for a slot, anything beyond that is rejected
+    - fingerprinting (STFT, peaks, landmarks) runs in a process pool,
+      with the spectrogram front-end and peak budget of the index being
+      queried
+    - Mongo lookups and voting run in a thread pool
+
+    Settings come from the environment via from_env():
+        PIPELINE_MAX_CONCURRENCY (4), PIPELINE_MAX_QUEUE (32),
+        FINGERPRINT_WORKERS (2, 0 = threads instead of processes),
+        LOOKUP_THREADS (8)
+    """
+
+    def __init__(
+        self, max_concurrency=4, max_queue=32, fingerprint_workers=2, lookup_threads=8,
+        frontend=DEFAULT_FRONTEND, peaks_per_sec=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.frontend = check_frontend(frontend)
+        self.peaks_per_sec = peaks_per_sec
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        if fingerprint_workers > 0:
+            self.fingerprint_pool = ProcessPoolExecutor(max_workers=fingerprint_workers)
+        else:
+            self.fingerprint_pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.lookup_pool = ThreadPoolExecutor(max_workers=lookup_threads)
+
+        # backpressure counters, see stats()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+
+    @classmethod
+    def from_env(cls, frontend=DEFAULT_FRONTEND, peaks_per_sec=None):
+        return cls(
+            max_concurrency=int(os.getenv("PIPELINE_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("PIPELINE_MAX_QUEUE", "32")),
+            fingerprint_workers=int(os.getenv("FINGERPRINT_WORKERS", "2")),
+            lookup_threads=int(os.getenv("LOOKUP_THREADS", "8")),
+            frontend=frontend,
+            peaks_per_sec=peaks_per_sec,
+        )
+
+    @asynccontextmanager
+    async def slot(self, reject=True):
+        """
+        Wait for a processing slot.
+
+        Parameters:
+            reject (bool): raise QueueFull when the queue is full; False for
+                the remaining work of an already admitted request (the
+                per-clip voting of /identify/batch), which always waits
+
+        Raises:
+            QueueFull: if max_queue requests are already waiting
+        """
+
+        if reject and self.queued >= self.max_queue and self._slots.locked():
+            self.rejected += 1
+            raise QueueFull()
+
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        waited = time.perf_counter() - start
+        self.admitted += 1
+        self.total_wait_sec += waited
+        self.max_wait_sec = max(self.max_wait_sec, waited)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def fingerprint(self, samples, sr, timer=None):
+        """
+        Returns (hashes, t_anchors), computed in the fingerprint pool.
+        With a metrics.RequestTimer, the worker's stage timings are added to it.
+        """
+        loop = asyncio.get_running_loop()
+        if timer is None:
+            return await loop.run_in_executor(
+                self.fingerprint_pool, fingerprint_samples, samples, sr, self.frontend, self.peaks_per_sec
+            )
+
+        hashes, t_anchors, timings = await loop.run_in_executor(
+            self.fingerprint_pool, fingerprint_samples_timed, samples, sr, self.frontend, self.peaks_per_sec
+        )
+        timer.add_all(timings)
+        return hashes, t_anchors
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking call (Mongo, voting, HTTP) in the lookup thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.lookup_pool, partial(fn, *args, **kwargs))
+
+    def stats(self):
+        return {
+            "frontend": self.frontend,
+            "peaks_per_sec": self.peaks_per_sec,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": (
+                round(self.total_wait_sec / self.admitted * 1000, 2) if self.admitted else 0.0
+            ),
+            "max_queue_wait_ms": round(self.max_wait_sec * 1000, 2),
+        }
+
+    def shutdown(self):
+        self.fingerprint_pool.shutdown(cancel_futures=True)
+        self.lookup_pool.shutdown(cancel_futures=True)
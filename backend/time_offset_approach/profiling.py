@@ -0,0 +1,85 @@
+"""
+A small sampling profiler for the running service.
+
+StackSampler wakes up every `interval` seconds in a daemon thread and
+records the Python stack of every other thread (the event loop and the
+lookup pool; with FINGERPRINT_WORKERS=0 also fingerprinting). Counts are
+kept per stack in folded format, one "frame;frame;frame count" line per
+stack, which flamegraph.pl and speedscope read directly.
+
+Sampling costs one sys._current_frames() call per interval and nothing
+while stopped. The service exposes it as POST /debug/profile when
+PROFILING=1 is set.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+
+INTERVAL = 0.005
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{code.co_name}:{frame.f_lineno}"
+
+
+class StackSampler:
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        """
+        Returns:
+            str: folded stacks, most frequent first
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+def profile_for(seconds, interval=INTERVAL):
+    """
+    Sample every thread for `seconds` (blocking).
+
+    Returns:
+        StackSampler: stopped, with its stacks
+    """
+
+    sampler = StackSampler(interval).start()
+    time.sleep(seconds)
+    return sampler.stop()
@@ -0,0 +1,229 @@
+"""
+TTL/LRU cache of /identify results.
+
+Two ways to hit it:
+
+- exact: the upload bytes hash to a digest seen before (the same clip sent
+  again), which skips decoding, fingerprinting and voting.
+- near-duplicate: the query's hash set has a MinHash signature close to a
+  cached one (the same moment of a song recorded again, re-encoded or
+  trimmed slightly), which skips the lookup and voting. Signatures are
+  split into LSH bands, so only entries sharing a band are compared.
+  Only confident matches are kept under their signature: a "No Match"
+  from a short or noisy clip must not answer a similar, better clip.
+
+Adding songs can change any answer (a new best match or a failed ratio
+test), so /upload clears the whole cache. That only reaches the worker
+that served the upload: other uvicorn workers, and every worker after a
+bulk_index.py run, keep answering from their cache for up to
+RESULT_CACHE_TTL. Lower the TTL (or restart) when songs are added that
+way.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16
+MIN_SIMILARITY = 0.5
+
+# odd 64-bit multipliers for the MinHash permutations
+_SEEDS = np.random.default_rng(0x5EED).integers(
+    1, 2**63, size=(2, NUM_PERM), dtype=np.uint64
+) | np.uint64(1)
+
+
+def minhash_signature(hashes, num_perm=NUM_PERM):
+    """
+    MinHash of the distinct query hashes: for each of num_perm mixing
+    functions, the smallest mixed value. Two signatures agree at a position
+    with probability equal to the Jaccard similarity of the sets.
+
+    Returns:
+        np.ndarray (uint32): num_perm values
+    """
+
+    h = np.unique(np.asarray(hashes, dtype=np.uint32)).astype(np.uint64)
+    if len(h) == 0:
+        return np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    a, b = _SEEDS[0, :num_perm], _SEEDS[1, :num_perm]
+    # multiply-xorshift mix, wraps mod 2**64
+    with np.errstate(over="ignore"):
+        mixed = (h[:, None] * a) ^ b
+        mixed ^= mixed >> np.uint64(29)
+        mixed *= a
+    return (mixed.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("key", "digest", "signature", "result", "fingerprint_sec", "match_sec", "expires")
+
+    def __init__(self, key, digest, signature, result, fingerprint_sec, match_sec, expires):
+        self.key = key
+        self.digest = digest
+        self.signature = signature
+        self.result = result
+        self.fingerprint_sec = fingerprint_sec
+        self.match_sec = match_sec
+        self.expires = expires
+
+
+class ResultCache:
+    """
+    LRU of identify results with a TTL, keyed by upload digest and by
+    MinHash signature.
+
+    Counters (see stats()): exact and near-duplicate hits, misses, and the
+    processing time the hits saved, measured when the entry was computed
+    (decode + fingerprint + match for exact hits, match only for
+    near-duplicates).
+    """
+
+    def __init__(self, max_entries=1000, ttl_sec=3600, bands=BANDS, min_similarity=MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.bands = bands
+        self.min_similarity = min_similarity
+
+        self._entries = OrderedDict()   # key -> _Entry, oldest first
+        self._by_digest = {}            # upload digest -> key
+        self._buckets = {}              # (band, band bytes) -> set of keys
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+        # bumped by invalidate(), so results computed before an /upload
+        # finished are not cached after it
+        self.generation = 0
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_sec = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, signature):
+        if signature is None:
+            return []
+        rows = len(signature) // self.bands
+        return [(i, signature[i * rows:(i + 1) * rows].tobytes()) for i in range(self.bands)]
+
+    def _hit(self, entry, saved_sec):
+        if entry.expires < time.monotonic():
+            self._remove(entry.key)
+            return None
+        self._entries.move_to_end(entry.key)
+        self.saved_sec += saved_sec
+        return entry.result
+
+    def get_exact(self, digest):
+        """
+        Returns:
+            the cached result for these exact upload bytes, or None
+        """
+
+        with self._lock:
+            entry = self._entries.get(self._by_digest.get(digest))
+            result = None
+            if entry is not None:
+                result = self._hit(entry, entry.fingerprint_sec + entry.match_sec)
+            if result is not None:
+                self.exact_hits += 1
+            return result
+
+    def get_similar(self, signature):
+        """
+        Returns:
+            the cached result of the most similar query above
+            min_similarity, or None (counted as a miss)
+        """
+
+        with self._lock:
+            candidates = set()
+            for band in self._band_keys(signature):
+                candidates |= self._buckets.get(band, set())
+
+            best, best_sim = None, self.min_similarity
+            for key in candidates:
+                entry = self._entries[key]
+                sim = float(np.mean(entry.signature == signature))
+                if sim >= best_sim:
+                    best, best_sim = entry, sim
+
+            result = self._hit(best, best.match_sec) if best is not None else None
+            if result is None:
+                self.misses += 1
+            else:
+                self.near_hits += 1
+            return result
+
+    def put(self, digest, signature, result, fingerprint_sec, match_sec, generation):
+        """
+        Cache a result under the upload digest and, if given, the signature.
+
+        Parameters:
+            signature (np.ndarray | None): None caches for exact repeats
+                only, as for negative answers
+            fingerprint_sec (float): decode + fingerprint time of this query
+            match_sec (float): lookup + voting time of this query
+            generation (int): self.generation read before the query started
+        """
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            key = self._next_key
+            self._next_key += 1
+
+            self._entries[key] = _Entry(
+                key, digest, signature, result, fingerprint_sec, match_sec,
+                time.monotonic() + self.ttl_sec,
+            )
+            self._by_digest[digest] = key
+            for band in self._band_keys(signature):
+                self._buckets.setdefault(band, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+        if self._by_digest.get(entry.digest) == key:
+            del self._by_digest[entry.digest]
+
+    def invalidate(self):
+        """Drop every entry (called when /upload adds a song)."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_digest.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0
+            ),
+            "latency_saved_ms": round(self.saved_sec * 1000, 1),
+        }
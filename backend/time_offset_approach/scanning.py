@@ -0,0 +1,405 @@
+"""
+Long-form scanning: every catalog song in a DJ set, radio capture or
+podcast, with the time span it plays for.
+
+    python scanning.py mix.mp3
+    python scanning.py mix.mp3 --window 10 --hop 2.5 --min-votes 40 --json
+
+The recording is decoded and fingerprinted once, chunk by chunk, with
+streaming.StreamingFingerprinter, so overlapping windows share the STFT,
+peak and landmark work instead of each window being fingerprinted again.
+Each chunk's hashes are looked up in one query, and every matching
+(posting, query time) pair becomes a vote for (block, song, offset), where
+a block is hop_sec of audio and the offset is query time minus song time.
+
+A window is window_sec worth of consecutive blocks. It is decided like a
+clip (match_from_db.decide) on its best (song, offset) bin, and
+consecutive windows that agree on the song and on the offset (within
+OFFSET_TOLERANCE) are merged into one segment. Playing the same song again
+later gives a different offset, so it shows up as a separate segment.
+"""
+
+import numpy as np
+
+from decoding import decode_file_chunks
+from fingerprint import DEFAULT_FRONTEND
+from match_from_db import fetch_postings, decide, OFFSET_ROUND, CANDIDATE_K
+from spectogram import SAMPLE_RATE
+from streaming import StreamingFingerprinter
+from voting import _pair_offsets, shortlist, pick_best
+
+WINDOW_SEC = 10.0
+HOP_SEC = 2.5
+# audio decoded, fingerprinted and looked up at a time
+CHUNK_SEC = 30.0
+# per-window thresholds; a window is shorter than a typical query clip
+MIN_WINDOW_VOTES = 40
+RATIO_THRESHOLD = 2.5
+# bins with fewer votes in a chunk are chance coincidences, not kept
+MIN_BIN_VOTES = 2
+# windows of one song whose offsets differ by less are the same playback
+OFFSET_TOLERANCE = 0.2
+# unmatched windows bridged inside a segment (talk-over, a scratch)
+MAX_GAP_WINDOWS = 2
+
+
+def _runs(*columns):
+    """
+    Sort rows by the columns (first one primary) and find runs of equal rows.
+
+    Returns:
+        tuple: (order, starts) where starts index into the sorted rows
+    """
+
+    order = np.lexsort(columns[::-1])
+    change = np.zeros(len(order), dtype=bool)
+    change[:1] = True
+    for col in columns:
+        c = col[order]
+        change[1:] |= c[1:] != c[:-1]
+    return order, np.flatnonzero(change)
+
+
+def _empty_votes():
+    i = np.empty(0, dtype=np.int64)
+    return i, i, i, i, np.empty(0), np.empty(0)
+
+
+def _reduce_votes(block, song, offset_bin, count, t_first, t_last):
+    # merge rows with the same (block, song, offset_bin)
+    if len(block) == 0:
+        return _empty_votes()
+    order, starts = _runs(block, song, offset_bin)
+    head = order[starts]
+    return (
+        block[head], song[head], offset_bin[head],
+        np.add.reduceat(count[order], starts),
+        np.minimum.reduceat(t_first[order], starts),
+        np.maximum.reduceat(t_last[order], starts),
+    )
+
+
+def block_votes(query_hashes, query_times, postings, hop_sec=HOP_SEC, candidate_k=CANDIDATE_K):
+    """
+    (block, song, offset) vote counts for one chunk of query landmarks.
+
+    Returns:
+        tuple of arrays: (block, song_idx, offset_bin, count, t_first, t_last)
+            song_idx indexes the postings' song_ids; t_first and t_last are
+            the earliest and latest query anchor that voted for the bin
+    """
+
+    db_hashes, db_song_idx, db_times, _ = postings
+    if len(db_hashes) == 0 or len(query_hashes) == 0:
+        return _empty_votes()
+
+    keep = shortlist(db_song_idx, candidate_k)
+    db_hashes, db_song_idx, db_times = db_hashes[keep], db_song_idx[keep], db_times[keep]
+
+    posting, offset_bins = _pair_offsets(
+        query_hashes, query_times, db_hashes, db_times, OFFSET_ROUND
+    )
+    if len(posting) == 0:
+        return _empty_votes()
+
+    # a pair's query time is its posting's time plus the offset
+    t_query = db_times[posting] + offset_bins / 10.0 ** OFFSET_ROUND
+    block = (t_query // hop_sec).astype(np.int64)
+    song = np.asarray(db_song_idx, dtype=np.int64)[posting]
+
+    votes = _reduce_votes(
+        block, song, offset_bins, np.ones(len(posting), dtype=np.int64), t_query, t_query
+    )
+    strong = votes[3] >= MIN_BIN_VOTES
+    return tuple(col[strong] for col in votes)
+
+
+class LongFormScanner:
+    """
+    Accumulates block votes over a long recording, then slices them into
+    windows and merges the windows into a timeline.
+
+    add() takes the landmarks of each newly fingerprinted chunk (see
+    streaming.StreamingFingerprinter), in any order.
+    """
+
+    def __init__(
+        self,
+        window_sec=WINDOW_SEC,
+        hop_sec=HOP_SEC,
+        min_vote_threshold=MIN_WINDOW_VOTES,
+        ratio_threshold=RATIO_THRESHOLD,
+        index=None,
+        stop_hashes=None,
+        candidate_k=CANDIDATE_K,
+    ):
+        self.hop_sec = hop_sec
+        # a window is a whole number of blocks
+        self.window_blocks = max(1, int(round(window_sec / hop_sec)))
+        self.window_sec = self.window_blocks * hop_sec
+        self.min_vote_threshold = min_vote_threshold
+        self.ratio_threshold = ratio_threshold
+        self.index = index
+        self.stop_hashes = stop_hashes
+        self.candidate_k = candidate_k
+
+        self.song_ids = []          # global song idx -> song_id
+        self._song_idx = {}
+        self._chunks = []           # block_votes() output per chunk, global song idx
+        self._votes = None
+
+    def _intern(self, song_id):
+        idx = self._song_idx.get(song_id)
+        if idx is None:
+            idx = self._song_idx[song_id] = len(self.song_ids)
+            self.song_ids.append(song_id)
+        return idx
+
+    def add(self, query_hashes, query_times):
+        if self.stop_hashes is not None:
+            keep = self.stop_hashes.keep_mask(query_hashes)
+            query_hashes, query_times = query_hashes[keep], query_times[keep]
+        if len(query_hashes) == 0:
+            return
+
+        postings = fetch_postings(np.unique(query_hashes), self.index)
+        block, song, offset_bin, count, t_first, t_last = block_votes(
+            query_hashes, query_times, postings, self.hop_sec, self.candidate_k
+        )
+        if len(block):
+            song_ids = postings[3]
+            local = np.array([self._intern(song_ids[i]) for i in range(len(song_ids))])
+            self._chunks.append((block, local[song], offset_bin, count, t_first, t_last))
+        self._votes = None
+
+    def block_table(self):
+        """
+        Returns:
+            tuple of arrays: (block, song_idx, offset_bin, count, t_first,
+                t_last) over the whole recording, song_idx into song_ids
+        """
+
+        if self._votes is None:
+            if self._chunks:
+                # a block can straddle two chunks, merge its rows
+                cols = [np.concatenate(c) for c in zip(*self._chunks)]
+                self._votes = _reduce_votes(*cols)
+            else:
+                self._votes = _empty_votes()
+        return self._votes
+
+    def windows(self):
+        """
+        Decide every window.
+
+        Returns:
+            list of dict: one per window with votes, in time order:
+                {window, start, end, song_id, votes, status, offset,
+                margin} where offset is the winning bin in seconds and
+                margin = best / (best + second best) votes
+        """
+
+        block, song, offset_bin, count, _, _ = self.block_table()
+        if len(block) == 0:
+            return []
+
+        # spread every block row over the windows that contain the block
+        k = self.window_blocks
+        w = np.concatenate([block - j for j in range(k)])
+        rows = np.tile(np.arange(len(block)), k)
+        valid = w >= 0
+        w, rows = w[valid], rows[valid]
+
+        order, starts = _runs(w, song[rows], offset_bin[rows])
+        win = w[order][starts]
+        win_song = song[rows][order][starts]
+        win_bin = offset_bin[rows][order][starts]
+        win_count = np.add.reduceat(count[rows][order], starts)
+
+        scale = 10.0 ** OFFSET_ROUND
+        results = []
+        bounds = np.flatnonzero(np.r_[True, win[1:] != win[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            songs, bins, counts = win_song[lo:hi], win_bin[lo:hi], win_count[lo:hi]
+
+            # per song: its best bin (first maximum = smallest offset)
+            seg = np.flatnonzero(np.r_[True, songs[1:] != songs[:-1]])
+            seg_max = np.maximum.reduceat(counts, seg)
+            best, best_votes, second_best_votes = pick_best(seg_max)
+
+            seg_end = np.r_[seg[1:], len(songs)]
+            top = seg[best] + int(np.argmax(counts[seg[best]:seg_end[best]]))
+            best_id = self.song_ids[songs[top]]
+
+            song_id, votes, status = decide(
+                best_id, best_votes, second_best_votes,
+                self.min_vote_threshold, self.ratio_threshold,
+            )
+            start = int(win[lo]) * self.hop_sec
+            results.append({
+                "window": int(win[lo]),
+                "start": start,
+                "end": start + self.window_sec,
+                "song_id": song_id,
+                "votes": votes,
+                "status": status,
+                "offset": bins[top] / scale,
+                "margin": best_votes / (best_votes + second_best_votes),
+            })
+        return results
+
+    def timeline(self):
+        """
+        Merge matched windows into segments.
+
+        Returns:
+            list of dict: {song_id, start, end, song_start, votes,
+                confidence} in time order. start/end are seconds into the
+                recording, from the first to the last query anchor that
+                voted for the segment; song_start is where in the song the
+                segment begins; confidence is the mean window margin.
+        """
+
+        segments = []
+        current = None
+        for win in self.windows():
+            if win["song_id"] is None:
+                continue
+
+            if (
+                current is not None
+                and win["song_id"] == current["song_id"]
+                and abs(win["offset"] - current["offsets"][-1]) <= OFFSET_TOLERANCE
+                and win["window"] - current["last"] - 1 <= MAX_GAP_WINDOWS
+            ):
+                current["last"] = win["window"]
+                current["offsets"].append(win["offset"])
+                current["margins"].append(win["margin"])
+                continue
+
+            if current is not None:
+                segments.append(self._finish(current))
+            current = {
+                "song_id": win["song_id"],
+                "first": win["window"],
+                "last": win["window"],
+                "offsets": [win["offset"]],
+                "margins": [win["margin"]],
+            }
+
+        if current is not None:
+            segments.append(self._finish(current))
+        return segments
+
+    def _finish(self, segment):
+        # span and votes from the blocks that voted for this playback
+        block, song, offset_bin, count, t_first, t_last = self.block_table()
+        scale = 10.0 ** OFFSET_ROUND
+        offset = offset_bin / scale
+        mine = (
+            (song == self._song_idx[segment["song_id"]])
+            & (block >= segment["first"])
+            & (block < segment["last"] + self.window_blocks)
+            & (offset >= min(segment["offsets"]) - OFFSET_TOLERANCE)
+            & (offset <= max(segment["offsets"]) + OFFSET_TOLERANCE)
+        )
+
+        start = float(t_first[mine].min())
+        end = float(t_last[mine].max())
+        return {
+            "song_id": segment["song_id"],
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "song_start": round(start - segment["offsets"][0], 2),
+            "votes": int(count[mine].sum()),
+            "confidence": round(float(np.mean(segment["margins"])), 3),
+        }
+
+
+def scan_chunks(chunks, sr=SAMPLE_RATE, frontend=DEFAULT_FRONTEND, peaks_per_sec=None, **scanner_kwargs):
+    """
+    Scan a recording given as successive mono sample arrays.
+
+    Parameters:
+        chunks (iterable): float32 sample arrays, e.g. decode_file_chunks
+        frontend (str): the index's front-end, "stft" or "mel"
+        peaks_per_sec (float | None): the index's peak budget
+        scanner_kwargs: see LongFormScanner
+
+    Returns:
+        list of dict: the timeline, see LongFormScanner.timeline
+    """
+
+    fingerprinter = StreamingFingerprinter(sr=sr, frontend=frontend, peaks_per_sec=peaks_per_sec)
+    scanner = LongFormScanner(**scanner_kwargs)
+
+    for samples in chunks:
+        scanner.add(*fingerprinter.push(samples))
+    scanner.add(*fingerprinter.finish())
+
+    return scanner.timeline()
+
+
+def scan_file(path, chunk_sec=CHUNK_SEC, frontend=DEFAULT_FRONTEND, peaks_per_sec=None, **scanner_kwargs):
+    return scan_chunks(
+        decode_file_chunks(path, SAMPLE_RATE, chunk_sec), SAMPLE_RATE, frontend, peaks_per_sec,
+        **scanner_kwargs,
+    )
+
+
+def _clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import os
+    import sys
+    import time
+
+    from db import songs_col
+    from index_to_db import index_settings
+
+    parser = argparse.ArgumentParser(description="Find every catalog song in a long recording.")
+    parser.add_argument("path")
+    parser.add_argument("--window", type=float, default=WINDOW_SEC, help="window length (s)")
+    parser.add_argument("--hop", type=float, default=HOP_SEC, help="window step (s)")
+    parser.add_argument("--min-votes", type=int, default=MIN_WINDOW_VOTES)
+    parser.add_argument("--ratio", type=float, default=RATIO_THRESHOLD)
+    parser.add_argument("--json", action="store_true", help="print one JSON line per segment")
+    args = parser.parse_args()
+
+    index = None
+    if os.getenv("INDEX_FILE"):
+        from inverted_index import InvertedIndex
+        index = InvertedIndex.open(os.getenv("INDEX_FILE"))
+
+    start = time.perf_counter()
+    timeline = scan_file(
+        args.path,
+        window_sec=args.window, hop_sec=args.hop,
+        min_vote_threshold=args.min_votes, ratio_threshold=args.ratio,
+        index=index, **index_settings(),
+    )
+    elapsed = time.perf_counter() - start
+
+    titles = {
+        d["song_id"]: d.get("title", d["song_id"])
+        for d in songs_col.find(
+            {"song_id": {"$in": [s["song_id"] for s in timeline]}}, {"song_id": 1, "title": 1}
+        )
+    }
+    for segment in timeline:
+        title = titles.get(segment["song_id"], segment["song_id"])
+        if args.json:
+            print(json.dumps({**segment, "title": title}))
+        else:
+            print(
+                f"{_clock(segment['start'])} - {_clock(segment['end'])}  {title}"
+                f"  (from {_clock(max(0, segment['song_start']))},"
+                f" {segment['votes']} votes, confidence {segment['confidence']})"
+            )
+
+    print(f"scanned in {elapsed:.1f}s", file=sys.stderr)
@@ -0,0 +1,102 @@
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/bench_landmarks.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from landmark_generation import landmarks_from_peaks
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+DURATION_SEC = 240          # 4-minute track
+SR = 22050
+HOP_LENGTH = 512
+N_FFT = 2048
+PEAKS_PER_FRAME = 3         # roughly what find_peaks gives on full mixes
+FANOUT = 5
+MAX_DT = 2.0
+REPEATS = 10                # the vectorized path is a few ms, best-of-3 was too noisy
+TARGET_SPEEDUP = 10
+
+
+def reference_landmarks(peaks, fanout=5, max_dt=2.0):
+    # the original nested-loop implementation, kept here for comparison
+    peaks = sorted(peaks, key=lambda x: x[0])
+    landmarks = []
+
+    for i, (t1, f1) in enumerate(peaks):
+        targets = 0
+
+        for j in range(i + 1, len(peaks)):
+            t2, f2 = peaks[j]
+            dt = t2 - t1
+
+            if dt <= 0:
+                continue
+            if dt > max_dt:
+                break
+
+            landmarks.append((f1, f2, dt, t1))
+            targets += 1
+
+            if targets >= fanout:
+                break
+
+    return landmarks
+
+
+def synthetic_peaks(rng):
+    # peaks in the same (frame -> time, bin -> Hz) grid find_peaks produces
+    n_frames = int(DURATION_SEC * SR / HOP_LENGTH)
+    counts = rng.poisson(PEAKS_PER_FRAME, size=n_frames)
+    frames = np.repeat(np.arange(n_frames), counts)
+    bins = rng.integers(0, N_FFT // 2 + 1, size=len(frames))
+
+    # find_peaks returns peaks in (freq, time) row-major order
+    order = np.lexsort((frames, bins))
+    times = frames[order] * HOP_LENGTH / SR
+    freqs = bins[order] * SR / N_FFT
+    return times, freqs
+
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    # usage: python scripts/bench_landmarks.py [path/to/4min_track.mp3]
+    if len(sys.argv) > 1:
+        from fingerprint import load_audio, spectrogram, peaks
+        y, sr = load_audio(sys.argv[1])
+        times, freqs = peaks(spectrogram(y, sr), sr)
+        label = sys.argv[1]
+    else:
+        times, freqs = synthetic_peaks(np.random.default_rng(0))
+        label = f"synthetic {DURATION_SEC}s track"
+
+    # same shape find_peaks hands to the old loop: (np.float64, np.float64) tuples
+    peak_list = list(zip(times, freqs))
+
+    print(f"{label}: {len(peak_list)} peaks")
+
+    ref_time, ref = best_of(lambda: reference_landmarks(peak_list, FANOUT, MAX_DT))
+    vec_time, vec = best_of(lambda: landmarks_from_peaks(times, freqs, FANOUT, MAX_DT))
+
+    same = len(ref) == len(vec) and all(
+        row == tuple(map(float, r)) for row, r in zip(vec.tolist(), ref)
+    )
+
+    print(f"reference : {ref_time * 1000:8.1f} ms  ({len(ref)} landmarks)")
+    print(f"vectorized: {vec_time * 1000:8.1f} ms  ({len(vec)} landmarks)")
+    print(f"speedup   : {ref_time / vec_time:8.1f}x (target {TARGET_SPEEDUP}x: "
+          f"{'met' if ref_time / vec_time >= TARGET_SPEEDUP else 'missed'})")
+    print(f"identical : {same}")
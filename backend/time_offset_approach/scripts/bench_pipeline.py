@@ -0,0 +1,333 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import wave
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/bench_pipeline.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from decoding import decode_bytes
+from fingerprint import spectrogram, peaks, landmarks, hashes_from_landmarks, fingerprint_samples
+from inverted_index import InvertedIndex
+from voting import vote_on_postings
+from scanning import scan_chunks, CHUNK_SEC
+from spectogram import SAMPLE_RATE
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# everything below is generated from SEED, so two runs see the same audio
+SEED = 0
+N_SONGS = 50                # indexed catalog
+N_UNKNOWN = 10              # songs that are never indexed, queried as negatives
+SONG_SEC = 30
+NOTES_PER_SEC = 8
+QUERY_SEC = 10
+N_QUERIES = 100             # per noise level, ~1/6 of them from unknown songs
+SNR_DB = [None, 10, 0]      # None = clean clip
+MAX_SHIFT_SAMPLES = 512     # sub-hop misalignment applied to every query
+SCAN_SEC = 3600             # long-form scan: one hour of catalog songs back to back
+OUT_DIR = "bench_results"
+
+# lookup_mem is InvertedIndex.fetch_postings in memory, not the Mongo $in
+# query the service runs without INMEMORY_INDEX / INDEX_FILE
+STAGES = ["decode", "stft", "peaks", "landmarks", "hashing", "lookup_mem", "voting"]
+
+
+def synthetic_song(rng, seconds=SONG_SEC, sr=SAMPLE_RATE):
+    # decaying harmonic notes at random pitches and onsets, enough spectral
+    # structure for peak picking to behave like it does on music
+    n = int(seconds * sr)
+    y = np.zeros(n, dtype=np.float32)
+    for _ in range(int(seconds * NOTES_PER_SEC)):
+        start = rng.integers(0, n)
+        length = min(int(rng.uniform(0.1, 0.6) * sr), n - start)
+        t = np.arange(length) / sr
+        f0 = 440.0 * 2 ** ((rng.integers(40, 90) - 69) / 12)
+        envelope = np.exp(-t * rng.uniform(3, 12)) * rng.uniform(0.2, 1.0)
+        note = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3) if f0 * k < sr / 2)
+        y[start:start + length] += (envelope * note).astype(np.float32)
+    return y / max(1e-9, np.abs(y).max())
+
+
+def wav_bytes(y, sr=SAMPLE_RATE):
+    # what an upload looks like: an encoded file, decoded again by ffmpeg
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((np.clip(y, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def synthetic_query(rng, song, snr_db, sr=SAMPLE_RATE):
+    # a clip from a random position, shifted by a fraction of a hop, plus noise
+    start = rng.integers(0, len(song) - QUERY_SEC * sr - MAX_SHIFT_SAMPLES)
+    start += rng.integers(0, MAX_SHIFT_SAMPLES)
+    clip = song[start:start + QUERY_SEC * sr].copy()
+    if snr_db is not None:
+        noise = rng.standard_normal(len(clip)).astype(np.float32)
+        noise *= np.sqrt(np.mean(clip ** 2) / 10 ** (snr_db / 10))
+        clip += noise
+        clip /= max(1e-9, np.abs(clip).max())
+    return clip, start / sr
+
+
+def percentiles(samples_ms):
+    a = np.asarray(samples_ms)
+    return {
+        "mean": round(float(a.mean()), 3),
+        "p50": round(float(np.percentile(a, 50)), 3),
+        "p95": round(float(np.percentile(a, 95)), 3),
+        "p99": round(float(np.percentile(a, 99)), 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 ** 2 if platform.system() == "Darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_catalog(rng):
+    songs = [synthetic_song(rng) for _ in range(N_SONGS + N_UNKNOWN)]
+
+    start = time.perf_counter()
+    hashes, song_idx, t_anchors = [], [], []
+    for i, y in enumerate(songs[:N_SONGS]):
+        h, t = fingerprint_samples(y, SAMPLE_RATE)
+        hashes.append(h)
+        song_idx.append(np.full(len(h), i))
+        t_anchors.append(t)
+    index = InvertedIndex.from_arrays(
+        np.concatenate(hashes), np.concatenate(song_idx), np.concatenate(t_anchors),
+        [f"song{i}" for i in range(N_SONGS)],
+    )
+    elapsed = time.perf_counter() - start
+
+    indexing = {
+        "songs": N_SONGS,
+        "postings": int(sum(len(h) for h in hashes)),
+        "sec": round(elapsed, 3),
+        "songs_per_sec": round(N_SONGS / elapsed, 2),
+        "audio_x_realtime": round(N_SONGS * SONG_SEC / elapsed, 1),
+    }
+    return songs, index, indexing
+
+
+def run_query(data, index):
+    """
+    One query through every stage.
+
+    Returns:
+        tuple: (stage -> seconds, (song_id, votes, status))
+    """
+
+    timings = {}
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    y, sr = timed("decode", decode_bytes, data, SAMPLE_RATE, ".wav")
+    S_db = timed("stft", spectrogram, y, sr)
+    times, freqs = timed("peaks", peaks, S_db, sr)
+    lm = timed("landmarks", landmarks, times, freqs)
+    q_hashes, q_times = timed("hashing", hashes_from_landmarks, lm)
+    postings = timed("lookup_mem", index.fetch_postings, np.unique(q_hashes))
+    result = timed("voting", vote_on_postings, q_hashes, q_times, postings)
+    return timings, result
+
+
+def run_scan(rng, songs, index):
+    """
+    scanning.scan_chunks over SCAN_SEC of catalog songs played back to
+    back, fed CHUNK_SEC at a time like decode_file_chunks would. Decoding
+    is not included.
+    """
+
+    played = rng.integers(0, N_SONGS, size=int(np.ceil(SCAN_SEC / SONG_SEC)))
+    mix = np.concatenate([songs[i] for i in played])[: SCAN_SEC * SAMPLE_RATE]
+    step = int(CHUNK_SEC * SAMPLE_RATE)
+
+    start = time.perf_counter()
+    timeline = scan_chunks(
+        (mix[i:i + step] for i in range(0, len(mix), step)), SAMPLE_RATE, index=index
+    )
+    elapsed = time.perf_counter() - start
+
+    # a playback counts as found if a segment of that song overlaps it
+    found = sum(
+        any(
+            seg["song_id"] == f"song{song}"
+            and seg["start"] < (k + 1) * SONG_SEC and seg["end"] > k * SONG_SEC
+            for seg in timeline
+        )
+        for k, song in enumerate(played)
+    )
+    return {
+        "audio_sec": SCAN_SEC,
+        "sec": round(elapsed, 2),
+        "x_realtime": round(SCAN_SEC / elapsed, 1),
+        "segments": len(timeline),
+        "playbacks_found": round(found / len(played), 4),
+    }
+
+
+def run(seed=SEED, scan_only=False):
+    rng = np.random.default_rng(seed)
+    songs, index, indexing = build_catalog(rng)
+    print(
+        f"indexed {indexing['songs']} songs ({indexing['postings']} postings) in "
+        f"{indexing['sec']:.1f}s, {indexing['audio_x_realtime']}x real time",
+        flush=True,
+    )
+
+    levels = {}
+    for snr_db in [] if scan_only else SNR_DB:
+        stage_ms = {stage: [] for stage in STAGES}
+        total_ms = []
+        correct = 0
+
+        queries = []
+        for _ in range(N_QUERIES):
+            song = int(rng.integers(0, N_SONGS + N_UNKNOWN))
+            clip, _ = synthetic_query(rng, songs[song], snr_db)
+            queries.append((song, wav_bytes(clip)))
+
+        start = time.perf_counter()
+        for song, data in queries:
+            timings, (song_id, _, _) = run_query(data, index)
+            for stage, sec in timings.items():
+                stage_ms[stage].append(sec * 1000)
+            total_ms.append(sum(timings.values()) * 1000)
+
+            expected = f"song{song}" if song < N_SONGS else None
+            correct += song_id == expected
+        elapsed = time.perf_counter() - start
+
+        label = "clean" if snr_db is None else f"snr_{snr_db}db"
+        levels[label] = {
+            "queries": N_QUERIES,
+            "accuracy": round(correct / N_QUERIES, 4),
+            "queries_per_sec": round(N_QUERIES / elapsed, 2),
+            "total_ms": percentiles(total_ms),
+            "stages_ms": {stage: percentiles(ms) for stage, ms in stage_ms.items()},
+        }
+        print(
+            f"{label:>10}: accuracy {correct / N_QUERIES:.2%}, "
+            f"{N_QUERIES / elapsed:.1f} queries/s, "
+            f"p50 {levels[label]['total_ms']['p50']:.1f} ms, "
+            f"p99 {levels[label]['total_ms']['p99']:.1f} ms",
+            flush=True,
+        )
+
+    # its own stream, so --scan-only and a full run scan the same hour
+    scan = run_scan(np.random.default_rng([seed, 1]), songs, index)
+    print(
+        f"{'scan':>10}: {scan['audio_sec'] / 3600:.1f} h of audio in {scan['sec']:.1f}s, "
+        f"{scan['x_realtime']}x real time, {scan['playbacks_found']:.2%} of playbacks found",
+        flush=True,
+    )
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": {
+            "seed": seed, "n_songs": N_SONGS, "n_unknown": N_UNKNOWN, "song_sec": SONG_SEC,
+            "query_sec": QUERY_SEC, "n_queries": N_QUERIES, "snr_db": SNR_DB,
+            "scan_sec": SCAN_SEC, "scan_only": scan_only,
+        },
+        "indexing": indexing,
+        "queries": levels,
+        "scan": scan,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_stages(results):
+    if not results["queries"]:
+        return
+    print(f"\n{'stage':>10} | " + " | ".join(f"{label:>22}" for label in results["queries"]))
+    print(f"{'':>10} | " + " | ".join(f"{'p50 / p95 / p99 ms':>22}" for _ in results["queries"]))
+    for stage in STAGES + ["total"]:
+        cells = []
+        for level in results["queries"].values():
+            p = level["total_ms"] if stage == "total" else level["stages_ms"][stage]
+            cells.append(f"{p['p50']:6.2f} / {p['p95']:6.2f} / {p['p99']:6.2f}")
+        print(f"{stage:>10} | " + " | ".join(f"{c:>22}" for c in cells))
+    print(f"\npeak RSS: {results['peak_rss_mb']} MB")
+
+
+def compare(old, new):
+    # p50 per stage, old -> new; ratios above 1 are slowdowns
+    print(f"\ncompared with {old['commit']} ({old['date']}):")
+    for label, level in new["queries"].items():
+        if label not in old["queries"]:
+            continue
+        before = old["queries"][label]
+        print(f"  {label}: accuracy {before['accuracy']:.2%} -> {level['accuracy']:.2%}")
+        for stage in STAGES:
+            if stage not in before["stages_ms"]:
+                continue
+            a = before["stages_ms"][stage]["p50"]
+            b = level["stages_ms"][stage]["p50"]
+            ratio = b / a if a else float("inf")
+            flag = "  <-- slower" if ratio > 1.1 else ""
+            print(f"    {stage:>10}: {a:8.2f} -> {b:8.2f} ms ({ratio:.2f}x){flag}")
+    if "scan_only" not in old["config"]:
+        # older results drew the scan from the query stream, a different hour
+        print("  one-hour scan: not comparable, re-run the old commit")
+    else:
+        print(f"  one-hour scan: {old['scan']['sec']:.1f} -> {new['scan']['sec']:.1f} s")
+    if old["config"].get("scan_only") == new["config"]["scan_only"]:
+        print(f"  peak RSS: {old['peak_rss_mb']} -> {new['peak_rss_mb']} MB")
+    else:
+        print("  peak RSS: not comparable between --scan-only and a full run")
+
+
+if __name__ == "__main__":
+    # usage: python scripts/bench_pipeline.py                 writes bench_results/<commit>.json
+    #        python scripts/bench_pipeline.py --compare bench_results/abc1234.json
+    parser = argparse.ArgumentParser(description="Time every stage of fingerprinting and matching.")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", help=f"result file (default {OUT_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--scan-only", action="store_true", help="skip the query levels, time only the scan")
+    args = parser.parse_args()
+
+    results = run(args.seed, args.scan_only)
+    print_stages(results)
+
+    out = args.out or os.path.join(OUT_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
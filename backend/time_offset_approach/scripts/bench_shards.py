@@ -0,0 +1,110 @@
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/bench_shards.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from hashing import F1_SHIFT, F2_SHIFT
+from inverted_index import InvertedIndex
+from sharding import ShardedStore, balanced_boundaries
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+N_SONGS = 1000
+LANDMARKS_PER_SONG = 5000
+QUERY_HASHES = 2000
+SHARD_COUNTS = [1, 2, 4, 8, 16]
+# remote shards: fixed round trip plus transfer per returned posting
+RTT_MS = 5.0
+PER_POSTING_US = 2.0
+REPEATS = 5
+
+
+class RemoteShard:
+    # an in-memory shard that sleeps like a Mongo round trip would
+    def __init__(self, index):
+        self.index = index
+
+    def fetch_postings(self, hashes):
+        result = self.index.fetch_postings(hashes)
+        time.sleep(RTT_MS / 1000 + len(result[0]) * PER_POSTING_US / 1e6)
+        return result
+
+
+def synthetic_catalog(rng):
+    # f1/f2 skewed towards low bins like real music, dt uniform
+    n = N_SONGS * LANDMARKS_PER_SONG
+    f1 = np.minimum(rng.exponential(120, n), 1102).astype(np.uint32)
+    f2 = np.minimum(rng.exponential(120, n), 1102).astype(np.uint32)
+    dt = rng.integers(1, 21, n).astype(np.uint32)
+    hashes = (f1 << F1_SHIFT) | (f2 << F2_SHIFT) | dt
+    song_idx = np.repeat(np.arange(N_SONGS), LANDMARKS_PER_SONG)
+    t_anchors = rng.random(n) * 240
+    return hashes, song_idx, t_anchors, [f"song{i}" for i in range(N_SONGS)]
+
+
+def build_store(catalog, n_shards, remote):
+    hashes, song_idx, t_anchors, song_ids = catalog
+    boundaries = balanced_boundaries(hashes[::97], n_shards)
+    owner = np.searchsorted(boundaries, hashes, side="right")
+
+    shards = []
+    for i in range(len(boundaries) + 1):
+        m = owner == i
+        index = InvertedIndex.from_arrays(hashes[m], song_idx[m], t_anchors[m], song_ids)
+        shards.append(RemoteShard(index) if remote else index)
+    return ShardedStore(shards, boundaries)
+
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_mongo(n_shards):
+    from db import fingerprints_col
+    from match_from_db import fetch_postings
+
+    sample = [d["hash"] for d in fingerprints_col.aggregate([
+        {"$sample": {"size": QUERY_HASHES}}, {"$project": {"hash": 1, "_id": 0}},
+    ])]
+    query = np.unique(np.array(sample, dtype=np.uint32))
+
+    single, result = best_of(lambda: fetch_postings(query))
+    print(f"1 collection : {single * 1000:8.1f} ms  ({len(result[0])} postings)")
+
+    store = ShardedStore.from_db(fingerprints_col, n_shards)
+    sharded, result = best_of(lambda: store.fetch_postings(query))
+    print(f"{n_shards} shards     : {sharded * 1000:8.1f} ms  ({len(result[0])} postings)")
+
+
+if __name__ == "__main__":
+    # usage: python scripts/bench_shards.py          synthetic, local + simulated remote shards
+    #        python scripts/bench_shards.py --mongo N  real shards written by sharding.py --split N
+    if len(sys.argv) > 2 and sys.argv[1] == "--mongo":
+        bench_mongo(int(sys.argv[2]))
+        sys.exit()
+
+    rng = np.random.default_rng(0)
+    catalog = synthetic_catalog(rng)
+    query = np.unique(rng.choice(catalog[0], QUERY_HASHES))
+
+    print(f"{len(catalog[0])} postings, {N_SONGS} songs, {len(query)} query hashes")
+    print(f"remote shards: {RTT_MS} ms round trip + {PER_POSTING_US} us/posting\n")
+    print(f"{'shards':>6} | {'local ms':>9} | {'remote ms':>9} | postings")
+
+    for n_shards in SHARD_COUNTS:
+        local_store = build_store(catalog, n_shards, False)
+        remote_store = build_store(catalog, n_shards, True)
+
+        local, result = best_of(lambda: local_store.fetch_postings(query))
+        remote, _ = best_of(lambda: remote_store.fetch_postings(query))
+        print(f"{len(local_store):>6} | {local * 1000:9.2f} | {remote * 1000:9.2f} | {len(result[0])}")
@@ -0,0 +1,95 @@
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/check_streaming.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_pipeline import synthetic_song
+from fingerprint import fingerprint_samples
+from inverted_index import InvertedIndex
+from spectogram import SAMPLE_RATE
+from streaming import StreamingFingerprinter
+from voting import vote_on_postings
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+SEED = 0
+CLIP_SEC = 30
+CHUNK_SEC = 0.25            # MediaRecorder-sized pushes
+# level shapes applied to the same clip; the streaming path only sees the
+# loudness so far, the offline path the whole clip's maximum
+ENVELOPES = {
+    "steady": lambda t: np.ones_like(t),
+    "fade_in": lambda t: 10 ** ((-40 + 40 * t / t[-1]) / 20),      # -40 dB -> 0 dB
+    "quiet_intro": lambda t: np.where(t < 5, 10 ** (-30 / 20), 1.0),  # 5 s at -30 dB
+}
+# allowed (missing + extra) / offline landmarks per envelope, from
+# seeds 0-3 with streaming.WARMUP_SEC = 3 plus some margin
+MAX_DIVERGENCE = {"steady": 0.02, "fade_in": 0.85, "quiet_intro": 0.25}
+
+
+def streamed(y, sr, chunk_sec=CHUNK_SEC, **kwargs):
+    fingerprinter = StreamingFingerprinter(sr=sr, **kwargs)
+    hashes, times = [], []
+    step = int(chunk_sec * sr)
+    for i in range(0, len(y), step):
+        h, t = fingerprinter.push(y[i:i + step])
+        hashes.append(h)
+        times.append(t)
+    h, t = fingerprinter.finish()
+    return np.concatenate(hashes + [h]), np.concatenate(times + [t])
+
+
+def divergence(offline, online):
+    """
+    Returns:
+        tuple: (offline landmarks, missing from streaming, extra in streaming)
+    """
+
+    a = Counter(zip(offline[0].tolist(), np.round(offline[1], 3).tolist()))
+    b = Counter(zip(online[0].tolist(), np.round(online[1], 3).tolist()))
+    return sum(a.values()), sum((a - b).values()), sum((b - a).values())
+
+
+def votes(index, query):
+    # best-offset votes for the indexed song, what the match decision sees
+    hashes, times = query
+    return vote_on_postings(hashes, times, index.fetch_postings(np.unique(hashes)), min_vote_threshold=0)[1]
+
+
+if __name__ == "__main__":
+    # usage: python scripts/check_streaming.py [--seed N]
+    parser = argparse.ArgumentParser(description="Compare streaming and offline fingerprints.")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    song = synthetic_song(np.random.default_rng(args.seed), seconds=CLIP_SEC)
+    t = np.arange(len(song)) / SAMPLE_RATE
+
+    # the song as indexed: offline, at its original level
+    h, t_anchor = fingerprint_samples(song, SAMPLE_RATE)
+    index = InvertedIndex.from_arrays(h, np.zeros(len(h), dtype=np.int64), t_anchor, ["song"])
+
+    failed = False
+    print(
+        f"{'envelope':>12} | {'offline':>7} | {'missing':>7} | {'extra':>7} | {'divergence':>10} | "
+        f"{'votes offline / streamed':>24}"
+    )
+    for name, envelope in ENVELOPES.items():
+        y = (song * envelope(t)).astype(np.float32)
+        offline, online = fingerprint_samples(y, SAMPLE_RATE), streamed(y, SAMPLE_RATE)
+        total, missing, extra = divergence(offline, online)
+        share = (missing + extra) / max(1, total)
+        ok = share <= MAX_DIVERGENCE[name]
+        failed |= not ok
+        print(
+            f"{name:>12} | {total:7d} | {missing:7d} | {extra:7d} | {share:10.2%} | "
+            f"{votes(index, offline):>11d} / {votes(index, online):<10d}"
+            f"{'' if ok else f'  > {MAX_DIVERGENCE[name]:.0%} allowed'}"
+        )
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,164 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/eval_candidates.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_pipeline import synthetic_song, synthetic_query
+from fingerprint import fingerprint_file, fingerprint_samples
+from hash_stats import cap_repeats, MAX_POSTINGS_PER_HASH
+from inverted_index import InvertedIndex
+from match_from_db import fetch_postings
+from spectogram import SAMPLE_RATE
+from voting import vote_offsets, shortlist, pick_best, decide
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# same layout as chromaprint_approach/evaluation_test.py:
+# one folder per expected song title, "unknown" for songs not in the DB
+EVAL_DIR = Path("../chromaprint_approach/evaluation")
+K_VALUES = [None, 200, 100, 50, 20, 10, 5]
+AUDIO_EXTENSIONS = {".m4a", ".mp3", ".wav"}
+MIN_VOTE_THRESHOLD = 100
+RATIO_THRESHOLD = 2.5
+REPEATS = 3
+# --synthetic: queries, cycling through these noise levels (None = clean)
+SYNTHETIC_QUERIES = 300
+SYNTHETIC_SNR_DB = [None, 10, 0]
+
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def vote(query_hashes, query_times, postings, k):
+    # stage 1 + stage 2 as in match_from_db.match_hashes
+    db_hashes, db_song_idx, db_times, song_ids = postings
+    keep = shortlist(db_song_idx, k)
+    songs, votes, _ = vote_offsets(
+        query_hashes, query_times, db_hashes[keep], db_song_idx[keep], db_times[keep]
+    )
+    best, best_votes, second_best_votes = pick_best(votes)
+    top_id = song_ids[songs[best]] if best is not None else None
+    song_id, _, _ = decide(
+        top_id, best_votes, second_best_votes, MIN_VOTE_THRESHOLD, RATIO_THRESHOLD
+    )
+    return top_id, song_id
+
+
+def service_queries(eval_dir):
+    """
+    Evaluation clips fingerprinted and looked up like the service does it:
+    the collection's front-end and peak budget, its index (shards, index
+    file or in-memory, see batch_identify.load_index) and stop-hashes.
+
+    Returns:
+        tuple: (queries, titles) with queries as (expected, hashes, times,
+            postings) and titles mapping song_id -> title
+    """
+
+    from db import songs_col
+    from batch_identify import load_index, load_stop_hashes
+    from index_to_db import index_settings
+
+    settings = index_settings()
+    index, stop_hashes = load_index(), load_stop_hashes()
+    titles = {d["song_id"]: d["title"] for d in songs_col.find({}, {"song_id": 1, "title": 1})}
+    print(f"settings {settings}, stop-hashes {len(stop_hashes) if stop_hashes else 'off'}", flush=True)
+
+    queries = []
+    for folder in sorted(eval_dir.iterdir()):
+        for audio in sorted(folder.glob("*")):
+            if audio.suffix.lower() in AUDIO_EXTENSIONS:
+                print(f"fingerprinting {audio.name}...", flush=True)
+                hashes, times = fingerprint_file(str(audio), **settings)
+                if stop_hashes is not None:
+                    keep = stop_hashes.keep_mask(hashes)
+                    hashes, times = hashes[keep], times[keep]
+                postings = fetch_postings(np.unique(hashes), index)
+                queries.append((folder.name, hashes, times, postings))
+    return queries, titles
+
+
+def synthetic_queries(n_songs, n_queries=SYNTHETIC_QUERIES, seed=0):
+    """
+    bench_pipeline's generated songs in an in-memory index, queried with
+    noisy clips (a sixth of them from songs that are not indexed), so the
+    tradeoff can be measured without Mongo or audio files.
+    """
+
+    rng = np.random.default_rng(seed)
+    songs = [synthetic_song(rng) for _ in range(n_songs + n_songs // 5)]
+    hashes, song_idx, t_anchors = [], [], []
+    for i, y in enumerate(songs[:n_songs]):
+        h, t = fingerprint_samples(y, SAMPLE_RATE)
+        keep = cap_repeats(h, MAX_POSTINGS_PER_HASH)
+        hashes.append(h[keep])
+        t_anchors.append(t[keep])
+        song_idx.append(np.full(keep.sum(), i))
+    titles = {f"song{i}": f"song{i}" for i in range(n_songs)}
+    index = InvertedIndex.from_arrays(
+        np.concatenate(hashes), np.concatenate(song_idx), np.concatenate(t_anchors), list(titles),
+    )
+
+    queries = []
+    for q in range(n_queries):
+        song = int(rng.integers(0, len(songs)))
+        clip, _ = synthetic_query(rng, songs[song], SYNTHETIC_SNR_DB[q % len(SYNTHETIC_SNR_DB)])
+        h, t = fingerprint_samples(clip, SAMPLE_RATE)
+        expected = f"song{song}" if song < n_songs else "unknown"
+        queries.append((expected, h, t, index.fetch_postings(np.unique(h))))
+    return queries, titles
+
+
+if __name__ == "__main__":
+    # usage: python scripts/eval_candidates.py [evaluation_dir]     the service's collection and settings
+    #        python scripts/eval_candidates.py --synthetic 1000     generated catalog, no Mongo needed
+    parser = argparse.ArgumentParser(description="Shortlist size vs. agreement, accuracy and voting time.")
+    parser.add_argument("eval_dir", nargs="?", type=Path, default=EVAL_DIR)
+    parser.add_argument("--synthetic", type=int, metavar="N", help="generated catalog of N songs instead")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        queries, titles = synthetic_queries(args.synthetic)
+    else:
+        queries, titles = service_queries(args.eval_dir)
+
+    print(f"\n{len(queries)} queries\n")
+    print(
+        f"{'K':>5} | {'top = full':>12} | {'decision = full':>15} | {'correct':>7} | {'postings':>8} | "
+        f"{'avg ms':>7} | {'p95 ms':>7} | {'max ms':>7}"
+    )
+
+    full = [vote(h, t, p, None) for _, h, t, p in queries]
+
+    for k in K_VALUES:
+        same = same_decision = correct = 0
+        times_ms = []
+        for (expected, h, t, p), (full_top, full_decision) in zip(queries, full):
+            elapsed, (top_id, song_id) = best_of(lambda: vote(h, t, p, k))
+            times_ms.append(elapsed * 1000)
+
+            same += top_id == full_top
+            same_decision += song_id == full_decision
+            if expected == "unknown":
+                correct += song_id is None
+            else:
+                correct += titles.get(song_id, "").lower() == expected.lower()
+
+        n = len(queries)
+        print(
+            f"{str(k or 'all'):>5} | {same / n:12.2%} | {same_decision / n:15.2%} | {correct / n:7.2%} | "
+            f"{int(np.mean([len(p[0]) for _, _, _, p in queries])):8d} | "
+            f"{np.mean(times_ms):7.2f} | {np.percentile(times_ms, 95):7.2f} | {np.max(times_ms):7.2f}"
+        )
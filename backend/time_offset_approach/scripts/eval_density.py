@@ -0,0 +1,121 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/eval_density.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from eval_frontends import CATALOG_DIR, EVAL_DIR, FRONTEND_NAMES, audio_files
+from fingerprint import DEFAULT_FRONTEND, fingerprint_samples
+from hash_stats import cap_repeats, MAX_POSTINGS_PER_HASH
+from inverted_index import InvertedIndex
+from match_from_db import vote_on_postings
+from spectogram import SAMPLE_RATE, load_audio
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# same catalog/evaluation layout as eval_frontends.py
+BUDGETS = [None, 50, 30, 20, 10]      # peaks per second, None = fixed -40 dB threshold
+
+
+def build_index(songs, frontend, peaks_per_sec):
+    hashes, song_idx, t_anchors, per_minute = [], [], [], []
+    for i, (_, y, sr) in enumerate(songs):
+        h, t = fingerprint_samples(y, sr, frontend, peaks_per_sec)
+        keep = cap_repeats(h, MAX_POSTINGS_PER_HASH)
+        hashes.append(h[keep])
+        t_anchors.append(t[keep])
+        song_idx.append(np.full(keep.sum(), i))
+        per_minute.append(keep.sum() / (len(y) / sr / 60))
+
+    index = InvertedIndex.from_arrays(
+        np.concatenate(hashes), np.concatenate(song_idx), np.concatenate(t_anchors),
+        [title for title, _, _ in songs],
+    )
+    per_minute = np.asarray(per_minute)
+    return index, {
+        "postings": int(sum(len(h) for h in hashes)),
+        "index_mb": round(index.memory_report()["bytes"] / 2**20, 2),
+        # spread of index size across songs; max / p50 is what the budget bounds
+        "per_song_per_min": {
+            "min": int(per_minute.min()),
+            "p50": int(np.percentile(per_minute, 50)),
+            "p95": int(np.percentile(per_minute, 95)),
+            "max": int(per_minute.max()),
+        },
+        "max_over_p50": round(float(per_minute.max() / max(1.0, np.percentile(per_minute, 50))), 2),
+    }
+
+
+def evaluate(clips, index, frontend, peaks_per_sec):
+    correct = 0
+    fan_out, elapsed_ms = [], []
+    for expected, y, sr in clips:
+        start = time.perf_counter()
+        h, t = fingerprint_samples(y, sr, frontend, peaks_per_sec)
+        postings = index.fetch_postings(np.unique(h))
+        song_id, _, _ = vote_on_postings(h, t, postings)
+        elapsed_ms.append((time.perf_counter() - start) * 1000)
+        fan_out.append(len(postings[0]))
+
+        if expected == "unknown":
+            correct += song_id is None
+        else:
+            correct += (song_id or "").lower() == expected.lower()
+
+    if not clips:
+        return {"clips": 0}
+    return {
+        "clips": len(clips),
+        "accuracy": round(correct / len(clips), 4),
+        "postings_per_query_p50": int(np.percentile(fan_out, 50)),
+        "postings_per_query_max": int(np.max(fan_out)),
+        "query_ms": round(float(np.mean(elapsed_ms)), 2),
+    }
+
+
+if __name__ == "__main__":
+    # usage: python scripts/eval_density.py [--catalog DIR] [--eval DIR] [--budgets 0 40 20] [--frontend mel]
+    parser = argparse.ArgumentParser(description="Index size and accuracy per peaks-per-second budget.")
+    parser.add_argument("--catalog", type=Path, default=CATALOG_DIR)
+    parser.add_argument("--eval", type=Path, default=EVAL_DIR)
+    parser.add_argument("--frontend", choices=FRONTEND_NAMES, default=DEFAULT_FRONTEND)
+    parser.add_argument("--budgets", type=float, nargs="+", help="peaks per second, 0 = fixed threshold")
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    budgets = [b or None for b in args.budgets] if args.budgets else BUDGETS
+
+    songs = [(p.stem, *load_audio(str(p), sr=SAMPLE_RATE)) for p in audio_files(args.catalog)]
+    clips = [
+        (folder.name, *load_audio(str(p), sr=SAMPLE_RATE))
+        for folder in sorted(d for d in args.eval.iterdir() if d.is_dir())
+        for p in audio_files(folder)
+    ]
+    print(f"{len(songs)} catalog songs, {len(clips)} evaluation clips, {args.frontend}\n", flush=True)
+
+    results = {}
+    for budget in budgets:
+        index, indexing = build_index(songs, args.frontend, budget)
+        results[str(budget or "fixed")] = {**indexing, **evaluate(clips, index, args.frontend, budget)}
+
+    print(
+        f"{'peaks/s':>7} | {'postings':>9} | {'index MB':>8} | {'per song/min p50 / p95 / max':>28} | "
+        f"{'max/p50':>7} | {'fan-out p50':>11} | {'query ms':>8} | {'accuracy':>8}"
+    )
+    for budget, r in results.items():
+        spread = r["per_song_per_min"]
+        print(
+            f"{budget:>7} | {r['postings']:9d} | {r['index_mb']:8.2f} | "
+            f"{spread['p50']:>10d} / {spread['p95']:6d} / {spread['max']:6d} | {r['max_over_p50']:7.2f} | "
+            f"{r.get('postings_per_query_p50', 0):11d} | {r.get('query_ms', 0):8.2f} | "
+            f"{r.get('accuracy', 0):8.2%}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# run as `python scripts/eval_frontends.py`: make the service modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fingerprint import FRONTENDS, spectrogram, peaks, landmarks, hashes_from_landmarks
+from hash_stats import cap_repeats, MAX_POSTINGS_PER_HASH
+from inverted_index import InvertedIndex
+from match_from_db import vote_on_postings
+from spectogram import SAMPLE_RATE, load_audio
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# catalog: one audio file per song, the file stem is the song title;
+# evaluation: same layout as chromaprint_approach/evaluation_test.py,
+# one folder per expected title, "unknown" for songs not in the catalog
+CATALOG_DIR = Path("../chromaprint_approach/known_songs")
+EVAL_DIR = Path("../chromaprint_approach/evaluation")
+AUDIO_EXTENSIONS = {".m4a", ".mp3", ".wav"}
+FRONTEND_NAMES = list(FRONTENDS)
+
+
+def audio_files(root):
+    return sorted(p for p in Path(root).rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS)
+
+
+def fingerprint_cpu(y, sr, frontend):
+    """
+    Returns:
+        tuple: (hashes, t_anchors, n_peaks, cpu_sec) where cpu_sec is
+            process time from samples to hashes, decoding excluded
+    """
+
+    start = time.process_time()
+    S_db = spectrogram(y, sr, frontend=frontend)
+    times, freqs = peaks(S_db, sr, frontend=frontend)
+    hashes, t_anchors = hashes_from_landmarks(landmarks(times, freqs))
+    return hashes, t_anchors, len(times), time.process_time() - start
+
+
+def build_index(songs, frontend):
+    hashes, song_idx, t_anchors = [], [], []
+    n_peaks = 0
+    cpu = audio_sec = 0.0
+    for i, (_, y, sr) in enumerate(songs):
+        h, t, n, sec = fingerprint_cpu(y, sr, frontend)
+        keep = cap_repeats(h, MAX_POSTINGS_PER_HASH)
+        hashes.append(h[keep])
+        t_anchors.append(t[keep])
+        song_idx.append(np.full(keep.sum(), i))
+        n_peaks += n
+        cpu += sec
+        audio_sec += len(y) / sr
+    bins = spectrogram(songs[0][1][: SAMPLE_RATE], SAMPLE_RATE, frontend=frontend).shape[0]
+
+    index = InvertedIndex.from_arrays(
+        np.concatenate(hashes), np.concatenate(song_idx), np.concatenate(t_anchors),
+        [title for title, _, _ in songs],
+    )
+    postings = int(sum(len(h) for h in hashes))
+    return index, {
+        "bins": bins,
+        "cpu_sec": round(cpu, 2),
+        "x_realtime": round(audio_sec / cpu, 1) if cpu else None,
+        "peaks_per_sec": round(n_peaks / audio_sec, 1),
+        "postings": postings,
+        "postings_per_sec": round(postings / audio_sec, 1),
+        "index_mb": round(index.memory_report()["bytes"] / 2**20, 2),
+    }
+
+
+def evaluate(clips, index, frontend):
+    correct = 0
+    cpu = []
+    for expected, y, sr in clips:
+        h, t, _, sec = fingerprint_cpu(y, sr, frontend)
+        song_id, _, _ = vote_on_postings(h, t, index.fetch_postings(np.unique(h)))
+        cpu.append(sec * 1000)
+        if expected == "unknown":
+            correct += song_id is None
+        else:
+            correct += (song_id or "").lower() == expected.lower()
+    return {
+        "clips": len(clips),
+        "accuracy": round(correct / len(clips), 4) if clips else None,
+        "query_cpu_ms": round(float(np.mean(cpu)), 2) if cpu else None,
+    }
+
+
+if __name__ == "__main__":
+    # usage: python scripts/eval_frontends.py [--catalog DIR] [--eval DIR] [--frontends stft mel]
+    parser = argparse.ArgumentParser(description="Compare spectrogram front-ends on the evaluation clips.")
+    parser.add_argument("--catalog", type=Path, default=CATALOG_DIR)
+    parser.add_argument("--eval", type=Path, default=EVAL_DIR)
+    parser.add_argument("--frontends", nargs="+", choices=FRONTEND_NAMES, default=FRONTEND_NAMES)
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    # decode once, every front-end starts from the same samples
+    songs = [(p.stem, *load_audio(str(p), sr=SAMPLE_RATE)) for p in audio_files(args.catalog)]
+    clips = [
+        (folder.name, *load_audio(str(p), sr=SAMPLE_RATE))
+        for folder in sorted(d for d in args.eval.iterdir() if d.is_dir())
+        for p in audio_files(folder)
+    ]
+    print(f"{len(songs)} catalog songs, {len(clips)} evaluation clips\n", flush=True)
+
+    results = {}
+    for frontend in args.frontends:
+        index, indexing = build_index(songs, frontend)
+        results[frontend] = {**indexing, **evaluate(clips, index, frontend)}
+
+    print(
+        f"{'front-end':>9} | {'bins':>5} | {'index cpu s':>11} | {'x rt':>6} | {'peaks/s':>7} | "
+        f"{'postings':>9} | {'index MB':>8} | {'query ms':>8} | {'accuracy':>8}"
+    )
+    for frontend, r in results.items():
+        print(
+            f"{frontend:>9} | {r['bins']:5d} | {r['cpu_sec']:11.2f} | {r['x_realtime']:6.1f} | "
+            f"{r['peaks_per_sec']:7.1f} | {r['postings']:9d} | {r['index_mb']:8.2f} | "
+            f"{r['query_cpu_ms'] or 0:8.2f} | {r['accuracy'] or 0:8.2%}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+PORT = 8081
+# every Nth request fails with a 503 to exercise the retry path (0 = never)
+FAIL_EVERY = 3
+
+
+def fake_search(query):
+    # same shape as the spotify23 /search/ response parse_spotify_results reads
+    # stable across runs and processes, unlike the salted built-in hash()
+    track_id = "stub" + hashlib.sha1(query.encode()).hexdigest()[:8]
+    return {"tracks": {"items": [{"data": {
+        "id": track_id,
+        "name": query.title(),
+        "duration": {"totalMilliseconds": 180000},
+        "playability": {"playable": True},
+        "contentRating": {"label": "NONE"},
+        "albumOfTrack": {
+            "name": "Stub Album",
+            "id": "stubalbum",
+            "coverArt": {"sources": [{"url": "http://127.0.0.1/cover.jpg", "width": 640}]},
+        },
+        "artists": {"items": [{"profile": {"name": "Stub Artist"}}]},
+    }}]}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests_seen = 0
+
+    def do_GET(self):
+        StubHandler.requests_seen += 1
+        url = urlparse(self.path)
+
+        if FAIL_EVERY and StubHandler.requests_seen % FAIL_EVERY == 0:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if url.path.rstrip("/") != "/search":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        query = parse_qs(url.query).get("q", [""])[0]
+        body = json.dumps(fake_search(query)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    # usage: python scripts/spotify_stub.py [port]
+    # then run the service with SPOTIFY_API_URL=http://127.0.0.1:<port>
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    print(f"Spotify stub on http://127.0.0.1:{port}", flush=True)
+    HTTPServer(("127.0.0.1", port), StubHandler).serve_forever()
@@ -0,0 +1,330 @@
+"""
+Fingerprint store partitioned by hash range.
+
+Shard i holds every posting whose packed hash h satisfies
+boundaries[i - 1] <= h < boundaries[i]. A shard is anything with a
+fetch_postings(hashes) method in match_from_db.fetch_postings form: a Mongo
+collection (MongoShard, one per collection "<source>_<i>", e.g.
+"fingerprints_0", possibly on different servers) or an in-memory InvertedIndex. A query is split by
+shard, the per-shard lookups run concurrently and the results are merged
+before voting.
+
+The packed layout puts f1 in the top bits and most energy sits at low
+frequencies, so equal-width ranges would be badly unbalanced; boundaries
+are taken from hash quantiles instead and stored in the shard_meta
+collection under the source collection's name, so every index
+(FINGERPRINTS_COLLECTION) has its own shards. Split the existing
+collection once with:
+
+    python sharding.py --split 4
+
+and start the service with FINGERPRINT_SHARDS=4.
+
+The unsharded collection stays the source of truth: the service writes
+uploads to it as well as to their shard, and a re-split rebuilds every
+shard from it. Songs added by bulk_index.py only reach the shards on the
+next --split.
+
+A re-split builds the new shards under temporary names and renames them
+over the old ones at the end, so a running service keeps reading complete
+shards while the copy runs. Restart it afterwards: it keeps the boundaries
+it loaded at startup, and uploads made during the copy may only be in the
+source until the next --split.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from match_from_db import fetch_from_collection
+
+
+def shard_name(i, source_name):
+    return f"{source_name}_{i}"
+
+
+def _building_name(i, source_name):
+    return f"{shard_name(i, source_name)}_building"
+
+
+def balanced_boundaries(sample_hashes, n_shards):
+    """
+    Split points that put about the same number of sample postings in
+    each shard.
+
+    A hash that dominates the sample can land on several cut points; those
+    are nudged up so every shard gets its own range, even if some of them
+    end up nearly empty.
+
+    Returns:
+        np.ndarray (uint32): exactly n_shards - 1 strictly increasing boundaries
+    """
+
+    sample = np.sort(np.asarray(sample_hashes, dtype=np.uint32))
+    if len(sample) == 0:
+        # nothing to balance on, fall back to equal-width ranges
+        return (np.arange(1, n_shards, dtype=np.uint64) * 2**32 // n_shards).astype(np.uint32)
+
+    cut = sample[(np.arange(1, n_shards) * len(sample)) // n_shards].astype(np.int64)
+    # strictly increasing: cut[i] >= cut[i - 1] + 1
+    steps = np.arange(len(cut))
+    cut = np.maximum.accumulate(np.maximum(cut, 1) - steps) + steps
+    if len(cut) and cut[-1] >= 2**32:
+        raise ValueError(f"cannot place {n_shards - 1} distinct boundaries above the sampled hashes")
+    return cut.astype(np.uint32)
+
+
+class MongoShard:
+    """One fingerprints collection acting as a shard."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def fetch_postings(self, hashes):
+        return fetch_from_collection(self.collection, hashes)
+
+    def insert_many(self, docs):
+        self.collection.insert_many(docs)
+
+
+def _merge(parts):
+    # concatenate per-shard results, remapping song_idx onto one song_ids table
+    song_ids, seen = [], {}
+    hashes, song_idx, t_anchor = [], [], []
+
+    for matched, idx, t_db, shard_song_ids in parts:
+        remap = np.empty(len(shard_song_ids), dtype=np.int64)
+        for i, song_id in enumerate(shard_song_ids):
+            g = seen.get(song_id)
+            if g is None:
+                g = seen[song_id] = len(song_ids)
+                song_ids.append(song_id)
+            remap[i] = g
+        hashes.append(np.asarray(matched, dtype=np.uint32))
+        song_idx.append(remap[np.asarray(idx, dtype=np.int64)])
+        t_anchor.append(np.asarray(t_db, dtype=np.float64))
+
+    if not parts:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64), np.empty(0), []
+
+    return np.concatenate(hashes), np.concatenate(song_idx), np.concatenate(t_anchor), song_ids
+
+
+class ShardedStore:
+    """
+    Scatter-gather lookups over hash-range shards.
+
+    Quacks like an InvertedIndex for match_from_db (fetch_postings,
+    add_song) and like a collection for index_to_db (insert_many), so it
+    can be passed wherever either is expected.
+
+    `shards` serve lookups and `writers` (default: the shards themselves)
+    take insert_many. With in-memory shards the writers are the shard
+    collections, and the in-memory copies are updated through add_song.
+    When `source` is given, insert_many writes there first so the
+    unsharded collection keeps every song.
+    """
+
+    def __init__(self, shards, boundaries, max_workers=None, writers=None, source=None):
+        if len(boundaries) != len(shards) - 1:
+            raise ValueError(f"{len(shards)} shards need {len(shards) - 1} boundaries")
+
+        self.shards = list(shards)
+        self.writers = list(writers) if writers is not None else self.shards
+        self.source = source
+        self.boundaries = np.asarray(boundaries, dtype=np.uint32)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards))
+
+    def __len__(self):
+        return len(self.shards)
+
+    @classmethod
+    def from_db(cls, source, n_shards, in_memory=False):
+        """
+        Open the shard collections written by `python sharding.py --split`
+        for the `source` fingerprints collection.
+
+        Parameters:
+            source: the unsharded collection; names the shards and is
+                also written by insert_many
+            in_memory (bool): load each shard into an InvertedIndex instead
+                of querying Mongo
+
+        Raises:
+            RuntimeError: if the collection has not been split into n_shards
+        """
+
+        db = source.database
+        meta = db.shard_meta.find_one({"_id": source.name})
+        if meta is None or len(meta["boundaries"]) != n_shards - 1:
+            raise RuntimeError(
+                f"{source.name} is not split into {n_shards} shards, "
+                f"run `python sharding.py --split {n_shards}` first"
+            )
+
+        collections = [db[shard_name(i, source.name)] for i in range(n_shards)]
+        writers = [MongoShard(c) for c in collections]
+        if in_memory:
+            from inverted_index import InvertedIndex
+            shards = [InvertedIndex.from_collection(c) for c in collections]
+        else:
+            shards = writers
+
+        return cls(shards, meta["boundaries"], writers=writers, source=source)
+
+    def shard_of(self, hashes):
+        """
+        Returns:
+            np.ndarray (int): shard number per hash
+        """
+
+        return np.searchsorted(self.boundaries, np.asarray(hashes, dtype=np.uint32), side="right")
+
+    def fetch_postings(self, hashes):
+        """
+        Split the query by shard, look the parts up concurrently and merge.
+
+        Returns:
+            tuple: (hashes, song_idx, t_anchor, song_ids), see
+                match_from_db.fetch_postings
+        """
+
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        owner = self.shard_of(hashes)
+
+        futures = [
+            self._pool.submit(shard.fetch_postings, hashes[owner == i])
+            for i, shard in enumerate(self.shards)
+            if (owner == i).any()
+        ]
+        return _merge([f.result() for f in futures])
+
+    def insert_many(self, docs):
+        """
+        Write fingerprint documents to the source collection, if any, and
+        route them to their shards' collections.
+        """
+
+        if self.source is not None:
+            # insert_many sets _id on each doc; the shards reuse it
+            self.source.insert_many(docs)
+
+        parts = [[] for _ in self.writers]
+        for doc, i in zip(docs, self.shard_of([d["hash"] for d in docs]).tolist()):
+            parts[i].append(doc)
+
+        for writer, part in zip(self.writers, parts):
+            if part:
+                writer.insert_many(part)
+
+    def add_song(self, song_id, hashes, t_anchors):
+        """
+        Add a song to in-memory shards (see InvertedIndex.add_song).
+        """
+
+        owner = self.shard_of(hashes)
+        for i, shard in enumerate(self.shards):
+            mask = owner == i
+            if mask.any() and hasattr(shard, "add_song"):
+                shard.add_song(song_id, hashes[mask], t_anchors[mask])
+
+    def memory_report(self):
+        return [shard.memory_report() for shard in self.shards if hasattr(shard, "memory_report")]
+
+
+def _songs_missing_from(db, source, n_shards):
+    # song_ids in any existing shard collection but not in source
+    def song_ids(collection):
+        return {d["_id"] for d in collection.aggregate([{"$group": {"_id": "$song_id"}}])}
+
+    meta = db.shard_meta.find_one({"_id": source.name})
+    n_existing = len(meta["boundaries"]) + 1 if meta else n_shards
+    in_shards = set()
+    for i in range(max(n_existing, n_shards)):
+        in_shards |= song_ids(db[shard_name(i, source.name)])
+    if not in_shards:
+        return set()
+    return in_shards - song_ids(source)
+
+
+def split_collection(db, source, n_shards, sample_size=1_000_000, batch_size=10_000):
+    """
+    Copy `source` into n_shards hash-range collections named after it.
+
+    Boundaries come from a random sample of the source's hashes. The shards
+    are built under temporary names and then renamed over the existing
+    ones, which stay readable until then; shards left over from a split
+    into more collections are dropped last.
+
+    Returns:
+        np.ndarray: the boundaries used
+
+    Raises:
+        RuntimeError: if the existing shards hold songs the source lacks
+            (uploads that only reached the shards), dropping them would
+            lose those songs
+    """
+
+    missing = _songs_missing_from(db, source, n_shards)
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} songs are only in the shard collections (e.g. {sorted(missing)[:5]}), "
+            f"copy them back into {source.name} before re-splitting"
+        )
+
+    sample = [d["hash"] for d in source.aggregate([
+        {"$sample": {"size": sample_size}}, {"$project": {"hash": 1, "_id": 0}},
+    ])]
+    boundaries = balanced_boundaries(sample, n_shards)
+
+    meta = db.shard_meta.find_one({"_id": source.name})
+    n_existing = len(meta["boundaries"]) + 1 if meta else 0
+
+    # leftovers of an interrupted split
+    building = [_building_name(i, source.name) for i in range(n_shards)]
+    for name in building:
+        db[name].drop()
+
+    store = ShardedStore([MongoShard(db[name]) for name in building], boundaries)
+
+    batch, copied = [], 0
+    for doc in source.find({}, {"hash": 1, "song_id": 1, "t_anchor": 1, "_id": 0}):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            store.insert_many(batch)
+            copied += len(batch)
+            batch = []
+            print(f"copied {copied} documents", flush=True)
+    if batch:
+        store.insert_many(batch)
+
+    for i, name in enumerate(building):
+        db[name].create_index("hash")
+        db[name].rename(shard_name(i, source.name), dropTarget=True)
+
+    db.shard_meta.replace_one(
+        {"_id": source.name},
+        {"_id": source.name, "boundaries": boundaries.tolist()},
+        upsert=True,
+    )
+
+    for i in range(n_shards, n_existing):
+        db[shard_name(i, source.name)].drop()
+
+    return boundaries
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import db, fingerprints_col
+
+    parser = argparse.ArgumentParser(description="hash-range sharding of the fingerprints collection")
+    parser.add_argument("--split", type=int, required=True, metavar="N", help="number of shards")
+    parser.add_argument("--sample-size", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    boundaries = split_collection(db, fingerprints_col, args.split, args.sample_size)
+    print(f"split into {len(boundaries) + 1} shards, boundaries {boundaries.tolist()}")
+    for i in range(len(boundaries) + 1):
+        name = shard_name(i, fingerprints_col.name)
+        print(name, db[name].estimated_document_count())
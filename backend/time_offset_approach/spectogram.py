@@ -1,15 +1,40 @@
+import logging
+
 import librosa
 import numpy as np
 
-# Load one audio file
-def plot_spectogram(audio_path): 
-    y, sr = librosa.load(audio_path, mono=True)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 22050
+
+
+def load_audio(audio_path, sr=SAMPLE_RATE):
+    """
+    Decode an audio file to mono float32 samples at `sr`.
+
+    Returns:
+        tuple: (y, sr)
+    """
 
-    print("Duration (sec):", len(y) / sr)
-    print("Sample rate:", sr)
+    return librosa.load(audio_path, sr=sr, mono=True)
+
+
+def compute_spectogram(y, sr, n_fft=2048, hop_length=512):
+    """
+    Samples -> dB-scaled magnitude spectrogram (freq x time).
+
+    Parameters:
+        y (np.ndarray): mono samples
+        sr (int): sample rate of y
+        n_fft (int): FFT window size
+        hop_length (int): hop length for the STFT
+
+    Returns:
+        tuple: (S_db, sr)
+    """
 
     # Compute spectrogram
-    S = np.abs(librosa.stft(y))  #returns the 2d array. (freqxtime)
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))  #returns the 2d array. (freqxtime)
 
     #converted into the db
     S_db = librosa.amplitude_to_db(S, ref=np.max)
@@ -25,6 +50,51 @@ def plot_spectogram(audio_path):
     return S_db, sr
 
 
+def compute_mel_spectogram(y, sr, n_bins=96, fmin=300.0, fmax=5000.0, n_fft=2048, hop_length=512):
+    """
+    Samples -> dB-scaled mel spectrogram limited to [fmin, fmax] (band x time).
+
+    Same frames as compute_spectogram, but n_bins mel bands instead of
+    n_fft // 2 + 1 linear bins, dropping the low rumble and the noisy top
+    octaves.
+
+    Returns:
+        tuple: (S_db, sr)
+    """
+
+    M = librosa.feature.melspectrogram(
+        y=y, sr=sr, n_fft=n_fft, hop_length=hop_length,
+        n_mels=n_bins, fmin=fmin, fmax=fmax, power=2.0,
+    )
+    return librosa.power_to_db(M, ref=np.max), sr
+
+
+def compute_cqt_spectogram(y, sr, n_bins=48, bins_per_octave=12, fmin=300.0, hop_length=512):
+    """
+    Samples -> dB-scaled constant-Q spectrogram from fmin up
+    (n_bins / bins_per_octave octaves, bin x time).
+
+    Returns:
+        tuple: (S_db, sr)
+    """
+
+    C = np.abs(librosa.cqt(
+        y, sr=sr, hop_length=hop_length, fmin=fmin,
+        n_bins=n_bins, bins_per_octave=bins_per_octave,
+    ))
+    return librosa.amplitude_to_db(C, ref=np.max), sr
+
+
+# Load one audio file
+def plot_spectogram(audio_path): 
+    y, sr = load_audio(audio_path)
+
+    logger.debug("Duration (sec): %s", len(y) / sr)
+    logger.debug("Sample rate: %s", sr)
+
+    return compute_spectogram(y, sr)
+
+
 if __name__ == "__main__":
     y, sr = plot_spectogram("../chromaprint approach/evaluation/Killa Klassic/concertKillaKlassic.mp3")
     print(y)
@@ -1,18 +1,59 @@
+import logging
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 
 if not RAPIDAPI_KEY:
     raise RuntimeError("RAPIDAPI_KEY is not set")
 
+# point at a local stub server for testing, e.g. http://127.0.0.1:8081
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://spotify23.p.rapidapi.com")
+
+# (connect, read) seconds
+TIMEOUT = (3.05, float(os.getenv("SPOTIFY_TIMEOUT", "10")))
+
+
+def make_session(retries=3, backoff=0.5, pool_size=10):
+    """
+    requests.Session with a connection pool and bounded retries on
+    connection errors, 429 and 5xx (honouring Retry-After).
+    """
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "x-rapidapi-key": RAPIDAPI_KEY,
+        "x-rapidapi-host": "spotify23.p.rapidapi.com"
+    })
+    return session
+
+
+# shared by every request (and thread) of the process
+session = make_session()
+
 
 def search_spotify(query, type="tracks", limit=1):
-    url = "https://spotify23.p.rapidapi.com/search/"
+    url = f"{SPOTIFY_API_URL}/search/"
     
     querystring = {
         "q": query,
@@ -22,23 +63,25 @@ def search_spotify(query, type="tracks", limit=1):
         "numberOfTopResults": "1"
     }
     
-    headers = {
-        "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": "spotify23.p.rapidapi.com"
-    }
-    
-    response = requests.get(url, headers=headers, params=querystring)
+    try:
+        response = session.get(url, params=querystring, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning("Spotify search failed: %s", e)
+        return None
     
     if response.status_code == 200:
         data = response.json()
         return data
     else:
-        print(f"Error: {response.status_code} - {response.text}")
+        logger.warning("Spotify search returned %s: %s", response.status_code, response.text)
         return None
 
 def parse_spotify_results(results):
     """Extract song title, artists, album, duration, cover art from API response"""
 
+    if not results:
+        return []
+
     tracks = results.get('tracks', {}).get('items', [])
     songs = []
     
@@ -0,0 +1,271 @@
+import numpy as np
+from inverted_index import gather_ranges
+
+OFFSET_ROUND = 2
+# songs kept by the raw hit-count stage before offset voting (None = all).
+# Off until scripts/eval_candidates.py has measured recall and latency on
+# the production catalog; enable with CANDIDATE_K=<k>.
+CANDIDATE_K = None
+
+
+def round_bins(x, ndigits):
+    """
+    Integer k such that k / 10**ndigits == round(x, ndigits), elementwise.
+
+    np.rint(x * 100) agrees with Python's round() except when x * 100 lands
+    within rounding error of a .5 boundary; those few values are redone with
+    round() itself so the bins match the scalar code exactly.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    scaled = x * scale
+    bins = np.rint(scaled).astype(np.int64)
+
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        bins[near_half] = [round(round(v, ndigits) * scale) for v in x[near_half].tolist()]
+
+    return bins
+
+
+def _pair_offsets(query_hashes, query_times, db_hashes, db_times, ndigits):
+    """
+    Offset bin for every (posting, distinct query time) pair sharing a hash.
+
+    Returns:
+        tuple: (posting, offset_bins) parallel arrays, posting indexes the
+            db_* inputs
+    """
+
+    # 1. deduplicate (hash, rounded query time) pairs, sorted by hash
+    scale = 10.0 ** ndigits
+    q_bins = round_bins(query_times, ndigits)
+    pair_keys = np.unique(
+        (np.asarray(query_hashes, dtype=np.uint64) << np.uint64(32))
+        | q_bins.astype(np.uint64)
+    )
+    q_hash = pair_keys >> np.uint64(32)
+    q_time = (pair_keys & np.uint64(0xFFFFFFFF)).astype(np.int64) / scale
+    uniq_hash, hash_start, hash_count = np.unique(
+        q_hash, return_index=True, return_counts=True
+    )
+
+    # 2. pair every posting with every query time that shares its hash
+    db_hashes = np.asarray(db_hashes, dtype=np.uint64)
+    pos = np.minimum(np.searchsorted(uniq_hash, db_hashes), len(uniq_hash) - 1)
+    in_query = uniq_hash[pos] == db_hashes
+    lo = np.where(in_query, hash_start[pos], 0)
+    hi = lo + np.where(in_query, hash_count[pos], 0)
+    pair_idx, posting = gather_ranges(lo, hi)
+
+    offset_bins = round_bins(q_time[pair_idx] - np.asarray(db_times)[posting], ndigits)
+    return posting, offset_bins
+
+
+def offset_histogram(query_hashes, query_times, db_hashes, db_song_idx, db_times, ndigits=2):
+    """
+    Full (song, offset_bin) vote histogram, for callers that accumulate
+    votes across several queries (see match_from_db.StreamingMatcher).
+
+    Returns:
+        tuple of arrays: (song_idx, offset_bin, count), one entry per
+            non-empty bin. offset_bin / 10**ndigits is the offset in seconds.
+    """
+
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    if len(db_hashes) == 0 or len(query_hashes) == 0:
+        return empty
+
+    posting, offset_bins = _pair_offsets(query_hashes, query_times, db_hashes, db_times, ndigits)
+    if len(posting) == 0:
+        return empty
+
+    pair_song = np.asarray(db_song_idx, dtype=np.int64)[posting]
+    min_bin = offset_bins.min()
+    span = int(offset_bins.max() - min_bin) + 1
+    keys, counts = np.unique(pair_song * span + (offset_bins - min_bin), return_counts=True)
+    return keys // span, keys % span + min_bin, counts
+
+
+def vote_offsets(query_hashes, query_times, db_hashes, db_song_idx, db_times, ndigits=2):
+    """
+    Time-offset histogram voting over matched postings.
+
+    Equivalent to the scalar loop
+
+        for each posting (h, song, t_db):
+            for t_q in {round(t, ndigits) for query landmarks with hash h}:
+                votes[song][round(t_q - t_db, ndigits)] += 1
+
+    but done on integer arrays: every (posting, query time) pair becomes a
+    (song, offset_bin) key and the keys are counted with one sort.
+
+    Parameters:
+        query_hashes (array): packed hash per query landmark
+        query_times (array): anchor time per query landmark (seconds)
+        db_hashes (array): hash per matched posting
+        db_song_idx (array): song index per matched posting
+        db_times (array): anchor time per matched posting (seconds)
+        ndigits (int): offset rounding, same as round()
+
+    Returns:
+        tuple of arrays, one entry per song with at least one vote, in
+        order of the song's first voting posting:
+            (song_idx, best_votes, best_offset)
+        best_offset is the smallest offset among the song's top bins.
+    """
+
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+    if len(db_hashes) == 0 or len(query_hashes) == 0:
+        return empty
+
+    scale = 10.0 ** ndigits
+
+    # 1-2. offset bin per (posting, query time) pair
+    posting, offset_bins = _pair_offsets(query_hashes, query_times, db_hashes, db_times, ndigits)
+    if len(posting) == 0:
+        return empty
+
+    # first voting posting of each song, used as tie-break order
+    pair_song = np.asarray(db_song_idx, dtype=np.int64)[posting]
+    first_seen = np.full(int(pair_song.max()) + 1, len(db_hashes))
+    np.minimum.at(first_seen, pair_song, posting)
+
+    # 3. histogram of (song, offset_bin) keys, sorted by song then offset
+    min_bin = offset_bins.min()
+    span = int(offset_bins.max() - min_bin) + 1
+    keys, counts = np.unique(
+        pair_song * span + (offset_bins - min_bin), return_counts=True
+    )
+    key_song = keys // span
+
+    # 4. per-song peak; the first maximum in a segment is the smallest offset
+    seg_start = np.flatnonzero(np.r_[True, key_song[1:] != key_song[:-1]])
+    seg_max = np.maximum.reduceat(counts, seg_start)
+    seg_id = np.repeat(np.arange(len(seg_start)), np.diff(np.r_[seg_start, len(keys)]))
+
+    peaks = np.flatnonzero(counts == seg_max[seg_id])
+    heads = peaks[np.r_[True, seg_id[peaks][1:] != seg_id[peaks][:-1]]]
+
+    songs = key_song[heads]
+    appearance = np.argsort(first_seen[songs], kind="stable")
+    heads = heads[appearance]
+
+    best_offset = (keys[heads] % span + min_bin) / scale
+    return songs[appearance], counts[heads], best_offset
+
+
+def shortlist(db_song_idx, k):
+    """
+    Cheap first stage: keep the postings of the k songs with the most raw
+    hash hits, so offset voting only runs on likely candidates.
+
+    A song's best offset bin can hold at most as many votes as it has
+    hits (times the few query times sharing a hash), so songs outside the
+    top k by hits rarely win the full vote.
+
+    Parameters:
+        db_song_idx (array): song index per matched posting
+        k (int | None): shortlist size, None keeps every song
+
+    Returns:
+        np.ndarray (bool): mask of postings whose song made the shortlist
+    """
+
+    db_song_idx = np.asarray(db_song_idx, dtype=np.int64)
+    if k is None or len(db_song_idx) == 0:
+        return np.ones(len(db_song_idx), dtype=bool)
+
+    hits = np.bincount(db_song_idx)
+    if np.count_nonzero(hits) <= k:
+        return np.ones(len(db_song_idx), dtype=bool)
+
+    top = np.argpartition(hits, len(hits) - k)[-k:]
+    keep_song = np.zeros(len(hits), dtype=bool)
+    keep_song[top] = True
+    return keep_song[db_song_idx]
+
+
+def pick_best(votes):
+    """
+    Best and runner-up in one pass over per-song vote counts.
+
+    Ties go to the earlier entry, so with vote_offsets output the song that
+    appeared first wins, like the original dict iteration.
+
+    Returns:
+        tuple: (best position or None, best_votes, second_best_votes)
+    """
+
+    if len(votes) == 0:
+        return None, 0, 0
+
+    best = int(np.argmax(votes))
+    if len(votes) == 1:
+        return best, int(votes[best]), 0
+
+    top_two = np.partition(votes, len(votes) - 2)[-2:]
+    return best, int(votes[best]), int(top_two[0])
+
+
+def vote_on_postings(
+    query_hashes,
+    query_times,
+    postings,
+    min_vote_threshold=100,
+    ratio_threshold=2.5,
+    candidate_k=CANDIDATE_K,
+    with_offset=False,
+):
+    """
+    Shortlist, vote and decide on postings already fetched for the query.
+
+    Postings for hashes the query does not contain are ignored, so a
+    lookup shared by several queries can be passed as-is.
+
+    Returns:
+        tuple: (song_id or None, best_votes, status), plus best_offset
+            when with_offset is set: query time minus song time in
+            seconds for the matched song (where in the song the query
+            starts is -best_offset), None if nothing matched
+    """
+
+    db_hashes, db_song_idx, db_times, song_ids = postings
+
+    # 2. Shortlist the top candidate_k songs by raw hash hits
+    keep = shortlist(db_song_idx, candidate_k)
+    db_hashes, db_song_idx, db_times = db_hashes[keep], db_song_idx[keep], db_times[keep]
+
+    # 3. Offset-histogram voting, best offset per candidate song
+    songs, votes, offsets = vote_offsets(
+        query_hashes, query_times,
+        db_hashes, db_song_idx, db_times,
+        ndigits=OFFSET_ROUND,
+    )
+
+    # decide best song
+    best, best_votes, second_best_votes = pick_best(votes)
+    best_id = song_ids[songs[best]] if best is not None else None
+
+    result = decide(best_id, best_votes, second_best_votes, min_vote_threshold, ratio_threshold)
+    if with_offset:
+        best_offset = float(offsets[best]) if result[0] is not None else None
+        return (*result, best_offset)
+    return result
+
+
+def decide(best_id, best_votes, second_best_votes, min_vote_threshold, ratio_threshold):
+    """
+    Apply the ratio and minimum-vote criteria to the top two candidates.
+
+    Returns:
+        tuple: (song_id or None, best_votes, status)
+    """
+
+    if second_best_votes > 0 and best_votes/second_best_votes < ratio_threshold:
+        return None, best_votes, "Song Not in DB"
+
+    if best_votes < min_vote_threshold:
+        return None , best_votes, "LOW CONFIDENCE"
+    return best_id, best_votes, "MATCHED!"